@@ -1,188 +1,169 @@
-from http.server import BaseHTTPRequestHandler
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 import json
-import requests
-import time
 import os
-from urllib.parse import urlparse, parse_qs
+import signal
+import sys
+import threading
+import time
+from urllib.parse import urlparse, parse_qsl
+
+# Shared modules live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ebird
+import handlers
+import logs
+import metrics
+from payload import Payload
 
-# Cache for eBird taxonomy data
-TAXONOMY_CACHE = {}
-TAXONOMY_CACHE_TIMESTAMP = 0
-CACHE_DURATION = 3600  # Cache for 1 hour
+log = logs.get_logger("api.app")
 
 # eBird API configuration
-EBIRD_API_KEY = os.environ.get('EBIRD_API_KEY')
-EBIRD_BASE = "https://api.ebird.org/v2"
-UA = "FlycatcherApp/1.0 (+https://example.local)"
+EBIRD_API_KEY = handlers.EBIRD_API_KEY
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type',
+}
+
+
+def route_label(path, status=200):
+    """Metrics label for a request path, folding /api/species/<code> into one series"""
+    if status == 404:
+        return 'unmatched'
+    if path.startswith('/api/species/') and path != '/api/species/search':
+        return '/api/species/<species_code>'
+    return path
+
 
 class VercelHandler(BaseHTTPRequestHandler):
+    """Local server for the API, answering through the same handlers.py
+    routes as the Vercel functions and the Flask app
+
+    Speaks HTTP/1.1: every reply is framed by Content-Length, or chunked
+    for streams, so clients can keep the connection open between requests.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Seconds an idle keep-alive connection may hold its thread
+    timeout = 30
+    # Headers and body are separate writes; with Nagle on, a kept-alive
+    # connection stalls ~40 ms on the client's delayed ACK between them
+    disable_nagle_algorithm = True
+
     def do_GET(self):
+        self.respond('GET')
+
+    def do_POST(self):
+        self.respond('POST')
+
+    def respond(self, method):
         parsed_url = urlparse(self.path)
         path = parsed_url.path
-        query_params = parse_qs(parsed_url.query)
-        
-        # Set CORS headers
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
-        
+        start = time.perf_counter()
+
+        if method == 'GET' and path == '/api/metrics':
+            return self.send_metrics()
+
+        args = dict(parse_qsl(parsed_url.query))
+        body = None
+        if method == 'POST':
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
         try:
-            if path == '/api/config':
-                response = self.handle_config()
-            elif path == '/api/observations':
-                response = self.handle_observations(query_params)
-            elif path.startswith('/api/species/'):
-                species_code = path.split('/')[-1]
-                response = self.handle_species_info(species_code)
-            else:
-                response = {"error": "Endpoint not found"}
-                self.send_response(404)
-            
-            self.wfile.write(json.dumps(response).encode())
-            
+            reply = handlers.route(method, path, args, self.headers.get('Accept'), body)
         except Exception as e:
-            error_response = {"error": str(e)}
-            self.wfile.write(json.dumps(error_response).encode())
-    
+            reply = (500, {"error": str(e)}, None)
+        if reply is None:
+            reply = (404, {"error": "Endpoint not found"}, None)
+
+        status, body, headers = reply
+        headers = {**CORS_HEADERS, **(headers or {})}
+        if isinstance(body, Payload):
+            # ETag / If-None-Match and Accept-Encoding negotiation
+            status, payload_headers, data = body.respond(
+                self.headers.get('If-None-Match'), self.headers.get('Accept-Encoding'))
+            headers.update(payload_headers)
+        elif isinstance(body, dict):
+            data = json.dumps(body).encode()
+        else:
+            self.send_stream(status, headers, body)
+            metrics.observe_request(route_label(path, status), method, status, time.perf_counter() - start)
+            return
+
+        self.send_response(status)
+        headers.setdefault('Content-type', 'application/json')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        metrics.observe_request(route_label(path, status), method, status, time.perf_counter() - start, len(data))
+
+    def send_stream(self, status, headers, chunks):
+        """Write a streamed reply (NDJSON) with chunked transfer encoding"""
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        try:
+            for chunk in chunks:
+                if chunk:
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+                    self.wfile.flush()
+        except Exception:
+            # Without the terminating chunk the client sees a cut-off body
+            self.close_connection = True
+            raise
+        self.wfile.write(b'0\r\n\r\n')
+
+    def send_metrics(self):
+        """Request, upstream and cache metrics in the Prometheus text format"""
+        data = metrics.render().encode()
+        self.send_response(200)
+        self.send_header('Content-type', metrics.CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
     def do_OPTIONS(self):
         # Handle preflight requests
         self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+        for name, value in CORS_HEADERS.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', '0')
         self.end_headers()
-    
-    def handle_config(self):
-        """Return configuration for the frontend"""
-        return {
-            "google_maps_api_key": os.environ.get('GOOGLE_MAPS_API_KEY', ''),
-            "map_default_lat": -22.9576,
-            "map_default_lng": 18.4904,
-            "map_default_zoom": 6
-        }
-    
-    def handle_observations(self, query_params):
-        """Handle eBird observations request"""
-        if not EBIRD_API_KEY:
-            return {"error": "Server missing EBIRD_API_KEY"}
-        
-        region = query_params.get('region', ['ZA'])[0]
-        back = query_params.get('back', ['7'])[0]
-        max_results = query_params.get('maxResults', ['1000'])[0]
-        
-        url = f"{EBIRD_BASE}/data/obs/{region}/recent"
-        params = {
-            'back': back,
-            'maxResults': max_results
-        }
-        headers = {
-            "X-eBirdApiToken": EBIRD_API_KEY,
-            "User-Agent": UA,
-        }
-        
-        try:
-            r = requests.get(url, params=params, headers=headers, timeout=20)
-            if r.status_code == 200:
-                data = r.json()
-                normalized = []
-                for item in data:
-                    species_code = item.get("speciesCode")
-                    normalized.append({
-                        "species_code": species_code,
-                        "common_name": item.get("comName"),
-                        "scientific_name": item.get("sciName"),
-                        "observation_date": item.get("obsDt"),
-                        "latitude": item.get("lat"),
-                        "longitude": item.get("lng"),
-                        "count": item.get("howMany"),
-                        "location_name": item.get("locName"),
-                    })
-                return {"observations": normalized}
-            else:
-                return {"error": f"eBird API error: {r.status_code}"}
-        except requests.RequestException as e:
-            return {"error": "Network error contacting eBird", "detail": str(e)}
-    
-    def handle_species_info(self, species_code):
-        """Get detailed information about a specific bird species from eBird"""
-        if not EBIRD_API_KEY:
-            return {"error": "Server missing EBIRD_API_KEY"}
-        
-        global TAXONOMY_CACHE, TAXONOMY_CACHE_TIMESTAMP
-        
-        # Check if we need to refresh the cache
-        current_time = time.time()
-        
-        if (current_time - TAXONOMY_CACHE_TIMESTAMP > CACHE_DURATION or
-            not TAXONOMY_CACHE or species_code not in TAXONOMY_CACHE):
-            
-            # Fetch taxonomy data from eBird
-            url = f"{EBIRD_BASE}/ref/taxonomy/ebird"
-            headers = {
-                "X-eBirdApiToken": EBIRD_API_KEY,
-                "Accept": "text/csv",
-                "User-Agent": UA,
-            }
-            
-            try:
-                r = requests.get(url, headers=headers, timeout=20)
-                
-                if r.status_code == 200:
-                    # Parse CSV data and build cache
-                    csv_data = r.text
-                    lines = csv_data.strip().split('\n')
-                    
-                    # Skip header line and build cache
-                    for line in lines[1:]:
-                        if line.strip():
-                            parts = line.split(',')
-                            if len(parts) >= 10:
-                                code = parts[2].strip('"')
-                                com_name = parts[1].strip('"')
-                                order = parts[8].strip('"')
-                                family = parts[9].strip('"')
-                                
-                                TAXONOMY_CACHE[code] = {
-                                    "common_name": com_name,
-                                    "order": order,
-                                    "family": family
-                                }
-                    
-                    TAXONOMY_CACHE_TIMESTAMP = current_time
-                else:
-                    return {"error": f"eBird taxonomy API error: {r.status_code}"}
-                    
-            except requests.RequestException as e:
-                return {"error": "Network error contacting eBird", "detail": str(e)}
-        
-        # Look up species from cache
-        if species_code in TAXONOMY_CACHE:
-            species_data = TAXONOMY_CACHE[species_code]
-            return {
-                "species_code": species_code,
-                "common_name": species_data["common_name"],
-                "family": species_data["family"],
-                "order": species_data["order"]
-            }
-        else:
-            return {
-                "species_code": species_code,
-                "common_name": "Species not found",
-                "family": "Family information not available",
-                "order": "Order information not available",
-                "note": f"Species code '{species_code}' was not found in eBird's taxonomy database."
-            }
+
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+
+def make_server(host='localhost', port=8000):
+    """Threaded server for VercelHandler: one thread per connection"""
+    server = ThreadingHTTPServer((host, port), VercelHandler)
+    server.daemon_threads = True
+    return server
+
+
+def serve(host='localhost', port=8000):
+    """Run the local server until SIGINT or SIGTERM"""
+    server = make_server(host, port)
+    ebird.start_ingestion(EBIRD_API_KEY)
+    signal.signal(signal.SIGTERM, lambda signum, frame: threading.Thread(target=server.shutdown).start())
+    print(f"Server running on http://{host}:{server.server_port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ebird.stop_ingestion()
+        server.server_close()
 
 # Vercel serverless function handler
 def handler(request, context):
-    return VercelHandler().do_GET()
+    return handlers.vercel_handler(request)
 
 # For local testing
 if __name__ == "__main__":
-    from http.server import HTTPServer
-    server = HTTPServer(('localhost', 8000), VercelHandler)
-    print("Server running on http://localhost:8000")
-    server.serve_forever()
+    serve(port=int(os.environ.get('PORT', 8000)))
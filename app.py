@@ -1,23 +1,57 @@
-from flask import Flask, jsonify, request, send_from_directory, session, redirect, url_for
-import requests
+from flask import Flask, jsonify, request, send_from_directory, session, redirect, url_for, stream_with_context, g
 from datetime import datetime
-import time
 import secrets
+import time
 from users import authenticate_user, get_user_by_email
+import ebird
+import handlers
+import metrics
+from payload import Payload
 
-# Load API keys from environment variables
+# API keys come from environment variables (see handlers.py)
 import os
-EBIRD_API_KEY = os.environ.get('EBIRD_API_KEY')
-DEFAULT_REGION = os.environ.get('DEFAULT_REGION', 'ZA')
-GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY', '')
-
-# Cache for eBird taxonomy data
-TAXONOMY_CACHE = {}
-TAXONOMY_CACHE_TIMESTAMP = 0
-CACHE_DURATION = 3600  # Cache for 1 hour
+EBIRD_API_KEY = handlers.EBIRD_API_KEY
 
 app = Flask(__name__)
-app.secret_key = secrets.token_hex(16)  # For session management
+# Sessions must be signed with one key in every worker and across restarts;
+# the random fallback only suits a single development process
+app.secret_key = os.environ.get('SECRET_KEY') or secrets.token_hex(16)
+
+def send_payload(body, headers=None):
+    """Send an encoded Payload: 304 on a matching ETag, compressed if accepted"""
+    status, payload_headers, data = body.respond(
+        request.headers.get('If-None-Match'), request.headers.get('Accept-Encoding'))
+    response = app.response_class(data, status=status, mimetype='application/json')
+    response.headers.update(payload_headers)
+    response.headers.update(headers or {})
+    return response
+
+def send_reply(reply):
+    """Send a (status, body, headers) reply from handlers.py"""
+    status, body, headers = reply
+    if isinstance(body, Payload):
+        return send_payload(body, headers)
+    if isinstance(body, dict):
+        response = jsonify(body)
+        response.status_code = status
+        response.headers.update(headers or {})
+        return response
+    return app.response_class(stream_with_context(body), status=status, headers=headers)
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    """Feed the request latency, status and body size into /api/metrics"""
+    start = g.pop('request_start', None)
+    if start is not None:
+        # Label by URL rule, not path, so /api/species/<code> is one series
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.observe_request(route, request.method, response.status_code,
+                                time.perf_counter() - start, response.content_length)
+    return response
 
 # Serve frontend files
 @app.route('/')
@@ -35,60 +69,39 @@ def serve_static(filename):
 # API configuration endpoint
 @app.route('/api/config')
 def config():
-    return jsonify({
-        "google_maps_api_key": GOOGLE_MAPS_API_KEY,
-        "map_default_lat": -22.9576,
-        "map_default_lng": 18.4904,
-        "map_default_zoom": 6
-    })
-
-# ---- eBird proxy ----
-EBIRD_BASE = "https://api.ebird.org/v2"
-UA = "FlycatcherApp/1.0 (+https://example.local)"
+    return send_reply(handlers.config())
 
+# ---- eBird proxy (see handlers.py) ----
 @app.route("/api/observations")
 def observations():
-    """Proxy eBird observations API"""
-    if not EBIRD_API_KEY:
-        return jsonify({"error": "Server missing EBIRD_API_KEY"}), 500
-    
-    region = request.args.get('region', DEFAULT_REGION)
-    back = request.args.get('back', '7')
-    max_results = request.args.get('maxResults', '1000')
-    
-    url = f"{EBIRD_BASE}/data/obs/{region}/recent"
-    params = {
-        'back': back,
-        'maxResults': max_results
-    }
-    headers = {
-        "X-eBirdApiToken": EBIRD_API_KEY,
-        "User-Agent": UA,
-    }
-    
-    try:
-        r = requests.get(url, params=params, headers=headers, timeout=20)
-        if r.status_code == 200:
-            data = r.json()
-            normalized = []
-            for item in data:
-                species_code = item.get("speciesCode")
-                print(f"DEBUG: Processing species: {item.get('comName')} with code: {species_code}")
-                normalized.append({
-                    "species_code": species_code,
-                    "common_name": item.get("comName"),
-                    "scientific_name": item.get("sciName"),
-                    "observation_date": item.get("obsDt"),
-                    "latitude": item.get("lat"),
-                    "longitude": item.get("lng"),
-                    "count": item.get("howMany"),
-                    "location_name": item.get("locName"),
-                })
-            return jsonify({"observations": normalized})
-        else:
-            return jsonify({"error": f"eBird API error: {r.status_code}"}), 502
-    except requests.RequestException as e:
-        return jsonify({"error": "Network error contacting eBird", "detail": str(e)}), 502
+    """Recent observations for one or several regions, paged, delta or streamed"""
+    return send_reply(handlers.observations(request.args, request.headers.get('Accept')))
+
+@app.route("/api/observations/near")
+def observations_near():
+    """Observations within radius_km of lat/lng, nearest first"""
+    return send_reply(handlers.observations_near(request.args))
+
+@app.route("/api/observations/clusters")
+def observation_clusters():
+    """Marker clusters for the visible map: ?bbox=south,west,north,east&zoom=8"""
+    return send_reply(handlers.observation_clusters(request.args))
+
+@app.route("/api/cache/stats")
+def cache_stats():
+    """Report hit/miss counts for the server-side caches"""
+    return send_reply(handlers.cache_stats())
+
+@app.route("/api/upstream/stats")
+def upstream_stats():
+    """Report call counts and timings for eBird and Google Maps"""
+    return send_reply(handlers.upstream_stats())
+
+@app.route("/api/metrics")
+def metrics_endpoint():
+    """Request, upstream and cache metrics in the Prometheus text format"""
+    return app.response_class(metrics.render(), mimetype=None,
+                              headers={'Content-Type': metrics.CONTENT_TYPE})
 
 # Authentication routes
 @app.route("/api/login", methods=["POST"])
@@ -121,120 +134,30 @@ def get_current_user():
         return jsonify({"success": True, "user": session['user']})
     return jsonify({"success": False, "user": None})
 
+@app.route("/api/species", methods=["GET", "POST"])
+def species_batch():
+    """Look up many species at once: ?codes=a,b,c or a JSON body {"codes": [...]}"""
+    if request.method == "POST":
+        return send_reply(handlers.species_batch(handlers.posted_codes(request.get_data())))
+    return send_reply(handlers.species_batch(request.args.get('codes')))
+
+@app.route("/api/species/search")
+def search_species():
+    """Ranked species-name search: ?q=hoopoe[&limit=20][&region=ZA&back=7]"""
+    return send_reply(handlers.species_search(request.args))
+
 @app.route("/api/species/<species_code>")
 def species_info(species_code):
     """Get detailed information about a specific bird species from eBird"""
-    if not EBIRD_API_KEY:
-        return jsonify({"error": "Server missing EBIRD_API_KEY"}), 500
-
-    global TAXONOMY_CACHE, TAXONOMY_CACHE_TIMESTAMP
-
-    # Check if we need to refresh the cache
-    current_time = time.time()
-
-    if (current_time - TAXONOMY_CACHE_TIMESTAMP > CACHE_DURATION or
-        not TAXONOMY_CACHE or species_code not in TAXONOMY_CACHE):
-
-        print(f"DEBUG: Refreshing taxonomy cache for species: {species_code}")
-
-        # Fetch taxonomy data from eBird
-        url = f"{EBIRD_BASE}/ref/taxonomy/ebird"
-        headers = {
-            "X-eBirdApiToken": EBIRD_API_KEY,
-            "Accept": "text/csv",
-            "User-Agent": UA,
-        }
-
-        try:
-            r = requests.get(url, headers=headers, timeout=20)
-            print(f"DEBUG: eBird taxonomy response status: {r.status_code}")
-
-            if r.status_code == 200:
-                # Parse CSV data and build cache
-                csv_data = r.text
-                lines = csv_data.strip().split('\n')
-
-                # Skip header line and build cache
-                for line in lines[1:]:
-                    if line.strip():
-                        parts = line.split(',')
-                        if len(parts) >= 10: # Ensure enough parts for order and family
-                            code = parts[2].strip('"')
-                            com_name = parts[1].strip('"')
-                            order = parts[8].strip('"')
-                            family = parts[9].strip('"')
-
-                            TAXONOMY_CACHE[code] = {
-                                "common_name": com_name,
-                                "order": order,
-                                "family": family
-                            }
-
-                TAXONOMY_CACHE_TIMESTAMP = current_time
-                print(f"DEBUG: Cached {len(TAXONOMY_CACHE)} species")
-            else:
-                return jsonify({"error": f"eBird taxonomy API error: {r.status_code}"}), 502
-
-        except requests.RequestException as e:
-            return jsonify({"error": "Network error contacting eBird", "detail": str(e)}), 502
-
-    # Look up species from cache
-    if species_code in TAXONOMY_CACHE:
-        species_data = TAXONOMY_CACHE[species_code]
-        return jsonify({
-            "species_code": species_code,
-            "common_name": species_data["common_name"],
-            "family": species_data["family"],
-            "order": species_data["order"]
-        })
-    else:
-        return jsonify({
-            "species_code": species_code,
-            "common_name": "Species not found",
-            "family": "Family information not available",
-            "order": "Order information not available",
-            "note": f"Species code '{species_code}' was not found in eBird's taxonomy database."
-        })
+    return send_reply(handlers.species_info(species_code))
 
 @app.route("/api/geocode")
 def geocode_address():
-    """Geocode an address using Google Maps API"""
-    if not GOOGLE_MAPS_API_KEY:
-        return jsonify({"error": "Server missing GOOGLE_MAPS_API_KEY"}), 500
-    
-    address = request.args.get('address')
-    if not address:
-        return jsonify({"error": "Address parameter required"}), 400
-    
-    try:
-        url = "https://maps.googleapis.com/maps/api/geocode/json"
-        params = {
-            'address': address,
-            'key': GOOGLE_MAPS_API_KEY
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
-        
-        if data.get('status') == 'OK' and data.get('results'):
-            result = data['results'][0]
-            location = result['geometry']['location']
-            return jsonify({
-                "success": True,
-                "location": {
-                    "lat": location['lat'],
-                                                   "lng": location['lng']
-                },
-                "formatted_address": result['formatted_address']
-            })
-        else:
-            return jsonify({
-                "success": False,
-                "error": f"Geocoding failed: {data.get('status', 'Unknown error')}"
-            })
-            
-    except requests.RequestException as e:
-        return jsonify({"error": "Network error contacting Google Maps", "detail": str(e)}), 500
+    """Geocode an address using Google Maps API (cached per normalized address)"""
+    return send_reply(handlers.geocode(request.args))
 
 if __name__ == "__main__":
+    # The debug reloader runs this file twice; only the serving child ingests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        ebird.start_ingestion(EBIRD_API_KEY)
     app.run(host="0.0.0.0", port=8000, debug=True)
@@ -2,229 +2,32 @@
 """
 Simple Flycatcher App Backend
 Perfect for a college junior SWE student
+
+Runs the project's Flask app (../app.py) with the keys from
+backend/api_keys.py, so `cd backend && python app.py` serves exactly the
+same routes, caches and upstream handling as the root app.
 """
 
-from flask import Flask, jsonify, request, send_from_directory
-import requests
-from datetime import datetime
+import os
+import sys
 
-# Load API keys
+# Load API keys; real environment variables take precedence
 try:
-    from api_keys import EBIRD_API_KEY, DEFAULT_REGION, GOOGLE_MAPS_API_KEY
-except Exception:
-    EBIRD_API_KEY = None
-    DEFAULT_REGION = "ZA"
-    GOOGLE_MAPS_API_KEY = ""
-
-# Cache for eBird taxonomy data
-TAXONOMY_CACHE = {}
-TAXONOMY_CACHE_TIMESTAMP = 0
-CACHE_DURATION = 3600  # Cache for 1 hour
-
-app = Flask(__name__)
-
-# ---- Frontend routes ----
-@app.route("/")
-def index():
-    """Landing page - serves the frontend landing.html"""
-    return send_from_directory("../frontend", "landing.html")
-
-@app.route("/app")
-def app_page():
-    """Main app page - serves the frontend app.html"""
-    return send_from_directory("../frontend", "app.html")
-
-@app.route("/<path:path>")
-def static_proxy(path):
-    return send_from_directory("../frontend", path)
-
-# ---- Simple config route (so Maps can load even if eBird is down) ----
-@app.route("/api/config")
-def get_config():
-    return jsonify({
-        "googleMapsApiKey": GOOGLE_MAPS_API_KEY,
-        "defaultRegion": DEFAULT_REGION
-    })
-
-# ---- eBird proxy ----
-EBIRD_BASE = "https://api.ebird.org/v2"
-UA = "FlycatcherApp/1.0 (+https://example.local)"
-
-@app.route("/api/observations")
-def observations():
-    """Proxy to eBird: recent observations in a region.
-    Query: region (default ZA), maxResults (default 1000), back (days back)
-    """
-    if not EBIRD_API_KEY:
-        return jsonify({"error": "Server missing EBIRD_API_KEY"}), 500
-
-    region = request.args.get("region", DEFAULT_REGION)
-    max_results = min(int(request.args.get("maxResults", 1000)), 1000)
-    back = int(request.args.get("back", 7))  # days back
-
-    url = f"{EBIRD_BASE}/data/obs/{region}/recent"
-    headers = {
-        "X-eBirdApiToken": EBIRD_API_KEY,
-        "Accept": "application/json",
-        "User-Agent": UA,
-    }
-    params = {"maxResults": max_results, "back": back}
-
-    try:
-        r = requests.get(url, headers=headers, params=params, timeout=20)
-        status = r.status_code
-        if status == 403:
-            return jsonify({
-                "error": "Forbidden (403) from eBird. API key may be invalid, not enabled, or rate-limited.",
-                "hint": "Verify the key at https://ebird.org/api/keygen and ensure it is active.",
-                "status": status
-            }), 502
-        if status != 200:
-            return jsonify({
-                "error": "eBird responded with non-200",
-                "status": status,
-                "text": r.text
-            }), 502
-        data = r.json()
-    except requests.RequestException as e:
-        return jsonify({"error": "Network error contacting eBird", "detail": str(e)}), 502
-
-    normalized = []
-    for item in data:
-        species_code = item.get("speciesCode")
-        print(f"DEBUG: Processing species: {item.get('comName')} with code: {species_code}")
-        normalized.append({
-            "species_code": species_code,
-            "common_name": item.get("comName"),
-            "scientific_name": item.get("sciName"),
-            "observation_date": item.get("obsDt"),
-            "latitude": item.get("lat"),
-            "longitude": item.get("lng"),
-            "count": item.get("howMany"),
-            "location_name": item.get("locName"),
-        })
-
-    return jsonify({
-        "region": region,
-        "count": len(normalized),
-        "observations": normalized
-    })
-
-@app.route("/api/species/<species_code>")
-def species_info(species_code):
-    """Get detailed information about a specific bird species from eBird"""
-    if not EBIRD_API_KEY:
-        return jsonify({"error": "Server missing EBIRD_API_KEY"}), 500
-
-    global TAXONOMY_CACHE, TAXONOMY_CACHE_TIMESTAMP
-    
-    # Check if we need to refresh the cache
-    import time
-    current_time = time.time()
-    
-    if (current_time - TAXONOMY_CACHE_TIMESTAMP > CACHE_DURATION or 
-        not TAXONOMY_CACHE or species_code not in TAXONOMY_CACHE):
-        
-        print(f"DEBUG: Refreshing taxonomy cache for species: {species_code}")
-        
-        # Fetch taxonomy data from eBird
-        url = f"{EBIRD_BASE}/ref/taxonomy/ebird"
-        headers = {
-            "X-eBirdApiToken": EBIRD_API_KEY,
-            "Accept": "text/csv",
-            "User-Agent": UA,
-        }
-
-        try:
-            r = requests.get(url, headers=headers, timeout=20)
-            print(f"DEBUG: eBird taxonomy response status: {r.status_code}")
-            
-            if r.status_code == 200:
-                # Parse CSV data and build cache
-                csv_data = r.text
-                lines = csv_data.strip().split('\n')
-                
-                # Skip header line and build cache
-                for line in lines[1:]:
-                    if line.strip():
-                        parts = line.split(',')
-                        if len(parts) >= 10:
-                            code = parts[2].strip('"')
-                            com_name = parts[1].strip('"')
-                            order = parts[8].strip('"')
-                            family = parts[9].strip('"')
-                            
-                            TAXONOMY_CACHE[code] = {
-                                "common_name": com_name,
-                                "order": order,
-                                "family": family
-                            }
-                
-                TAXONOMY_CACHE_TIMESTAMP = current_time
-                print(f"DEBUG: Cached {len(TAXONOMY_CACHE)} species")
-            else:
-                return jsonify({"error": f"eBird taxonomy API error: {r.status_code}"}), 502
-                
-        except requests.RequestException as e:
-            return jsonify({"error": "Network error contacting eBird", "detail": str(e)}), 502
-    
-    # Look up species from cache
-    if species_code in TAXONOMY_CACHE:
-        species_data = TAXONOMY_CACHE[species_code]
-        return jsonify({
-            "species_code": species_code,
-            "common_name": species_data["common_name"],
-            "family": species_data["family"],
-            "order": species_data["order"]
-        })
-    else:
-        return jsonify({
-            "species_code": species_code,
-            "common_name": "Species not found",
-            "family": "Family information not available",
-            "order": "Order information not available",
-            "note": f"Species code '{species_code}' was not found in eBird's taxonomy database."
-        })
-
-@app.route("/api/geocode")
-def geocode_address():
-    """Geocode an address using Google Maps API"""
-    if not GOOGLE_MAPS_API_KEY:
-        return jsonify({"error": "Server missing GOOGLE_MAPS_API_KEY"}), 500
-    
-    address = request.args.get('address')
-    if not address:
-        return jsonify({"error": "Address parameter required"}), 400
-    
-    try:
-        url = "https://maps.googleapis.com/maps/api/geocode/json"
-        params = {
-            'address': address,
-            'key': GOOGLE_MAPS_API_KEY
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
-        
-        if data.get('status') == 'OK' and data.get('results'):
-            result = data['results'][0]
-            location = result['geometry']['location']
-            return jsonify({
-                "success": True,
-                "location": {
-                    "lat": location['lat'],
-                    "lng": location['lng']
-                },
-                "formatted_address": result['formatted_address']
-            })
-        else:
-            return jsonify({
-                "success": False,
-                "error": f"Geocoding failed: {data.get('status', 'Unknown error')}"
-            })
-            
-    except requests.RequestException as e:
-        return jsonify({"error": "Network error contacting Google Maps", "detail": str(e)}), 502
+    import api_keys
+except ImportError:
+    api_keys = None
+for name in ("EBIRD_API_KEY", "GOOGLE_MAPS_API_KEY", "DEFAULT_REGION"):
+    value = getattr(api_keys, name, None)
+    if value:
+        os.environ.setdefault(name, value)
+
+# Shared modules live in the project root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import ebird
+from app import app, EBIRD_API_KEY
 
 if __name__ == "__main__":
+    # The debug reloader runs this file twice; only the serving child ingests
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        ebird.start_ingestion(EBIRD_API_KEY)
     app.run(host="0.0.0.0", port=8000, debug=True)
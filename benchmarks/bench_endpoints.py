@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Endpoint load benchmark against a local eBird/Google stand-in
+
+Each (target, endpoint) pair runs in its own process, with its own
+fake_upstream.FakeUpstream, so caches start cold and peak RSS is measured
+independently. Targets:
+
+    flask   app.py behind a threaded werkzeug server, driven over HTTP
+    local   api/app.py's VercelHandler on its threaded server, over HTTP
+    vercel  the api/*.py handler functions, called directly
+
+HTTP targets are driven over one keep-alive connection per client thread.
+
+Reports throughput, p50/p95/p99 latency, upstream call counts and peak RSS
+per endpoint, and writes them as JSON. --compare prints the change against
+an earlier results file and exits 1 if any p95 regressed past --threshold.
+--cache puts the caches on a shared backend (a temporary SQLite file, or
+fake_redis.FakeRedis for redis) instead of keeping them per process.
+
+    python benchmarks/bench_endpoints.py [--requests 400] [--concurrency 8]
+        [--latency 0.05] [--cache none|memory|sqlite|redis]
+        [--output results.json] [--compare baseline.json]
+"""
+
+import argparse
+import http.client
+import importlib.util
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_redis import FakeRedis  # noqa: E402  (benchmarks/ is sys.path[0])
+from fake_upstream import FakeUpstream  # noqa: E402
+
+SEARCH_TERMS = ("warb", "eastern", "warbler 12", "genus species4", "arbl")
+WORLD = "-90,-180,90,180"
+
+
+# Endpoint name -> (request number, options) -> (path, query)
+ENDPOINTS = {
+    "observations": lambda i, o: (
+        "/api/observations", {"region": f"R{i % o.regions}"}),
+    "observations_columnar": lambda i, o: (
+        "/api/observations", {"region": f"R{i % o.regions}", "format": "columnar"}),
+    "observations_multi": lambda i, o: (
+        "/api/observations", {"region": ",".join(f"R{r}" for r in range(o.regions))}),
+    "observations_page": lambda i, o: (
+        "/api/observations", {"region": f"R{i % o.regions}", "bbox": "-30,0,0,40", "limit": 100}),
+    "clusters": lambda i, o: (
+        "/api/observations/clusters", {"region": f"R{i % o.regions}", "bbox": WORLD, "zoom": 3}),
+    "species": lambda i, o: (
+        f"/api/species/spec{i * 7919 % o.taxonomy_rows}", {}),
+    "species_search": lambda i, o: (
+        "/api/species/search", {"q": SEARCH_TERMS[i % len(SEARCH_TERMS)]}),
+    "geocode": lambda i, o: (
+        "/api/geocode", {"address": f"Place {i % 50}"}),
+}
+
+# Endpoints the Vercel functions serve, by handler module
+VERCEL_MODULES = {
+    "observations": "observations",
+    "observations_columnar": "observations",
+    "observations_multi": "observations",
+    "observations_page": "observations",
+    "clusters": "observations",
+    "species": "species",
+    "species_search": "species",
+}
+
+TARGETS = ("flask", "local", "vercel")
+CACHES = ("none", "memory", "sqlite", "redis")
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def http_client(port):
+    """send(path, query) over a keep-alive connection per calling thread"""
+    local = threading.local()
+
+    def send(path, query):
+        conn = getattr(local, "conn", None)
+        if conn is None:
+            conn = local.conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        try:
+            conn.request("GET", path + ("?" + urlencode(query) if query else ""),
+                         headers={"Accept-Encoding": "gzip"})
+            response = conn.getresponse()
+            return response.status, len(response.read())
+        except Exception:
+            conn.close()
+            local.conn = None
+            raise
+
+    return send
+
+
+def flask_client():
+    """Serve app.py on a threaded werkzeug server; returns send(path, query)"""
+    from werkzeug.serving import make_server
+    import app
+
+    server = make_server("127.0.0.1", 0, app.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return http_client(server.server_port)
+
+
+def local_client():
+    """Serve api/app.py's VercelHandler; returns send(path, query)"""
+    spec = importlib.util.spec_from_file_location("local_app", os.path.join(ROOT, "api", "app.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    server = module.make_server("127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return http_client(server.server_port)
+
+
+def vercel_client(endpoint):
+    """Call the api/ handler for endpoint in-process; returns send(path, query)"""
+    name = VERCEL_MODULES[endpoint]
+    spec = importlib.util.spec_from_file_location(
+        f"vercel_{name}", os.path.join(ROOT, "api", f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    def send(path, query):
+        response = module.handler({
+            "path": path,
+            "httpMethod": "GET",
+            "queryStringParameters": {key: str(value) for key, value in query.items()},
+            "headers": {"Accept-Encoding": "gzip"},
+        }, None)
+        return response["statusCode"], len(response.get("body") or "")
+
+    return send
+
+
+def cache_url(kind):
+    """CACHE_URL for a --cache choice, starting a FakeRedis if needed"""
+    if kind == "memory":
+        return "memory://"
+    if kind == "sqlite":
+        return "sqlite://" + os.path.join(tempfile.mkdtemp(prefix="bench-cache-"), "cache.sqlite")
+    if kind == "redis":
+        return FakeRedis().start().url
+    return ""
+
+
+def run_endpoint(target, endpoint, options):
+    """Load one endpoint in this process and return its measurements"""
+    fake = FakeUpstream(latency=options.latency, observations=options.observations,
+                        taxonomy_rows=options.taxonomy_rows).start()
+    os.environ.update(fake.env())
+    os.environ.update({
+        "EBIRD_API_KEY": "bench",
+        "GOOGLE_MAPS_API_KEY": "bench",
+        "TAXONOMY_SNAPSHOT": "0",
+        "OBSERVATION_STORE_PATH": "",
+        "GEOCODE_CACHE_PATH": "",
+        "LAST_GOOD_PATH": os.path.join(tempfile.mkdtemp(prefix="bench-last-good-"), "last_good.sqlite"),
+        "LOG_LEVEL": "WARNING",
+        "CACHE_URL": cache_url(options.cache),
+    })
+    if target == "flask":
+        send = flask_client()
+    elif target == "local":
+        send = local_client()
+    else:
+        send = vercel_client(endpoint)
+    build = ENDPOINTS[endpoint]
+
+    def one(i):
+        path, query = build(i, options)
+        start = time.perf_counter()
+        try:
+            status, size = send(path, query)
+        except Exception:
+            status, size = None, 0
+        return time.perf_counter() - start, status, size
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(options.concurrency) as pool:
+        samples = list(pool.map(one, range(options.requests)))
+    wall = time.perf_counter() - start
+    fake.stop()
+
+    latencies = sorted(seconds * 1000 for seconds, _, _ in samples)
+    errors = sum(1 for _, status, _ in samples if status not in (200, 304))
+    return {
+        "target": target,
+        "endpoint": endpoint,
+        "requests": options.requests,
+        "concurrency": options.concurrency,
+        "errors": errors,
+        "throughput_rps": round(options.requests / wall, 1),
+        "p50_ms": round(percentile(latencies, 50), 2),
+        "p95_ms": round(percentile(latencies, 95), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "max_ms": round(latencies[-1], 2),
+        "mean_response_bytes": round(sum(size for _, _, size in samples) / len(samples)),
+        "upstream_calls": fake.call_counts(),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def compare(results, baseline_path, threshold):
+    """Print p95 and throughput changes against a baseline; returns True on a regression"""
+    with open(baseline_path) as f:
+        baseline = {(r["target"], r["endpoint"]): r for r in json.load(f)["results"]}
+    regressed = False
+    for result in results:
+        old = baseline.get((result["target"], result["endpoint"]))
+        if old is None:
+            continue
+        p95 = (result["p95_ms"] - old["p95_ms"]) / old["p95_ms"] * 100 if old["p95_ms"] else 0.0
+        rps = (result["throughput_rps"] - old["throughput_rps"]) / old["throughput_rps"] * 100
+        flag = ""
+        if p95 > threshold:
+            flag = "  REGRESSION"
+            regressed = True
+        print(f"{result['target']:6} {result['endpoint']:22} p95 {old['p95_ms']:>8} -> "
+              f"{result['p95_ms']:>8} ms ({p95:+.0f}%)  rps {rps:+.0f}%{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=400, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="fake upstream delay, seconds")
+    parser.add_argument("--observations", type=int, default=2000, help="rows per region")
+    parser.add_argument("--taxonomy-rows", type=int, default=17000)
+    parser.add_argument("--regions", type=int, default=4, help="distinct regions requested")
+    parser.add_argument("--cache", choices=CACHES, default="none", help="shared cache backend")
+    parser.add_argument("--target", action="append", choices=TARGETS, help="default: all")
+    parser.add_argument("--endpoint", action="append", choices=sorted(ENDPOINTS), help="default: all")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--compare", metavar="BASELINE", help="results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="p95 regression, percent")
+    parser.add_argument("--run", nargs=2, metavar=("TARGET", "ENDPOINT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        print(json.dumps(run_endpoint(*args.run, args)))
+        return
+
+    forwarded = ["--requests", str(args.requests), "--concurrency", str(args.concurrency),
+                 "--latency", str(args.latency), "--observations", str(args.observations),
+                 "--taxonomy-rows", str(args.taxonomy_rows), "--regions", str(args.regions),
+                 "--cache", args.cache]
+    results = []
+    for target in args.target or TARGETS:
+        for endpoint in args.endpoint or ENDPOINTS:
+            if target == "vercel" and endpoint not in VERCEL_MODULES:
+                continue
+            out = subprocess.run(
+                [sys.executable, __file__, "--run", target, endpoint, *forwarded],
+                check=True, capture_output=True, text=True).stdout
+            result = json.loads(out.strip().splitlines()[-1])
+            results.append(result)
+            print(json.dumps(result))
+
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "options": {key: value for key, value in vars(args).items()
+                        if key not in ("run", "output", "compare", "target", "endpoint")},
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
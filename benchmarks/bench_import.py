@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Import-time budget for the serverless entry points
+
+Imports each Vercel function (and the Flask app, for reference) in a fresh
+interpreter several times under -X importtime and takes the median
+cumulative time of the entry module. Also reports whether the import pulled
+in requests, which handlers.py and upstream.py defer to the first upstream
+call. Exits 1 when an entry point is over its budget or loads requests
+eagerly, so CI can hold the cold-start line.
+
+    python benchmarks/bench_import.py [--runs 7] [--output imports.json]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry module -> budget in milliseconds (cumulative import time)
+BUDGETS_MS = {
+    "api.config": 20,
+    "api.observations": 60,
+    "api.species": 60,
+    "app": 600,
+}
+# Modules that must stay out of a function's cold start
+DEFERRED = ("requests", "sqlite3", "concurrent.futures")
+
+PROBE = ("import sys, json; sys.path.insert(0, {root!r}); import {module}; "
+         "print(json.dumps([m for m in {deferred!r} if m in sys.modules]))")
+
+
+def import_once(module):
+    """Return (milliseconds, deferred modules loaded) for one cold import"""
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE="1")
+    env.pop("PYTHONPROFILEIMPORTTIME", None)
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         PROBE.format(root=ROOT, module=module, deferred=DEFERRED)],
+        check=True, capture_output=True, text=True, env=env, cwd=ROOT)
+    micros = None
+    for line in out.stderr.splitlines():
+        fields = [field.strip() for field in line.split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            micros = int(fields[1])
+    return micros / 1000, json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(module, runs):
+    times = []
+    loaded = []
+    for _ in range(runs):
+        ms, loaded = import_once(module)
+        times.append(ms)
+    median = statistics.median(times)
+    budget = BUDGETS_MS[module]
+    # The Flask app is a long-running server; only the functions must stay lean
+    eager = loaded if module.startswith("api.") else []
+    return {
+        "module": module,
+        "median_ms": round(median, 1),
+        "min_ms": round(min(times), 1),
+        "budget_ms": budget,
+        "deferred_loaded": loaded,
+        "ok": median <= budget and not eager,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--module", action="append", choices=sorted(BUDGETS_MS), help="default: all")
+    parser.add_argument("--output", help="write results JSON here")
+    args = parser.parse_args()
+
+    # Compile once so every run measures imports, not bytecode compilation
+    subprocess.run([sys.executable, "-m", "compileall", "-q", ROOT, "-x", r"[\\/]\."],
+                   check=True, capture_output=True)
+    results = []
+    for module in args.module or BUDGETS_MS:
+        result = measure(module, args.runs)
+        results.append(result)
+        print(json.dumps(result))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+    if not all(result["ok"] for result in results):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
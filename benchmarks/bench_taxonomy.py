@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Taxonomy ingestion benchmark
+
+Compares the old split-based loader (whole body in memory, then
+.split('\\n'), then line.split(',')) with the streaming csv loader in
+taxonomy.py, on a synthetic eBird-shaped CSV. Each variant runs in its own
+process so peak RSS is measured independently.
+
+    python benchmarks/bench_taxonomy.py [--rows 17000]
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HEADER = ("SCIENTIFIC_NAME,COMMON_NAME,SPECIES_CODE,CATEGORY,TAXON_ORDER,"
+          "COM_NAME_CODES,SCI_NAME_CODES,BANDING_CODES,ORDER,FAMILY_COM_NAME,"
+          "FAMILY_SCI_NAME,REPORT_AS,EXTINCT,EXTINCT_YEAR,FAMILY_CODE")
+
+
+def write_payload(path, rows):
+    """Write a synthetic taxonomy CSV; every 10th name contains a comma"""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(HEADER + "\r\n")
+        for i in range(rows):
+            name = f'"Warbler {i}, Eastern"' if i % 10 == 0 else f"Warbler {i}"
+            f.write(f"Genus species{i},{name},spec{i},species,{i},WAR{i},GESP{i},,"
+                    f"Passeriformes,Family {i % 250},Familidae{i % 250},,,,fam{i % 250}\r\n")
+
+
+def legacy_load(path):
+    """The loader as it was before streaming ingestion"""
+    with open(path, "rb") as f:
+        content = f.read()  # requests keeps r.content ...
+    csv_data = content.decode("utf-8")  # ... and r.text alive together
+    table = {}
+    lines = csv_data.strip().split('\n')
+    for line in lines[1:]:
+        if line.strip():
+            parts = line.split(',')
+            if len(parts) >= 10:
+                code = parts[2].strip('"')
+                table[code] = {
+                    "common_name": parts[1].strip('"'),
+                    "order": parts[8].strip('"'),
+                    "family": parts[9].strip('"')
+                }
+    return table
+
+
+def streaming_load(path):
+    import taxonomy
+    with open(path, encoding="utf-8", newline="") as f:
+        return taxonomy.build_table(taxonomy.parse_taxonomy_csv(f))
+
+
+def snapshot_load(path):
+    import taxonomy
+    import taxonomy_snapshot
+    target = os.path.join(tempfile.mkdtemp(), "taxonomy.sqlite")
+    with open(path, encoding="utf-8", newline="") as f:
+        taxonomy_snapshot.write_snapshot(target, taxonomy.parse_taxonomy_csv(f))
+    return taxonomy_snapshot.TaxonomySnapshot(target)
+
+
+VARIANTS = {
+    "legacy": legacy_load,
+    "streaming": streaming_load,
+    "streaming+snapshot": snapshot_load,
+}
+
+
+def run_variant(name, path):
+    """Run one variant in this process and return its measurements"""
+    loader = VARIANTS[name]
+    if name != "legacy":
+        import taxonomy  # noqa: F401  (keep import cost out of the timing)
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    table = loader(path)
+    elapsed = time.perf_counter() - start
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Second pass under tracemalloc, which would distort the timing above
+    del table
+    tracemalloc.start()
+    table = loader(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Rows with a quoted comma must keep family/order in the right column
+    sample = table.get("spec0") or {}
+    return {
+        "variant": name,
+        "rows": len(table),
+        "seconds": round(elapsed, 4),
+        "peak_traced_mb": round(peak / 1e6, 2),
+        "peak_rss_growth_mb": round((rss_after - rss_before) / 1024, 2),
+        "correct_quoted_row": sample.get("family") == "Family 0",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=17000)
+    parser.add_argument("--variant", choices=sorted(VARIANTS), help=argparse.SUPPRESS)
+    parser.add_argument("--payload", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        print(json.dumps(run_variant(args.variant, args.payload)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        payload = os.path.join(tmp, "taxonomy.csv")
+        write_payload(payload, args.rows)
+        print(f"payload: {args.rows} rows, {os.path.getsize(payload) / 1e6:.2f} MB")
+        for name in VARIANTS:
+            out = subprocess.run(
+                [sys.executable, __file__, "--variant", name, "--payload", payload],
+                check=True, capture_output=True, text=True).stdout
+            print(json.dumps(json.loads(out.strip().splitlines()[-1])))
+
+
+if __name__ == "__main__":
+    main()
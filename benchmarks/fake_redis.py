@@ -0,0 +1,152 @@
+"""
+Local stand-in for a Redis server
+
+Implements the slice of the Redis protocol that cache_backends.RedisBackend
+uses (PING, AUTH, SELECT, GET, SET with PX/EX/NX, DEL, EVAL of its
+compare-and-delete script, DBSIZE, FLUSHDB) on a threaded TCP server, with
+expiry, so the shared cache can be exercised
+without a real Redis. Point the app at it with CACHE_URL=<url>.
+
+    python benchmarks/fake_redis.py [--port 6390]
+"""
+
+import argparse
+import os
+import socketserver
+import sys
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from cache_backends import DELETE_IF_SCRIPT, read_reply  # noqa: E402
+
+
+class FakeRedis:
+    """Threaded in-memory Redis-protocol server on 127.0.0.1
+
+    password: when set, commands other than AUTH and PING need it first
+    """
+
+    def __init__(self, port=0, password=None):
+        self.password = password
+        self.data = {}  # key -> (expires_at or None, value)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self.server = socketserver.ThreadingTCPServer(("127.0.0.1", port), self._handler_class())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        auth = f":{self.password}@" if self.password else ""
+        return f"redis://{auth}127.0.0.1:{self.server.server_address[1]}/0"
+
+    def env(self):
+        """Environment variables that point the app's shared cache here"""
+        return {"CACHE_URL": self.url}
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def call_counts(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def execute(self, args, session):
+        """Run one command; returns the reply as RESP bytes"""
+        name = args[0].decode().upper()
+        with self._lock:
+            self.calls[name] += 1
+            if name == "PING":
+                return b"+PONG\r\n"
+            if name == "AUTH":
+                session["auth"] = args[-1].decode() == self.password
+                return b"+OK\r\n" if session["auth"] else b"-WRONGPASS invalid password\r\n"
+            if self.password and not session.get("auth"):
+                return b"-NOAUTH Authentication required.\r\n"
+            if name == "SELECT":
+                return b"+OK\r\n"
+            if name == "GET":
+                value = self._get(args[1])
+                return b"$-1\r\n" if value is None else b"$%d\r\n%s\r\n" % (len(value), value)
+            if name == "SET":
+                return self._set(args[1], args[2], [arg.decode().upper() for arg in args[3:]])
+            if name == "DEL":
+                removed = sum(self.data.pop(key, None) is not None for key in args[1:])
+                return b":%d\r\n" % removed
+            if name == "EVAL":
+                if args[1].decode() != DELETE_IF_SCRIPT:
+                    return b"-ERR only the compare-and-delete script is supported\r\n"
+                key, expected = args[3], args[4]
+                if self._get(key) != expected:
+                    return b":0\r\n"
+                del self.data[key]
+                return b":1\r\n"
+            if name == "DBSIZE":
+                return b":%d\r\n" % sum(self._get(key) is not None for key in list(self.data))
+            if name == "FLUSHDB":
+                self.data.clear()
+                return b"+OK\r\n"
+        return b"-ERR unknown command '%s'\r\n" % name.encode()
+
+    # Callers of the helpers below must hold self._lock
+
+    def _get(self, key):
+        entry = self.data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= time.time():
+            del self.data[key]
+            return None
+        return entry[1]
+
+    def _set(self, key, value, options):
+        expires_at = None
+        if "PX" in options:
+            expires_at = time.time() + int(options[options.index("PX") + 1]) / 1000
+        elif "EX" in options:
+            expires_at = time.time() + int(options[options.index("EX") + 1])
+        if "NX" in options and self._get(key) is not None:
+            return b"$-1\r\n"
+        self.data[key] = (expires_at, value)
+        return b"+OK\r\n"
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                session = {}
+                while True:
+                    try:
+                        args = read_reply(self.rfile)
+                    except (ConnectionError, OSError):
+                        return
+                    self.wfile.write(fake.execute(args, session))
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=6390)
+    parser.add_argument("--password")
+    args = parser.parse_args()
+
+    fake = FakeRedis(args.port, args.password)
+    for name, value in fake.env().items():
+        print(f"{name}={value}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Local stand-in for the eBird and Google geocoding APIs
+
+Serves deterministic recent-observation JSON, the taxonomy CSV and geocode
+results from a threaded HTTP server, with a configurable delay per request,
+and counts the calls it receives. Point the app at it with
+EBIRD_BASE_URL=<url>/v2 and GEOCODE_URL=<url>/maps/api/geocode/json.
+
+    python benchmarks/fake_upstream.py [--port 8900] [--latency 0.05]
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+HEADER = ("SCIENTIFIC_NAME,COMMON_NAME,SPECIES_CODE,CATEGORY,TAXON_ORDER,"
+          "COM_NAME_CODES,SCI_NAME_CODES,BANDING_CODES,ORDER,FAMILY_COM_NAME,"
+          "FAMILY_SCI_NAME,REPORT_AS,EXTINCT,EXTINCT_YEAR,FAMILY_CODE")
+
+
+def taxonomy_csv(rows):
+    """Synthetic eBird taxonomy CSV; every 10th common name contains a comma"""
+    lines = [HEADER]
+    for i in range(rows):
+        name = f'"Warbler {i}, Eastern"' if i % 10 == 0 else f"Warbler {i}"
+        lines.append(f"Genus species{i},{name},spec{i},species,{i},WAR{i},GESP{i},,"
+                     f"Passeriformes,Family {i % 250},Familidae{i % 250},,,,fam{i % 250}")
+    return ("\r\n".join(lines) + "\r\n").encode()
+
+
+def recent_observations(region, count, species):
+    """Synthetic eBird recent observations for region, the same on every call"""
+    seed = sum(region.encode())
+    rows = []
+    for i in range(count):
+        code = (seed * 31 + i * 7) % species
+        rows.append({
+            "speciesCode": f"spec{code}",
+            "comName": f"Warbler {code}",
+            "sciName": f"Genus species{code}",
+            "locName": f"{region} site {i % 200}",
+            "obsDt": f"2026-10-{1 + i % 28:02d} {i % 24:02d}:00",
+            "howMany": 1 + i % 5,
+            "lat": -35 + (seed + i * 13) % 7000 / 100,
+            "lng": -20 + (seed * 3 + i * 17) % 9000 / 100,
+        })
+    return rows
+
+
+class FakeUpstream:
+    """Threaded fake eBird + geocoder on 127.0.0.1
+
+    latency: seconds slept before each response
+    observations: rows returned per region (capped by maxResults)
+    taxonomy_rows: species in the taxonomy CSV
+    status: when set, every response has this status (e.g. 429 or 503)
+    """
+
+    def __init__(self, port=0, latency=0.0, observations=2000, taxonomy_rows=17000, status=None):
+        self.latency = latency
+        self.status = status
+        self.observations = observations
+        self.taxonomy_rows = taxonomy_rows
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._bodies = {}
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def env(self):
+        """Environment variables that route the app's upstream calls here"""
+        return {
+            "EBIRD_BASE_URL": self.url + "/v2",
+            "GEOCODE_URL": self.url + "/maps/api/geocode/json",
+        }
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def call_counts(self):
+        with self._lock:
+            return dict(self.calls)
+
+    def _body(self, key, build):
+        with self._lock:
+            body = self._bodies.get(key)
+        if body is None:
+            body = build()
+            with self._lock:
+                self._bodies[key] = body
+        return body
+
+    def respond(self, path, query):
+        """Return (call kind, status, content type, body) for a request"""
+        parts = path.strip("/").split("/")
+        if parts[:3] == ["v2", "data", "obs"] and len(parts) == 5 and parts[4] == "recent":
+            region = parts[3]
+            limit = min(int(query.get("maxResults", [self.observations])[0]), self.observations)
+            body = self._body(("obs", region, limit), lambda: json.dumps(
+                recent_observations(region, limit, self.taxonomy_rows)).encode())
+            return "observations", 200, "application/json", body
+        if parts == ["v2", "ref", "taxonomy", "ebird"]:
+            body = self._body(("taxonomy",), lambda: taxonomy_csv(self.taxonomy_rows))
+            return "taxonomy", 200, "text/csv", body
+        if parts == ["maps", "api", "geocode", "json"]:
+            address = query.get("address", [""])[0]
+            seed = sum(address.encode())
+            body = json.dumps({"status": "OK", "results": [{
+                "formatted_address": address,
+                "geometry": {"location": {"lat": seed % 180 - 90, "lng": seed % 360 - 180}},
+            }]}).encode()
+            return "geocode", 200, "application/json", body
+        return "unknown", 404, "application/json", b'{"error":"not found"}'
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                kind, status, content_type, body = fake.respond(parsed.path, parse_qs(parsed.query))
+                if fake.status:
+                    status, body = fake.status, b'{"error":"injected"}'
+                with fake._lock:
+                    fake.calls[kind] += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds per response")
+    parser.add_argument("--observations", type=int, default=2000, help="rows per region")
+    parser.add_argument("--taxonomy-rows", type=int, default=17000)
+    parser.add_argument("--status", type=int, help="answer every request with this status")
+    args = parser.parse_args()
+
+    fake = FakeUpstream(args.port, args.latency, args.observations, args.taxonomy_rows, args.status)
+    for name, value in fake.env().items():
+        print(f"{name}={value}")
+    try:
+        fake.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+# In-process response caching for the Flycatcher app
+# A small TTL + LRU cache with single-flight loading, so that many concurrent
+# requests for the same key produce exactly one upstream call. With a shared
+# tier (see cache_backends) the same holds across worker processes.
+
+import threading
+import time
+from collections import OrderedDict
+
+# Named caches whose stats() are reported on /api/cache/stats
+REGISTRY = {}
+
+
+def register(name, cache):
+    """Make a cache's stats visible under the given name"""
+    REGISTRY[name] = cache
+    return cache
+
+
+def all_stats():
+    """Return stats() for every registered cache, keyed by name"""
+    return {name: cache.stats() for name, cache in REGISTRY.items()}
+
+
+class _Flight:
+    """A load in progress that other callers can wait on"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """Thread-safe TTL cache with LRU eviction and single-flight loading
+
+    Entries expire `ttl` seconds after they were stored, or after
+    `ttl_for(value)` seconds if given; a ttl of 0 means "do not cache". The
+    cache holds at most `max_entries` entries and at most `max_bytes` bytes
+    as measured by `sizer`; the least recently used entries are evicted
+    first.
+
+    `shared` is an optional cache_backends.SharedTier behind this cache.
+    Local misses are looked up there before loading (status "SHARED"), new
+    values are written through to it, and only one process at a time loads
+    a missing key while the others wait for its result.
+    """
+
+    def __init__(self, ttl, max_entries=128, max_bytes=None, sizer=None, ttl_for=None,
+                 shared=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizer = sizer or (lambda value: 1)
+        self.ttl_for = ttl_for or (lambda value: self.ttl)
+        self.shared = shared
+        self._entries = OrderedDict()  # key -> (expires_at, size, value)
+        self._flights = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value for key, or None if missing or expired"""
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value
+            self.misses += 1
+        return self._from_shared(key)[0]
+
+    def peek(self, key):
+        """Return the cached value for key without counting a hit or miss"""
+        with self._lock:
+            return self._lookup(key)
+
+    def set(self, key, value):
+        """Store value under key, evicting old entries to stay within bounds"""
+        size = self.sizer(value)
+        with self._lock:
+            self._store(key, value, size)
+        if self.shared is not None:
+            self.shared.set(key, value, self.ttl_for(value))
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() once on a miss
+
+        Concurrent callers asking for the same missing key wait for the first
+        caller's load instead of starting their own. Returns (value, status)
+        where status is "HIT", "MISS", "COALESCED" or "SHARED". Exceptions
+        raised by the loader are passed on to every waiting caller and are not
+        cached.
+        """
+        with self._lock:
+            value = self._lookup(key)
+            if value is not None:
+                self.hits += 1
+                return value, "HIT"
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                self.misses += 1
+                flight = self._flights[key] = _Flight()
+                leader = True
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value, "COALESCED"
+
+        try:
+            value, lease = self._from_shared(key, wait=True)
+            if value is not None:
+                flight.value = value
+                return value, "SHARED"
+            try:
+                value = loader()
+                size = self.sizer(value)
+                with self._lock:
+                    self._store(key, value, size)
+                if self.shared is not None:
+                    self.shared.set(key, value, self.ttl_for(value))
+            finally:
+                if lease:
+                    self.shared.release(key, lease)
+            flight.value = value
+            return value, "MISS"
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.event.set()
+
+    def invalidate(self, match):
+        """Drop every entry whose key satisfies match(key); returns the count"""
+        with self._lock:
+            keys = [key for key in self._entries if match(key)]
+            for key in keys:
+                self._bytes -= self._entries.pop(key)[1]
+            return len(keys)
+
+    def clear(self):
+        """Drop every cached entry"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        shared = self.shared.stats() if self.shared is not None else {}
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                **{f"shared_{name}": value for name, value in shared.items()},
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "ttl": self.ttl,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+            }
+
+    def _from_shared(self, key, wait=False):
+        """Adopt the shared tier's value for key into this cache
+
+        Returns (value or None, lease). With wait=False the tier is only
+        looked up. With wait=True a missing key is claimed for loading, or
+        waited for if another process already holds the claim; lease is the
+        token to release() when this process holds the lease, else None.
+        """
+        if self.shared is None:
+            return None, None
+        lease = None
+        found = self.shared.get(key)
+        if found is None and wait:
+            lease = self.shared.claim(key)
+            if lease is False:
+                found, lease = self.shared.wait(key)
+        if found is None:
+            return None, lease or None
+        value, expires_at = found
+        size = self.sizer(value)
+        with self._lock:
+            self._store(key, value, size, expires_at)
+        return value, None
+
+    # Callers of the helpers below must hold self._lock
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, size, value = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            self._bytes -= size
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _store(self, key, value, size, expires_at=None):
+        if self.max_bytes is not None and size > self.max_bytes:
+            return  # Never cache something bigger than the whole cache
+        if expires_at is None:
+            ttl = self.ttl_for(value)
+            if ttl <= 0:
+                return
+            expires_at = time.time() + ttl
+        elif expires_at <= time.time():
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._bytes -= old[1]
+        self._entries[key] = (expires_at, size, value)
+        self._bytes += size
+        while (len(self._entries) > self.max_entries or
+               (self.max_bytes is not None and self._bytes > self.max_bytes)):
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
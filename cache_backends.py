@@ -0,0 +1,436 @@
+# Shared cache backends for the Flycatcher app
+# A TTLCache can sit on top of a SharedTier, so that processes on one host
+# (SQLite file) or on many hosts (Redis) answer from one warm copy instead of
+# each worker and serverless instance calling eBird and Google for itself.
+#
+#   CACHE_URL=                              per-process caches only (default)
+#   CACHE_URL=memory://                     in-process backend (tests)
+#   CACHE_URL=sqlite:///var/tmp/fc.sqlite   one file shared by local workers
+#   CACHE_URL=redis://:secret@host:6379/0   anything speaking the Redis protocol
+
+import json
+import os
+import threading
+import time
+from urllib.parse import unquote, urlsplit
+
+import logs
+import sqlite_files
+
+log = logs.get_logger(__name__)
+
+CACHE_URL = os.environ.get('CACHE_URL', '')
+# Prefix for every key, so several deployments can share one Redis
+CACHE_PREFIX = os.environ.get('CACHE_PREFIX', 'flycatcher')
+# Seconds to wait on the backend before treating it as down
+CACHE_TIMEOUT = float(os.environ.get('CACHE_TIMEOUT', 0.5))
+# After an error, skip the backend for this many seconds
+CACHE_RETRY_AFTER = float(os.environ.get('CACHE_RETRY_AFTER', 5))
+# How long one worker may hold the right to load a key the others wait for.
+# Must outlast the slowest load: an eBird call is tried up to 3 times with a
+# 20s timeout and up to 2s backoff, after up to 10s in the rate-limit queue
+CACHE_LEASE = float(os.environ.get('CACHE_LEASE', 75))
+
+# Deletes KEYS[1] only if it still holds ARGV[1]
+DELETE_IF_SCRIPT = (
+    "if redis.call('GET', KEYS[1]) == ARGV[1] then "
+    "return redis.call('DEL', KEYS[1]) else return 0 end")
+
+
+class BackendError(Exception):
+    """Error reply from a cache backend"""
+
+
+class MemoryBackend:
+    """Backend in a dict of this process; behaves like the shared ones"""
+
+    def __init__(self):
+        self._entries = {}  # key -> (expires_at, data)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                self._entries.pop(key, None)
+                return None
+            return entry[1]
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, data)
+
+    def add(self, key, data, ttl):
+        """Set key only if it is absent; True if this call stored it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                return False
+            self._entries[key] = (time.time() + ttl, data)
+            return True
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def delete_if(self, key, data):
+        """Delete key only if it still holds data; True if it was deleted"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time() or entry[1] != data:
+                return False
+            del self._entries[key]
+            return True
+
+
+class SQLiteBackend:
+    """Backend in a SQLite file, shared by every process on the host
+
+    Each process (and each side of a fork) opens its own connection; WAL
+    mode lets readers continue while another worker writes.
+    """
+
+    PURGE_EVERY = 200  # writes between sweeps of expired rows
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite_files.ProcessConnection(path, timeout=CACHE_TIMEOUT * 10,
+                                                    setup=self._setup)
+        self._writes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?",
+                (key, time.time())).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, data, ttl):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                         (key, data, time.time() + ttl))
+            self._after_write()
+
+    def add(self, key, data, ttl):
+        """Set key only if it is absent or expired; True if this call stored it"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ? AND expires_at <= ?", (key, now))
+            stored = self._conn.execute("INSERT OR IGNORE INTO cache VALUES (?, ?, ?)",
+                                  (key, data, now + ttl)).rowcount == 1
+            self._after_write()
+        return stored
+
+    def delete(self, key):
+        with self._lock:
+            self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def delete_if(self, key, data):
+        """Delete key only if it still holds data; True if it was deleted"""
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM cache WHERE key = ? AND value = ? AND expires_at > ?",
+                (key, data, time.time())).rowcount == 1
+            self._conn.commit()
+        return deleted
+
+    @staticmethod
+    def _setup(db):
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute("""
+            CREATE TABLE IF NOT EXISTS cache (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL
+            )""")
+        db.commit()
+
+    # Callers must hold self._lock
+    def _after_write(self):
+        self._writes += 1
+        if self._writes % self.PURGE_EVERY == 0:
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (time.time(),))
+        self._conn.commit()
+
+
+class RedisBackend:
+    """Backend on a Redis-protocol server (Redis, Valkey, KeyDB, ...)
+
+    Speaks RESP over a plain socket, so no client library is needed. Each
+    thread keeps one connection, reopened after errors and after a fork.
+    """
+
+    def __init__(self, host='127.0.0.1', port=6379, db=0, password=None, timeout=CACHE_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def get(self, key):
+        return self.command('GET', key)
+
+    def set(self, key, data, ttl):
+        self.command('SET', key, data, 'PX', max(1, int(ttl * 1000)))
+
+    def add(self, key, data, ttl):
+        """Set key only if it is absent; True if this call stored it"""
+        return self.command('SET', key, data, 'PX', max(1, int(ttl * 1000)), 'NX') == b'OK'
+
+    def delete(self, key):
+        self.command('DEL', key)
+
+    def delete_if(self, key, data):
+        """Delete key only if it still holds data; True if it was deleted"""
+        return self.command('EVAL', DELETE_IF_SCRIPT, 1, key, data) == 1
+
+    def command(self, *args):
+        """Send one command and return its decoded reply
+
+        Raises BackendError for an error reply and OSError when the server
+        cannot be reached; the connection is dropped after either.
+        """
+        conn = self._connection()
+        try:
+            conn[0].sendall(encode_command(args))
+            return read_reply(conn[1])
+        except Exception:
+            self._close()
+            raise
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and conn[2] == os.getpid():
+            return conn
+        import socket  # Only processes using Redis pay for the import
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        conn = self._local.conn = (sock, sock.makefile('rb'), os.getpid())
+        try:
+            if self.password:
+                self.command('AUTH', self.password)
+            if self.db:
+                self.command('SELECT', self.db)
+        except Exception:
+            self._close()
+            raise
+        return conn
+
+    def _close(self):
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None and conn[2] == os.getpid():
+            try:
+                conn[1].close()
+                conn[0].close()
+            except OSError:
+                pass
+
+
+def encode_command(args):
+    """Encode a command as a RESP array of bulk strings"""
+    out = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(out)
+
+
+def read_reply(stream):
+    """Read one RESP reply from a binary file object"""
+    line = stream.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError("Cache server closed the connection")
+    kind, rest = line[:1], line[1:-2]
+    if kind == b'+':
+        return rest
+    if kind == b'-':
+        raise BackendError(rest.decode(errors='replace'))
+    if kind == b':':
+        return int(rest)
+    if kind == b'$':
+        size = int(rest)
+        if size < 0:
+            return None
+        data = stream.read(size + 2)
+        if len(data) != size + 2:
+            raise ConnectionError("Cache server closed the connection")
+        return data[:-2]
+    if kind == b'*':
+        size = int(rest)
+        return None if size < 0 else [read_reply(stream) for _ in range(size)]
+    raise BackendError(f"Unexpected reply from cache server: {line!r}")
+
+
+def from_url(url):
+    """Build the backend a CACHE_URL names, or None for an empty url
+
+    Raises ValueError for an unknown scheme.
+    """
+    if not url:
+        return None
+    parts = urlsplit(url)
+    if parts.scheme == 'memory':
+        return MemoryBackend()
+    if parts.scheme == 'sqlite':
+        path = unquote(parts.netloc + parts.path)
+        if not path:
+            raise ValueError("sqlite cache URL needs a file path, e.g. sqlite:///tmp/cache.sqlite")
+        return SQLiteBackend(path)
+    if parts.scheme == 'redis':
+        db = parts.path.strip('/')
+        return RedisBackend(parts.hostname or '127.0.0.1', parts.port or 6379,
+                            int(db) if db else 0,
+                            unquote(parts.password) if parts.password else None)
+    raise ValueError(f"Unsupported CACHE_URL scheme: {parts.scheme!r}")
+
+
+class SharedTier:
+    """One named cache's view of a backend
+
+    Values are stored with `dumps(value) -> bytes` and read back with
+    `loads(bytes) -> value` (JSON by default), behind an expiry stamp so the
+    reader keeps the writer's deadline. Backend failures never reach the
+    request: they count as misses, and the backend is skipped for
+    CACHE_RETRY_AFTER seconds. `shares(key)` picks the keys worth sharing.
+    """
+
+    def __init__(self, backend, name, dumps=None, loads=None, shares=None):
+        self.backend = backend
+        self.name = name
+        self.dumps = dumps or (lambda value: json.dumps(value, separators=(',', ':')).encode())
+        self.loads = loads or json.loads
+        self.shares = shares or (lambda key: True)
+        self._down_until = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    def key(self, key):
+        return f"{CACHE_PREFIX}:{self.name}:{json.dumps(key, separators=(',', ':'))}"
+
+    def get(self, key):
+        """Return (value, expires_at) from the backend, or None"""
+        if not self.shares(key):
+            return None
+        _, data = self._call(self.backend.get, self.key(key))
+        if data is not None:
+            stamp, _, body = data.partition(b'\n')
+            try:
+                expires_at = float(stamp)
+                value = self.loads(body)
+            except (ValueError, TypeError) as e:
+                log.warning("Dropping unreadable %s cache entry: %s", self.name, e)
+                self._call(self.backend.delete, self.key(key))
+                data = None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return value, expires_at
+
+    def set(self, key, value, ttl):
+        if ttl <= 0 or not self.shares(key):
+            return
+        expires_at = time.time() + ttl
+        data = b'%.3f\n' % expires_at + self.dumps(value)
+        ok, _ = self._call(self.backend.set, self.key(key), data, ttl)
+        if ok:
+            with self._lock:
+                self.writes += 1
+
+    def claim(self, key):
+        """Try to become the one process that loads key
+
+        Returns a token if this process now holds the lease, which lapses
+        after CACHE_LEASE seconds or on release(key, token); False if another
+        process holds it; None if the key is not shared or the backend is
+        down, so a dead cache never blocks a load (the caller loads without
+        a lease).
+        """
+        if not self.shares(key):
+            return None
+        token = os.urandom(16).hex().encode()
+        ok, claimed = self._call(self.backend.add, self.key(key) + ':lease', token, CACHE_LEASE)
+        if not ok:
+            return None
+        return token if claimed else False
+
+    def release(self, key, token):
+        """Give up the lease claim() returned token for
+
+        A lease that lapsed and was claimed by another process since is
+        left alone.
+        """
+        if token and self.shares(key):
+            self._call(self.backend.delete_if, self.key(key) + ':lease', token)
+
+    def wait(self, key, timeout=None, interval=0.05, accept=None):
+        """Poll for the value another process is loading
+
+        Returns (found, token). found is the value as get() returns it, or
+        None once the other load gave up, the backend fails, or timeout
+        (default CACHE_LEASE) passes; token is set if this process took
+        over the lease, as from claim(). A value for which accept(value) is
+        false (e.g. the old one being replaced) counts as not there yet.
+        """
+        deadline = time.time() + (CACHE_LEASE if timeout is None else timeout)
+        while time.time() < deadline:
+            time.sleep(interval)
+            found = self.get(key)
+            if found is not None and (accept is None or accept(found[0])):
+                return found, None
+            token = self.claim(key)
+            if token is not False:
+                return None, token
+            interval = min(interval * 2, 0.5)
+        return None, None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": type(self.backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "errors": self.errors,
+                "down": self._down_until > time.time(),
+            }
+
+    def _call(self, method, *args):
+        """Run a backend call; returns (ok, result), with ok False if the
+        backend is down or the call failed"""
+        if self._down_until:
+            if time.time() < self._down_until:
+                return False, None
+            self._down_until = 0
+        try:
+            return True, method(*args)
+        except Exception as e:
+            with self._lock:
+                self.errors += 1
+            self._down_until = time.time() + CACHE_RETRY_AFTER
+            log.warning("%s cache backend failed, skipping it for %ss: %s",
+                        self.name, CACHE_RETRY_AFTER, e)
+            return False, None
+
+
+BACKEND = from_url(CACHE_URL)
+
+
+def shared(name, **kwargs):
+    """SharedTier for the named cache on the configured backend, or None"""
+    if BACKEND is None:
+        return None
+    return SharedTier(BACKEND, name, **kwargs)
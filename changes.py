@@ -0,0 +1,96 @@
+# Change tracking between successive pulls of the same observation query
+# Every newly loaded ObservationSet is diffed against the previous one for
+# its query; the diffs are kept in a short log per query so clients holding
+# a sync token (the digest of the data they have) can fetch only what
+# changed since.
+
+import os
+import threading
+from collections import OrderedDict, deque
+
+from observation_store import natural_key
+
+# Diffs kept per query; older tokens get a full reset
+CHANGE_LOG_SIZE = int(os.environ.get('CHANGE_LOG_SIZE', 20))
+CHANGE_LOG_MAX_QUERIES = 256
+
+
+def diff_rows(old_rows, new_rows):
+    """Return (upserts, removed): {natural key: row} maps from old to new
+
+    A row counts as changed when any field differs, e.g. an updated count.
+    """
+    old = {natural_key(row): row for row in old_rows}
+    upserts = {}
+    for row in new_rows:
+        key = natural_key(row)
+        if old.pop(key, None) != row:
+            upserts[key] = row
+    return upserts, old
+
+
+class ChangeLog:
+    """The last CHANGE_LOG_SIZE diffs of one query, keyed by data digest"""
+
+    def __init__(self, obs_set, max_entries=CHANGE_LOG_SIZE):
+        self.current = obs_set
+        self.entries = deque(maxlen=max_entries)  # (from_digest, upserts, removed)
+
+    def record(self, obs_set):
+        if obs_set.digest == self.current.digest:
+            self.current = obs_set
+            return
+        upserts, removed = diff_rows(self.current.observations, obs_set.observations)
+        self.entries.append((self.current.digest, upserts, removed))
+        self.current = obs_set
+
+    def since(self, digest):
+        """Return (upserts, removed) from digest to the current data
+
+        None if digest is not in the log (too old, or never served).
+        """
+        if digest == self.current.digest:
+            return {}, {}
+        entries = list(self.entries)
+        for start, (from_digest, _, _) in enumerate(entries):
+            if from_digest == digest:
+                break
+        else:
+            return None
+        upserts, removed = {}, {}
+        for _, step_upserts, step_removed in entries[start:]:
+            for key, row in step_upserts.items():
+                upserts[key] = row
+                removed.pop(key, None)
+            for key, row in step_removed.items():
+                removed[key] = row
+                upserts.pop(key, None)
+        return upserts, removed
+
+
+class ChangeTracker:
+    """ChangeLogs for the most recently loaded queries"""
+
+    def __init__(self, max_queries=CHANGE_LOG_MAX_QUERIES):
+        self.max_queries = max_queries
+        self._logs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, key, obs_set):
+        """Note a freshly loaded ObservationSet for a normalized query key"""
+        obs_set.digest  # Hash outside the lock
+        with self._lock:
+            log = self._logs.get(key)
+            if log is None:
+                self._logs[key] = ChangeLog(obs_set)
+                while len(self._logs) > self.max_queries:
+                    self._logs.popitem(last=False)
+            else:
+                log.record(obs_set)
+                self._logs.move_to_end(key)
+
+    def since(self, key, digest):
+        """Return (upserts, removed) for a query since digest, or None"""
+        with self._lock:
+            log = self._logs.get(key)
+            return None if log is None else log.since(digest)
@@ -0,0 +1,83 @@
+# Columnar wire format for observation lists (?format=columnar)
+# Instead of one dict per row repeating the same eight keys, each field is
+# sent as a parallel array. Species and location names are dictionary-
+# encoded, and coordinates are packed float32 pairs sent as base64, which
+# the browser reads straight into a Float32Array.
+
+import base64
+import math
+import sys
+from array import array
+
+FORMATS = ("rows", "columnar")
+
+
+def parse_format(value):
+    """Validate a ?format= value; raises ValueError"""
+    value = (value or "rows").strip().lower()
+    if value not in FORMATS:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+    return value
+
+
+def encode_observations(observations):
+    """Encode normalized observation dicts as parallel arrays
+
+    Row i is species[columns.species[i]], locations[columns.location[i]],
+    columns.observation_date[i], columns.count[i] and the float32 pair at
+    coordinates[2i:2i+2] (lat, lng; NaN when missing). float32 keeps
+    coordinates to within a metre, which is plenty for map pins.
+    """
+    species = {"species_code": [], "common_name": [], "scientific_name": []}
+    species_ids = {}
+    locations = []
+    location_ids = {}
+    species_column = []
+    location_column = []
+    dates = []
+    counts = []
+    coordinates = array("f")
+
+    for obs in observations:
+        key = (obs["species_code"], obs["common_name"], obs["scientific_name"])
+        species_id = species_ids.get(key)
+        if species_id is None:
+            species_id = species_ids[key] = len(species_ids)
+            species["species_code"].append(key[0])
+            species["common_name"].append(key[1])
+            species["scientific_name"].append(key[2])
+        species_column.append(species_id)
+
+        location = obs["location_name"]
+        location_id = location_ids.get(location)
+        if location_id is None:
+            location_id = location_ids[location] = len(locations)
+            locations.append(location)
+        location_column.append(location_id)
+
+        dates.append(obs["observation_date"])
+        counts.append(obs["count"])
+        lat, lng = obs["latitude"], obs["longitude"]
+        coordinates.append(math.nan if lat is None else lat)
+        coordinates.append(math.nan if lng is None else lng)
+
+    if sys.byteorder == "big":
+        coordinates.byteswap()  # Float32Array reads little-endian
+    return {
+        "format": "columnar",
+        "length": len(species_column),
+        "species": species,
+        "locations": locations,
+        "columns": {
+            "species": species_column,
+            "location": location_column,
+            "observation_date": dates,
+            "count": counts,
+            "coordinates": base64.b64encode(coordinates.tobytes()).decode("ascii"),
+        },
+    }
+
+
+def encode(observations, fmt):
+    """Return observations in the requested wire format"""
+    return encode_observations(observations) if fmt == "columnar" else observations
@@ -0,0 +1,862 @@
+# Shared eBird access for the Flask app and the Vercel functions
+# Fetches and normalizes recent observations, backed by a TTL cache
+
+import base64
+import hashlib
+import io
+import itertools
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+import cache_backends
+import changes
+import columnar
+import last_good
+import logs
+import observation_store
+import upstream
+from cache import TTLCache, register
+from payload import Payload
+from spatial import GridClusters, GridIndex
+
+# Overridable so benchmarks can point at a local stand-in
+EBIRD_BASE = os.environ.get('EBIRD_BASE_URL', "https://api.ebird.org/v2")
+UA = "FlycatcherApp/1.0 (+https://example.local)"
+
+log = logs.get_logger(__name__)
+
+# Observation cache settings (override with environment variables)
+OBSERVATION_CACHE_TTL = int(os.environ.get('OBSERVATION_CACHE_TTL', 300))  # 5 minutes
+OBSERVATION_CACHE_MAX_ENTRIES = int(os.environ.get('OBSERVATION_CACHE_MAX_ENTRIES', 256))
+OBSERVATION_CACHE_MAX_BYTES = int(os.environ.get('OBSERVATION_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# While eBird fails for a query, its last good copy is cached this long
+# before eBird is tried again (in the background)
+STALE_RETRY_AFTER = int(os.environ.get('STALE_RETRY_AFTER', 30))
+
+
+# Multi-region requests: at most MAX_REGIONS per request, fetched by at most
+# REGION_FANOUT_WORKERS threads across the whole process
+MAX_REGIONS = int(os.environ.get('MAX_REGIONS', 10))
+REGION_FANOUT_WORKERS = int(os.environ.get('REGION_FANOUT_WORKERS', 8))
+
+# Paged observation queries (bbox=, limit=, cursor=)
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 10000
+
+
+class EBirdError(Exception):
+    """eBird answered with a non-200 status"""
+
+    def __init__(self, status, text=""):
+        super().__init__(f"eBird API error: {status}")
+        self.status = status
+        self.text = text
+
+
+class ObservationSet:
+    """One cached eBird query: the normalized rows and a spatial index
+
+    The index and per-species counts are built once when the rows are
+    ingested; the index shares the row dicts with `observations`. `version`
+    is unique per set, so derived data can be cached against it. A `stale`
+    set is a last-known-good copy served while eBird fails; `fetched_at` is
+    when its rows came from eBird.
+    """
+
+    def __init__(self, observations, fetched_at=None, stale=False):
+        self.observations = observations
+        self.fetched_at = fetched_at or time.time()
+        self.stale = stale
+        self.index = GridIndex(observations)
+        self.species_counts = Counter(obs["species_code"] for obs in observations)
+        self.version = next(_set_versions)
+        self._payloads = {}
+        self._digest = None
+
+    def payload(self, fmt="rows"):
+        """The encoded {"observations": ...} response body in a wire format
+
+        Built on first use per format (see columnar.FORMATS).
+        """
+        payload = self._payloads.get(fmt)
+        if payload is None:
+            body = {"observations": columnar.encode(self.observations, fmt)}
+            if self.stale:
+                body.update(stale=True, fetched_at=int(self.fetched_at))
+            payload = self._payloads[fmt] = Payload(body)
+        return payload
+
+    def age(self):
+        """Seconds since the rows came from eBird"""
+        return max(0, int(time.time() - self.fetched_at))
+
+    @property
+    def digest(self):
+        """Content hash of the rows, equal in every process for the same data"""
+        if self._digest is None:
+            data = json.dumps(self.observations, separators=(',', ':')).encode()
+            self._digest = hashlib.sha1(data).hexdigest()[:16]
+        return self._digest
+
+
+_set_versions = itertools.count(1)
+
+
+def _json_size(value):
+    """Approximate the memory cost of a cached value by its JSON size"""
+    return len(json.dumps(value, separators=(',', ':')))
+
+
+OBSERVATION_CACHE = register("observations", TTLCache(
+    ttl=OBSERVATION_CACHE_TTL,
+    max_entries=OBSERVATION_CACHE_MAX_ENTRIES,
+    max_bytes=OBSERVATION_CACHE_MAX_BYTES,
+    sizer=lambda obs_set: _json_size(obs_set.observations),
+    ttl_for=lambda obs_set: STALE_RETRY_AFTER if obs_set.stale else OBSERVATION_CACHE_TTL,
+    # Regions in the local store are already shared through its file
+    shared=cache_backends.shared(
+        "observations",
+        dumps=lambda obs_set: json.dumps(
+            [obs_set.observations, obs_set.fetched_at, obs_set.stale], separators=(',', ':')).encode(),
+        loads=lambda data: ObservationSet(*json.loads(data)),
+        shares=lambda key: not _stored(key[0])),
+))
+
+# Encoded multi-region bodies, keyed by the versions of the sets they merge
+MERGED_PAYLOAD_CACHE = register("merged_payloads", TTLCache(
+    ttl=OBSERVATION_CACHE_TTL,
+    max_entries=64,
+    max_bytes=OBSERVATION_CACHE_MAX_BYTES // 4,
+    sizer=len,
+))
+
+# Marker clusters, keyed by zoom and the versions of the sets they cover
+CLUSTER_CACHE = register("clusters", TTLCache(
+    ttl=OBSERVATION_CACHE_TTL,
+    max_entries=256,
+))
+
+
+# Diffs between successive loads of each query, for ?since= requests
+CHANGES = changes.ChangeTracker()
+
+# Optional local store kept up to date by the ingestion poller
+OBSERVATION_STORE = None
+if observation_store.OBSERVATION_STORE_PATH:
+    OBSERVATION_STORE = register("observation_store", observation_store.ObservationStore(
+        observation_store.OBSERVATION_STORE_PATH))
+
+
+def _stored(region):
+    return OBSERVATION_STORE is not None and OBSERVATION_STORE.covers(region)
+
+
+# Last good rows of every query, for when eBird fails (None if disabled)
+LAST_GOOD = last_good.open_default()
+if LAST_GOOD is not None:
+    register("last_good", LAST_GOOD)
+
+_failing = {}  # query key -> time eBird last failed for it
+_refreshing = set()
+_fallback_lock = threading.Lock()
+
+
+def normalize_query(region, back, max_results):
+    """Return the canonical (region, back, maxResults) cache key
+
+    Raises ValueError if back or maxResults are not integers.
+    """
+    region = (region or "").strip().upper()
+    if not region:
+        raise ValueError("region is required")
+    # eBird accepts 1-30 days; the local store keeps history for longer
+    max_back = observation_store.RETENTION_DAYS if _stored(region) else 30
+    back = min(max(int(back), 1), max_back)
+    max_results = min(max(int(max_results), 1), 10000)  # eBird caps at 10000
+    return region, back, max_results
+
+
+def normalize_observation(item):
+    """Convert one eBird observation into the app's JSON shape"""
+    return {
+        "species_code": item.get("speciesCode"),
+        "common_name": item.get("comName"),
+        "scientific_name": item.get("sciName"),
+        "observation_date": item.get("obsDt"),
+        "latitude": item.get("lat"),
+        "longitude": item.get("lng"),
+        "count": item.get("howMany"),
+        "location_name": item.get("locName"),
+    }
+
+
+def _recent_request(api_key, region, back, max_results):
+    """URL, params and headers for eBird's recent observations of a region"""
+    url = f"{EBIRD_BASE}/data/obs/{region}/recent"
+    params = {
+        'back': back,
+        'maxResults': max_results
+    }
+    headers = {
+        "X-eBirdApiToken": api_key,
+        "Accept": "application/json",
+        "User-Agent": UA,
+    }
+    return url, params, headers
+
+
+def fetch_recent_observations(api_key, region, back, max_results):
+    """Fetch recent observations for a region straight from eBird
+
+    Raises EBirdError on a non-200 response and requests.RequestException
+    on network errors.
+    """
+    url, params, headers = _recent_request(api_key, region, back, max_results)
+    r = upstream.get(url, params=params, headers=headers, timeout=20)
+    if r.status_code != 200:
+        raise EBirdError(r.status_code, r.text)
+    return [normalize_observation(item) for item in r.json()]
+
+
+def iter_json_array(text, chunk_size=64 * 1024):
+    """Yield the elements of a JSON array of objects read from a text stream
+
+    Only about one chunk is held in memory at a time. Raises ValueError
+    for anything that is not a well-formed array.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos = "", 0
+    state = "start"  # start -> first -> (value -> after)*
+    while True:
+        while True:
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buffer):
+                break
+            chunk = text.read(chunk_size)
+            if not chunk:
+                raise ValueError("truncated JSON array")
+            buffer, pos = buffer[pos:] + chunk, 0
+
+        char = buffer[pos]
+        if state == "start":
+            if char != "[":
+                raise ValueError("expected a JSON array")
+            pos += 1
+            state = "first"
+            continue
+        if char == "]" and state in ("first", "after"):
+            return
+        if state == "after":
+            if char != ",":
+                raise ValueError("expected ',' or ']' in JSON array")
+            pos += 1
+            state = "value"
+            continue
+
+        while True:
+            try:
+                value, pos = decoder.raw_decode(buffer, pos)
+                break
+            except json.JSONDecodeError:
+                # The element continues in the next chunk
+                chunk = text.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer, pos = buffer[pos:] + chunk, 0
+        yield value
+        state = "after"
+
+
+def stream_recent_observations(api_key, region, back, max_results):
+    """Yield a region's normalized observations as eBird's response downloads
+
+    Raises EBirdError on a non-200 response and requests.RequestException
+    on network errors; both surface on the first iteration.
+    """
+    url, params, headers = _recent_request(api_key, region, back, max_results)
+    with upstream.get(url, params=params, headers=headers, timeout=20, stream=True) as r:
+        if r.status_code != 200:
+            raise EBirdError(r.status_code, r.text)
+        r.raw.decode_content = True  # Let urllib3 undo any gzip encoding
+        text = io.TextIOWrapper(r.raw, encoding=r.encoding or "utf-8")
+        for item in iter_json_array(text):
+            yield normalize_observation(item)
+
+
+def load_observations(api_key, region, back, max_results):
+    """Rows for a normalized query: from the local store once the poller has
+    ingested the region, otherwise straight from eBird"""
+    if _stored(region):
+        return OBSERVATION_STORE.recent(region, back, max_results)
+    return fetch_recent_observations(api_key, region, back, max_results)
+
+
+def load_observation_set(api_key, key):
+    """ObservationSet for a normalized query, falling back to its last
+    known good copy when eBird fails
+
+    Once eBird has failed for a query, the stale copy is returned straight
+    away and eBird is retried in a background thread, so requests do not
+    wait on an outage. Raises EBirdError or requests.RequestException only
+    if there is no usable copy.
+    """
+    if LAST_GOOD is None or _stored(key[0]):
+        return ObservationSet(load_observations(api_key, *key))
+    with _fallback_lock:
+        failing = key in _failing
+    if failing:
+        stale = _last_good_set(key)
+        if stale is not None:
+            _refresh_in_background(api_key, key)
+            return stale
+    try:
+        rows = fetch_recent_observations(api_key, *key)
+    except (EBirdError, upstream.RequestException, ValueError) as e:
+        stale = _last_good_set(key)
+        if stale is None:
+            raise
+        with _fallback_lock:
+            _failing[key] = time.time()
+        log.warning("eBird failed for %s, serving data from %ds ago: %s", key[0], stale.age(), e)
+        return stale
+    return _loaded(key, rows)
+
+
+def _loaded(key, rows):
+    """Record freshly fetched rows as the query's last good copy"""
+    with _fallback_lock:
+        _failing.pop(key, None)
+    LAST_GOOD.put("observations", key, rows)
+    return ObservationSet(rows)
+
+
+def _last_good_set(key):
+    found = LAST_GOOD.get("observations", key)
+    if found is None:
+        return None
+    rows, fetched_at = found
+    return ObservationSet(rows, fetched_at, stale=True)
+
+
+def _refresh_in_background(api_key, key):
+    with _fallback_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    threading.Thread(target=_background_refresh, args=(api_key, key), daemon=True).start()
+
+
+def _background_refresh(api_key, key):
+    try:
+        rows = fetch_recent_observations(api_key, *key)
+    except Exception as e:
+        log.debug("Background refresh of %s failed: %s", key[0], e)
+        return
+    finally:
+        with _fallback_lock:
+            _refreshing.discard(key)
+    obs_set = _loaded(key, rows)
+    CHANGES.record(key, obs_set)
+    OBSERVATION_CACHE.set(key, obs_set)
+    log.info("eBird recovered for %s", key[0])
+
+
+def get_observation_set(api_key, region, back, max_results):
+    """Return (ObservationSet, cache_status) for one query, cached
+
+    cache_status is "HIT", "MISS", "COALESCED", "SHARED" (loaded by
+    another worker) or "STALE" (a last good copy, see load_observation_set).
+    Concurrent misses for the same query share one load. Raises ValueError
+    for invalid query values.
+    """
+    key = normalize_query(region, back, max_results)
+
+    def load():
+        obs_set = load_observation_set(api_key, key)
+        if not obs_set.stale:
+            CHANGES.record(key, obs_set)
+        return obs_set
+
+    obs_set, cache_status = OBSERVATION_CACHE.get_or_load(key, load)
+    if obs_set.stale:
+        return obs_set, "STALE"
+    if cache_status == "SHARED":
+        CHANGES.record(key, obs_set)
+    return obs_set, cache_status
+
+
+def peek_observation_set(region, back, max_results):
+    """Return the cached ObservationSet for a query, or None; never fetches"""
+    try:
+        key = normalize_query(region, back, max_results)
+    except ValueError:
+        return None
+    return OBSERVATION_CACHE.peek(key)
+
+
+def cached_species_counts(regions, back, max_results):
+    """Sum per-species observation counts over the cached sets for regions
+
+    Returns None when none of the regions is cached; nothing is fetched.
+    """
+    counts = None
+    for region in regions:
+        obs_set = peek_observation_set(region, back, max_results)
+        if obs_set is not None:
+            counts = (counts or Counter()) + obs_set.species_counts
+    return counts
+
+
+def get_recent_observations(api_key, region, back, max_results):
+    """Return (observations, cache_status), served from the cache when possible"""
+    obs_set, cache_status = get_observation_set(api_key, region, back, max_results)
+    return obs_set.observations, cache_status
+
+
+_poller = None
+
+
+def start_ingestion(api_key):
+    """Start the ingestion poller for INGEST_REGIONS, once per process
+
+    Does nothing unless OBSERVATION_STORE_PATH and INGEST_REGIONS are set.
+    Each ingested region's cached query results are dropped, so the next
+    request reads the new rows from the store. Several processes may call
+    this; a lock file next to the store lets only one of them ingest.
+    """
+    global _poller
+    regions = [r.strip().upper() for r in observation_store.INGEST_REGIONS.split(',') if r.strip()]
+    if _poller is not None or OBSERVATION_STORE is None or not regions or not api_key:
+        return _poller
+    _poller = observation_store.IngestionPoller(
+        OBSERVATION_STORE, regions,
+        fetch=lambda region: fetch_recent_observations(
+            api_key, region, observation_store.INGEST_BACK, observation_store.INGEST_MAX_RESULTS),
+        on_ingested=lambda region: OBSERVATION_CACHE.invalidate(lambda key: key[0] == region),
+        lock_path=OBSERVATION_STORE.path + ".ingest-lock",
+    ).start()
+    log.info("Ingesting %s every %ds", ", ".join(regions), observation_store.INGEST_INTERVAL)
+    return _poller
+
+
+def stop_ingestion(timeout=10):
+    """Stop this process's ingestion poller, letting another worker take over"""
+    global _poller
+    if _poller is not None:
+        _poller.stop(timeout)
+        _poller = None
+
+
+def parse_regions(value):
+    """Split "ZA,NA,BW" into a de-duplicated list of region codes
+
+    Raises ValueError if there are no regions or more than MAX_REGIONS.
+    """
+    regions = list(dict.fromkeys(r.strip().upper() for r in (value or "").split(',') if r.strip()))
+    if not regions:
+        raise ValueError("region is required")
+    if len(regions) > MAX_REGIONS:
+        raise ValueError(f"at most {MAX_REGIONS} regions per request")
+    return regions
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _fanout_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Imported here: single-region requests never need it
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=REGION_FANOUT_WORKERS,
+                                           thread_name_prefix="ebird-region")
+        return _executor
+
+
+def _observation_key(obs):
+    return (obs["species_code"], obs["observation_date"], obs["latitude"],
+            obs["longitude"], obs["location_name"], obs["count"])
+
+
+def get_observation_sets(api_key, regions, back, max_results):
+    """Fetch the ObservationSet of several regions concurrently
+
+    Each region goes through the observation cache on its own, so total
+    latency is that of the slowest region. Returns (sets, report): sets is
+    a list of (region, ObservationSet) for the regions that loaded, and
+    report maps every region to its cache status or error, so one failing
+    region does not fail the request. Raises ValueError for invalid query
+    values.
+    """
+    keys = [normalize_query(region, back, max_results) for region in regions]
+    futures = [
+        _fanout_executor().submit(get_observation_set, api_key, *key)
+        for key in keys
+    ]
+
+    sets = []
+    report = {}
+    for (region, _, _), future in zip(keys, futures):
+        try:
+            obs_set, cache_status = future.result()
+        except (EBirdError, upstream.RequestException) as e:
+            report[region] = region_error(e)
+            continue
+        sets.append((region, obs_set))
+        report[region] = {"ok": True, "count": len(obs_set.observations), "cache": cache_status}
+        if obs_set.stale:
+            report[region].update(stale=True, fetched_at=int(obs_set.fetched_at))
+    return sets, report
+
+
+def region_error(e):
+    """Report entry for a region that failed with an EBirdError or a
+    requests exception
+
+    While eBird's circuit is open (UpstreamUnavailable) the entry has
+    status 503 and retry_after, the seconds until eBird may be tried again.
+    """
+    if isinstance(e, EBirdError):
+        return {"ok": False, "error": f"eBird API error: {e.status}", "status": e.status}
+    if isinstance(e, upstream.UpstreamUnavailable):
+        return {"ok": False, "error": "eBird is temporarily unavailable", "detail": str(e),
+                "status": 503, "retry_after": e.retry_after}
+    return {"ok": False, "error": "Network error contacting eBird", "detail": str(e)}
+
+
+def stale_age(report):
+    """Age in seconds of the oldest stale region in a report, or None"""
+    fetched = [entry["fetched_at"] for entry in report.values() if entry.get("stale")]
+    if not fetched:
+        return None
+    return max(0, int(time.time() - min(fetched)))
+
+
+def merge_rows(row_lists):
+    """Merge lists of observation rows into one list, newest first
+
+    Observations that appear in more than one list (e.g. a country and one
+    of its subregions) are kept once. Returns (merged, added) where added[i]
+    is the number of rows list i contributed.
+    """
+    merged = []
+    added = []
+    seen = set()
+    for rows in row_lists:
+        count = 0
+        for obs in rows:
+            key = _observation_key(obs)
+            if key not in seen:
+                seen.add(key)
+                merged.append(obs)
+                count += 1
+        added.append(count)
+
+    merged.sort(key=lambda obs: obs["observation_date"] or "", reverse=True)
+    return merged, added
+
+
+def merge_observation_sets(sets, report=None):
+    """Merge (region, ObservationSet) pairs into one list, newest first
+
+    See merge_rows; if given, each region's report entry gets the number
+    of rows it "added".
+    """
+    merged, added = merge_rows([obs_set.observations for _, obs_set in sets])
+    if report is not None:
+        for (region, _), count in zip(sets, added):
+            report[region]["added"] = count
+    return merged
+
+
+def get_observations_for_regions(api_key, regions, back, max_results):
+    """Fetch several regions concurrently and merge them into one list
+
+    Returns (observations, report) as described in get_observation_sets
+    and merge_observation_sets.
+    """
+    sets, report = get_observation_sets(api_key, regions, back, max_results)
+    return merge_observation_sets(sets, report), report
+
+
+def get_merged_payload(api_key, regions, back, max_results, fmt="rows"):
+    """Return (Payload, sync token, report) for a multi-region observations request
+
+    The merged body is encoded once per combination of cached region sets
+    and reused until one of them is refetched. Per-region cache statuses
+    stay out of the body (see cache_header) so that its ETag only changes
+    with the data. fmt is one of columnar.FORMATS. Payload is None when
+    every region failed; bodies with a failed region are not cached.
+    """
+    sets, report = get_observation_sets(api_key, regions, back, max_results)
+    if not sets:
+        return None, None, report
+
+    def build():
+        merged = merge_observation_sets(sets, report)
+        body_report = {
+            region: {k: v for k, v in entry.items() if k != "cache"}
+            for region, entry in report.items()
+        }
+        return Payload({"observations": columnar.encode(merged, fmt), "regions": body_report})
+
+    if len(sets) < len(report):
+        return build(), sync_token(sets), report
+    key = (fmt,) + tuple((region, obs_set.version) for region, obs_set in sets)
+    payload, _ = MERGED_PAYLOAD_CACHE.get_or_load(key, build)
+    return payload, sync_token(sets), report
+
+
+def get_clusters(api_key, regions, back, max_results, zoom):
+    """Return (GridClusters, report) for regions at a map zoom level
+
+    Clustering runs once per zoom and combination of cached region sets,
+    so panning the map only filters precomputed clusters. GridClusters is
+    None when every region failed.
+    """
+    sets, report = get_observation_sets(api_key, regions, back, max_results)
+    if not sets:
+        return None, report
+
+    def build():
+        rows = sets[0][1].observations if len(sets) == 1 else merge_observation_sets(sets)
+        return GridClusters(rows, zoom)
+
+    key = (zoom,) + tuple((region, obs_set.version) for region, obs_set in sets)
+    clusters, _ = CLUSTER_CACHE.get_or_load(key, build)
+    return clusters, report
+
+
+def parse_page_size(value):
+    """Validate a ?limit= page size; raises ValueError"""
+    if value in (None, ""):
+        return DEFAULT_PAGE_SIZE
+    return min(max(int(value), 1), MAX_PAGE_SIZE)
+
+
+def _cursor_scope(sets, bbox):
+    """Identify the filtered list a cursor points into"""
+    digests = ",".join(f"{region}:{obs_set.digest}" for region, obs_set in sets)
+    return hashlib.sha1(f"{digests}|{bbox}".encode()).hexdigest()[:12]
+
+
+def encode_cursor(scope, offset):
+    return base64.urlsafe_b64encode(f"{scope}:{offset}".encode()).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor, scope):
+    """Return the offset in a cursor; raises ValueError if it is malformed
+    or was issued for other data or another bbox"""
+    if not cursor:
+        return 0
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("ascii")
+        cursor_scope, offset = text.split(":")
+        offset = int(offset)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("malformed cursor")
+    if cursor_scope != scope or offset < 0:
+        raise ValueError("cursor has expired; the data or bbox changed, start again without it")
+    return offset
+
+
+def get_observation_page(api_key, regions, back, max_results, bbox=None, cursor=None,
+                         limit=DEFAULT_PAGE_SIZE):
+    """Return (page, report) for a bbox-filtered, paginated observations query
+
+    Rows inside bbox (everything if None) are found through each set's
+    grid index, merged across regions like get_observations_for_regions,
+    and cut into pages of `limit` rows. page is {"observations", "total",
+    "next_cursor"}, where next_cursor is None on the last page, or None
+    when every region failed. Cursors are tied to the data and bbox they
+    were issued for, so they stay valid across processes but expire when a
+    region is refetched with new data. Raises ValueError for invalid query
+    values or a stale cursor.
+    """
+    sets, report = get_observation_sets(api_key, regions, back, max_results)
+    if not sets:
+        return None, report
+
+    row_lists = [
+        obs_set.index.within_bbox(*bbox) if bbox else obs_set.observations
+        for _, obs_set in sets
+    ]
+    rows = row_lists[0] if len(row_lists) == 1 else merge_rows(row_lists)[0]
+
+    scope = _cursor_scope(sets, bbox)
+    offset = decode_cursor(cursor, scope)
+    end = offset + limit
+    page = {
+        "observations": rows[offset:end],
+        "total": len(rows),
+        "next_cursor": encode_cursor(scope, end) if end < len(rows) else None,
+    }
+    return page, report
+
+
+def sync_token(sets):
+    """Opaque token naming the data of each region, for a later ?since="""
+    text = ",".join(f"{region}={obs_set.digest}" for region, obs_set in sets)
+    return base64.urlsafe_b64encode(text.encode()).decode("ascii").rstrip("=")
+
+
+def parse_sync_token(token):
+    """Return {region: digest} from a sync token; raises ValueError"""
+    try:
+        text = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("ascii")
+        return dict(part.split("=", 1) for part in text.split(","))
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("malformed since token")
+
+
+def get_observation_delta(api_key, regions, back, max_results, since):
+    """Return (delta, report): what changed for regions since a sync token
+
+    delta is {"token", "reset", "observations", "removed"}. observations
+    holds the rows added or changed since the token, newest first, and
+    removed the rows that dropped out. When a region's token is older than
+    its change log (or unknown), reset is True and observations is the full
+    merged data, to replace what the client has. delta is None when every
+    region failed. Raises ValueError for invalid query values.
+    """
+    digests = parse_sync_token(since)
+    sets, report = get_observation_sets(api_key, regions, back, max_results)
+    if not sets:
+        return None, report
+
+    upserts, removed = {}, {}
+    for region, obs_set in sets:
+        delta = None
+        if region in digests:
+            delta = CHANGES.since(normalize_query(region, back, max_results), digests[region])
+        if delta is None:
+            rows = sets[0][1].observations if len(sets) == 1 else merge_observation_sets(sets)
+            return {"token": sync_token(sets), "reset": True, "observations": rows, "removed": []}, report
+        upserts.update(delta[0])
+        removed.update(delta[1])
+
+    if removed and len(sets) > 1:
+        # A row that left one region may still be listed under another
+        present = {observation_store.natural_key(obs)
+                   for _, obs_set in sets for obs in obs_set.observations}
+        removed = {key: row for key, row in removed.items() if key not in present}
+    rows = sorted(upserts.values(), key=lambda obs: obs["observation_date"] or "", reverse=True)
+    return {
+        "token": sync_token(sets),
+        "reset": False,
+        "observations": rows,
+        "removed": list(removed.values()),
+    }, report
+
+
+def stream_observations(api_key, regions, back, max_results):
+    """Return a generator of observations for regions, for NDJSON responses
+
+    Query values are validated up front (raises ValueError). Each region
+    is then read from its cached set, the local store, or eBird's response
+    as it is parsed, in that order of preference, so rows can be sent
+    before a region has finished loading. Rows repeated across regions are
+    yielded once; the order is per region rather than merged newest first.
+    Rows fetched from eBird are cached once the region completes. The last
+    item is {"regions": report, "count": n}, with an entry per region as
+    in get_observation_sets.
+    """
+    keys = [normalize_query(region, back, max_results) for region in regions]
+    return _stream_observations(api_key, keys)
+
+
+def _stream_observations(api_key, keys):
+    seen = set()
+    report = {}
+    total = 0
+
+    def emit(rows, fetched=None):
+        # Yields the rows not yet sent for another region; returns how
+        # many rows the region had
+        nonlocal total
+        count = 0
+        for obs in rows:
+            count += 1
+            if fetched is not None:
+                fetched.append(obs)
+            if len(keys) > 1:
+                obs_key = _observation_key(obs)
+                if obs_key in seen:
+                    continue
+                seen.add(obs_key)
+            total += 1
+            yield obs
+        return count
+
+    for key in keys:
+        region = key[0]
+        obs_set = OBSERVATION_CACHE.get(key)
+        if obs_set is None and not _stored(region) and LAST_GOOD is not None and key in _failing:
+            obs_set = _last_good_set(key)
+            if obs_set is not None:
+                _refresh_in_background(api_key, key)
+        if obs_set is not None:
+            rows, source = obs_set.observations, "STALE" if obs_set.stale else "HIT"
+        elif _stored(region):
+            rows, source = OBSERVATION_STORE.iter_recent(*key), "STORE"
+        else:
+            rows, source = stream_recent_observations(api_key, *key), "STREAM"
+
+        fetched = [] if source == "STREAM" else None
+        error = None
+        try:
+            count = yield from emit(rows, fetched)
+        except (EBirdError, upstream.RequestException) as e:
+            error = region_error(e)
+        except ValueError as e:
+            error = {"ok": False, "error": "Malformed eBird response", "detail": str(e)}
+
+        if error is not None:
+            # Rows already sent cannot be taken back; only a stream that
+            # failed before its first row falls back to the last good copy
+            obs_set = _last_good_set(key) if LAST_GOOD is not None and not fetched else None
+            if obs_set is None:
+                report[region] = error
+                continue
+            with _fallback_lock:
+                _failing[key] = time.time()
+            source = "STALE"
+            count = yield from emit(obs_set.observations)
+        elif fetched is not None:
+            obs_set = _loaded(key, fetched) if LAST_GOOD is not None else ObservationSet(fetched)
+            CHANGES.record(key, obs_set)
+            OBSERVATION_CACHE.set(key, obs_set)
+        report[region] = {"ok": True, "count": count, "cache": source}
+        if source == "STALE":
+            report[region].update(stale=True, fetched_at=int(obs_set.fetched_at))
+    yield {"regions": report, "count": total}
+
+
+def cache_header(report):
+    """X-Cache value for a multi-region report: "ZA=HIT, NA=MISS" """
+    return ", ".join(
+        f"{region}={entry['cache']}" for region, entry in report.items() if entry["ok"])
+
+
+def observations_near(obs_sets, lat, lng, radius_km):
+    """Return the observations within radius_km of a point, nearest first
+
+    Uses each set's spatial index, so only cells around the point are
+    scanned. Rows found in more than one set are returned once.
+    """
+    matches = []
+    seen = set()
+    for obs_set in obs_sets:
+        for distance, obs in obs_set.index.within_radius(lat, lng, radius_km):
+            key = _observation_key(obs)
+            if key not in seen:
+                seen.add(key)
+                matches.append((distance, obs))
+    matches.sort(key=lambda match: match[0])
+    return [obs for _, obs in matches]
@@ -0,0 +1,138 @@
+# Cached Google geocoding for the location search
+# Results are keyed on a normalized address, kept in an LRU cache with a
+# long TTL, and optionally persisted to a SQLite file across restarts.
+
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import cache_backends
+import sqlite_files
+import upstream
+from cache import TTLCache, register
+
+GEOCODE_URL = os.environ.get('GEOCODE_URL', "https://maps.googleapis.com/maps/api/geocode/json")
+
+# Geocode cache settings (override with environment variables)
+GEOCODE_CACHE_TTL = int(os.environ.get('GEOCODE_CACHE_TTL', 30 * 24 * 3600))  # 30 days
+GEOCODE_NEGATIVE_TTL = int(os.environ.get('GEOCODE_NEGATIVE_TTL', 24 * 3600))  # 1 day
+GEOCODE_CACHE_MAX_ENTRIES = int(os.environ.get('GEOCODE_CACHE_MAX_ENTRIES', 5000))
+# Set to a file path to keep geocode results across restarts
+GEOCODE_CACHE_PATH = os.environ.get('GEOCODE_CACHE_PATH', '')
+
+
+def normalize_address(address):
+    """Reduce an address to a cache key: "  Cape  Town, " -> "cape town" """
+    address = unicodedata.normalize("NFKC", address or "").casefold()
+    address = re.sub(r"\s+", " ", address)
+    return address.strip(" ,.;")
+
+
+def result_ttl(result):
+    """Cache hits for a long time, ZERO_RESULTS for a day, nothing else"""
+    if result.get("success"):
+        return GEOCODE_CACHE_TTL
+    if result.get("status") == "ZERO_RESULTS":
+        return GEOCODE_NEGATIVE_TTL
+    return 0  # Quota or key errors must not stick
+
+
+class GeocodeStore:
+    """SQLite file holding geocode results with their expiry times"""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite_files.ProcessConnection(path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode "
+                "(address TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)")
+            self._conn.execute("DELETE FROM geocode WHERE expires_at <= ?", (time.time(),))
+            self._conn.commit()
+
+    def get(self, key):
+        """Return the stored result for key, or None if missing or expired"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result, expires_at FROM geocode WHERE address = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return json.loads(row[0])
+
+    def set(self, key, result, ttl):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO geocode VALUES (?, ?, ?)",
+                (key, json.dumps(result), time.time() + ttl))
+            self._conn.commit()
+
+
+GEOCODE_CACHE = register("geocode", TTLCache(
+    ttl=GEOCODE_CACHE_TTL,
+    max_entries=GEOCODE_CACHE_MAX_ENTRIES,
+    ttl_for=result_ttl,
+    shared=cache_backends.shared("geocode"),
+))
+_store = GeocodeStore(GEOCODE_CACHE_PATH) if GEOCODE_CACHE_PATH else None
+
+
+def fetch_geocode(api_key, address):
+    """Ask Google for the first match for address
+
+    Returns the /api/geocode JSON body. Raises requests.RequestException on
+    network errors, and ValueError or KeyError if the reply is not JSON or
+    lacks the expected fields.
+    """
+    params = {
+        'address': address,
+        'key': api_key
+    }
+    response = upstream.get(GEOCODE_URL, params=params, timeout=10)
+    data = response.json()
+
+    if data.get('status') == 'OK' and data.get('results'):
+        result = data['results'][0]
+        location = result['geometry']['location']
+        return {
+            "success": True,
+            "location": {
+                "lat": location['lat'],
+                "lng": location['lng']
+            },
+            "formatted_address": result['formatted_address']
+        }
+    return {
+        "success": False,
+        "status": data.get('status', 'Unknown error'),
+        "error": f"Geocoding failed: {data.get('status', 'Unknown error')}"
+    }
+
+
+def geocode(api_key, address):
+    """Return (result, cache_status) for address, calling Google on a miss
+
+    Raises ValueError for an empty address.
+    """
+    key = normalize_address(address)
+    if not key:
+        raise ValueError("Address parameter required")
+
+    def load():
+        if _store is not None:
+            stored = _store.get(key)
+            if stored is not None:
+                return stored
+        result = fetch_geocode(api_key, address)
+        ttl = result_ttl(result)
+        if _store is not None and ttl > 0:
+            _store.set(key, result, ttl)
+        return result
+
+    return GEOCODE_CACHE.get_or_load(key, load)
@@ -0,0 +1,51 @@
+# Production server settings: gunicorn -c gunicorn.conf.py app:app
+# Runs several worker processes with a thread pool each. app.py and the eBird
+# taxonomy are loaded once in the master before it forks, so workers start
+# warm and share those pages copy-on-write. SIGTERM stops accepting new
+# connections and lets in-flight requests finish for up to graceful_timeout.
+
+import gc
+import multiprocessing
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get('WEB_THREADS', 8))
+worker_class = 'gthread'
+preload_app = True
+timeout = 60
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+
+def when_ready(server):
+    """In the master, after app.py is loaded and before workers fork"""
+    import app
+    import species_search
+    import taxonomy
+
+    if app.EBIRD_API_KEY:
+        try:
+            table = taxonomy.TAXONOMY.preload(app.EBIRD_API_KEY)
+            species_search.index_for(table)
+        except Exception as e:
+            server.log.warning("Taxonomy preload failed, workers will load it on demand: %s", e)
+    # Keep the preloaded objects out of the cyclic GC, so collections in the
+    # workers do not write to (and so copy) the pages they share
+    gc.freeze()
+    if not os.environ.get('SECRET_KEY'):
+        server.log.warning("SECRET_KEY is not set; login sessions end when the server restarts")
+
+
+def post_fork(server, worker):
+    """Every worker runs an ingestion poller; only one at a time ingests"""
+    import app
+    import ebird
+
+    ebird.start_ingestion(app.EBIRD_API_KEY)
+
+
+def worker_exit(server, worker):
+    import ebird
+
+    ebird.stop_ingestion()
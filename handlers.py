@@ -0,0 +1,409 @@
+# Request handling shared by the Flask app, the Vercel functions and the
+# local api/app.py server
+# Every handler takes its query arguments as anything with .get() (Flask's
+# request.args or a Vercel queryStringParameters dict) and returns a reply
+# (status, body, headers): body is a Payload for a successful JSON answer,
+# a dict for errors, or an iterator of NDJSON bytes for streams. Entry
+# points only translate replies into their framework's response.
+
+import json
+import os
+import time
+
+import columnar
+import ebird
+import payload
+import spatial
+import upstream
+from payload import Payload
+
+EBIRD_API_KEY = os.environ.get('EBIRD_API_KEY')
+GOOGLE_MAPS_API_KEY = os.environ.get('GOOGLE_MAPS_API_KEY', '')
+DEFAULT_REGION = os.environ.get('DEFAULT_REGION', 'ZA')
+
+# The config only changes with the environment, so it is encoded once
+CONFIG_PAYLOAD = Payload({
+    "google_maps_api_key": GOOGLE_MAPS_API_KEY,
+    "map_default_lat": -22.9576,
+    "map_default_lng": 18.4904,
+    "map_default_zoom": 6
+})
+
+MISSING_KEY = (500, {"error": "Server missing EBIRD_API_KEY"}, None)
+
+
+def _invalid(e):
+    return 400, {"error": f"Invalid query: {e}"}, None
+
+
+def _upstream_error(e, label="eBird API error"):
+    """Reply for an EBirdError or a requests exception"""
+    if isinstance(e, ebird.EBirdError):
+        return 502, {"error": f"{label}: {e.status}"}, None
+    if isinstance(e, upstream.UpstreamUnavailable):
+        return 503, {"error": "eBird is temporarily unavailable", "detail": str(e)}, {
+            'Retry-After': str(e.retry_after)}
+    return 502, {"error": "Network error contacting eBird", "detail": str(e)}, None
+
+
+def _failed(regions, report):
+    """Reply when no region could be loaded
+
+    503 with the longest Retry-After when every region failed because
+    eBird's circuit is open, like _upstream_error; otherwise 502.
+    """
+    error = report[regions[0]]["error"] if len(regions) == 1 else "eBird request failed for every region"
+    waits = [entry.get("retry_after") for entry in report.values() if not entry.get("ok")]
+    if waits and None not in waits:
+        return 503, {"error": error, "regions": report}, {'Retry-After': str(max(waits))}
+    return 502, {"error": error, "regions": report}, None
+
+
+def _with_age(headers, age):
+    """Add an Age header when the reply was built from stale data"""
+    if age is None:
+        return headers
+    return {**(headers or {}), 'Age': str(age)}
+
+
+def _flag_stale(body, report):
+    """Mark a single-region body built from stale data; returns its age"""
+    age = ebird.stale_age(report)
+    if age is not None:
+        entry = next(iter(report.values()))
+        body.update(stale=True, fetched_at=entry["fetched_at"])
+    return age
+
+
+def _taxonomy_reply(body):
+    """200 reply for a taxonomy answer, flagged if the table is stale"""
+    import taxonomy
+
+    age = taxonomy.TAXONOMY.stale_age()
+    if age is not None:
+        body.update(stale=True, fetched_at=int(time.time()) - age)
+    return 200, Payload(body), _with_age(None, age)
+
+
+def _query(args):
+    return (args.get('region', DEFAULT_REGION), args.get('back', '7'),
+            args.get('maxResults', '1000'))
+
+
+def config():
+    return 200, CONFIG_PAYLOAD, None
+
+
+def observations(args, accept=None):
+    """eBird recent observations for one or several regions
+
+    region may list several codes (region=ZA,NA,BW); they are fetched
+    concurrently and merged, with a per-region status report. Bodies are
+    encoded once per cached dataset and served with an ETag; format=columnar
+    sends parallel arrays instead of row objects. bbox=, limit= or cursor=
+    switch to paged queries (see observation_page). Replies carry an
+    X-Sync-Token header; since=<token> returns only what changed (see
+    observation_delta). ?stream=1 or Accept: application/x-ndjson streams
+    rows as they load (see observation_stream). When eBird fails, regions
+    fall back to their last good data: the body (or the region's report)
+    says stale: true and the Age header gives its age in seconds.
+    """
+    if not EBIRD_API_KEY:
+        return MISSING_KEY
+    if payload.wants_ndjson(accept, args.get('stream')):
+        return observation_stream(args)
+    if args.get('since'):
+        return observation_delta(args)
+    if any(args.get(name) for name in ('bbox', 'limit', 'cursor')):
+        return observation_page(args)
+
+    region, back, max_results = _query(args)
+    try:
+        fmt = columnar.parse_format(args.get('format'))
+        regions = ebird.parse_regions(region)
+        if len(regions) > 1:
+            body, token, report = ebird.get_merged_payload(
+                EBIRD_API_KEY, regions, back, max_results, fmt)
+        else:
+            obs_set, cache_status = ebird.get_observation_set(
+                EBIRD_API_KEY, regions[0], back, max_results)
+    except ValueError as e:
+        return _invalid(e)
+    except (ebird.EBirdError, upstream.RequestException) as e:
+        return _upstream_error(e)
+
+    if len(regions) > 1:
+        if body is None:
+            return _failed(regions, report)
+        return 200, body, _with_age(
+            {'X-Cache': ebird.cache_header(report), 'X-Sync-Token': token}, ebird.stale_age(report))
+    return 200, obs_set.payload(fmt), _with_age({
+        'X-Cache': cache_status, 'X-Sync-Token': ebird.sync_token([(regions[0], obs_set)])},
+        obs_set.age() if obs_set.stale else None)
+
+
+def observation_stream(args):
+    """NDJSON: one observation per line as each region loads
+
+    The last line is {"regions": {...}, "count": n}. Rows from eBird are
+    parsed and sent as they download, so memory does not grow with the
+    response and markers can be placed before the last region arrives.
+    """
+    region, back, max_results = _query(args)
+    try:
+        regions = ebird.parse_regions(region)
+        rows = ebird.stream_observations(EBIRD_API_KEY, regions, back, max_results)
+    except ValueError as e:
+        return _invalid(e)
+    return 200, payload.ndjson_lines(rows), {'Content-Type': payload.NDJSON_TYPE}
+
+
+def observation_delta(args):
+    """Observations added or changed since a sync token, and those removed
+
+    The body's token is the one to send next time; reset=true means the
+    token was too old and observations holds the full data instead.
+    """
+    region, back, max_results = _query(args)
+    try:
+        fmt = columnar.parse_format(args.get('format'))
+        regions = ebird.parse_regions(region)
+        delta, report = ebird.get_observation_delta(
+            EBIRD_API_KEY, regions, back, max_results, args.get('since'))
+    except ValueError as e:
+        return _invalid(e)
+
+    if delta is None:
+        return _failed(regions, report)
+    delta["observations"] = columnar.encode(delta["observations"], fmt)
+    if len(regions) > 1:
+        delta["regions"] = report
+        age = ebird.stale_age(report)
+    else:
+        age = _flag_stale(delta, report)
+    return 200, Payload(delta), _with_age({'X-Sync-Token': delta["token"]}, age)
+
+
+def observation_page(args):
+    """Observations inside bbox=south,west,north,east, limit= rows at a time
+
+    Filtered server-side through the cached data's grid index. The body
+    carries total and next_cursor; pass cursor=next_cursor for the next page.
+    """
+    region, back, max_results = _query(args)
+    try:
+        fmt = columnar.parse_format(args.get('format'))
+        bbox = spatial.parse_bbox(args.get('bbox'))
+        limit = ebird.parse_page_size(args.get('limit'))
+        regions = ebird.parse_regions(region)
+        page, report = ebird.get_observation_page(
+            EBIRD_API_KEY, regions, back, max_results, bbox, args.get('cursor'), limit)
+    except ValueError as e:
+        return _invalid(e)
+
+    if page is None:
+        return _failed(regions, report)
+    page["observations"] = columnar.encode(page["observations"], fmt)
+    if len(regions) > 1:
+        page["regions"] = report
+        return 200, Payload(page), _with_age(
+            {'X-Cache': ebird.cache_header(report)}, ebird.stale_age(report))
+    age = _flag_stale(page, report)
+    return 200, Payload(page), _with_age({'X-Cache': report[regions[0]]["cache"]}, age)
+
+
+def observations_near(args):
+    """Observations within radius_km (default 10) of lat/lng, nearest first
+
+    Answered from the cached region data through its spatial index.
+    """
+    if not EBIRD_API_KEY:
+        return MISSING_KEY
+    region, back, max_results = _query(args)
+    try:
+        lat, lng, radius_km = spatial.parse_radius_query(
+            args.get('lat'), args.get('lng'), args.get('radius_km', '10'))
+        fmt = columnar.parse_format(args.get('format'))
+        regions = ebird.parse_regions(region)
+        sets, report = ebird.get_observation_sets(EBIRD_API_KEY, regions, back, max_results)
+    except ValueError as e:
+        return _invalid(e)
+
+    if not sets:
+        return _failed(regions, report)
+    matches = ebird.observations_near([obs_set for _, obs_set in sets], lat, lng, radius_km)
+    return 200, Payload({
+        "observations": columnar.encode(matches, fmt), "count": len(matches), "regions": report}
+    ), _with_age(None, ebird.stale_age(report))
+
+
+def observation_clusters(args):
+    """Marker clusters for the visible map: ?bbox=south,west,north,east&zoom=8
+
+    Clusters come from the cached region data, computed once per zoom level.
+    """
+    if not EBIRD_API_KEY:
+        return MISSING_KEY
+    region, back, max_results = _query(args)
+    try:
+        bbox = spatial.parse_bbox(args.get('bbox'))
+        zoom = spatial.parse_zoom(args.get('zoom'))
+        regions = ebird.parse_regions(region)
+        clusters, report = ebird.get_clusters(EBIRD_API_KEY, regions, back, max_results, zoom)
+    except ValueError as e:
+        return _invalid(e)
+
+    if clusters is None:
+        return _failed(regions, report)
+    visible = clusters.within_bbox(bbox)
+    return 200, Payload({
+        "zoom": zoom,
+        "clusters": visible,
+        "count": sum(c["count"] for c in visible),
+        "regions": report,
+    }), _with_age(None, ebird.stale_age(report))
+
+
+def species_info(species_code):
+    """Details for one species from the eBird taxonomy"""
+    if not EBIRD_API_KEY:
+        return MISSING_KEY
+    if not species_code:
+        return 400, {"error": "Species code required"}, None
+    import taxonomy  # the observation functions never load the taxonomy
+
+    try:
+        info = taxonomy.TAXONOMY.lookup(EBIRD_API_KEY, species_code)
+    except (ebird.EBirdError, upstream.RequestException) as e:
+        return _upstream_error(e, "eBird taxonomy API error")
+    return _taxonomy_reply(taxonomy.species_response(species_code, info))
+
+
+def species_batch(codes):
+    """Many species at once, from a list or a comma-separated string of codes"""
+    if not EBIRD_API_KEY:
+        return MISSING_KEY
+    import taxonomy
+
+    try:
+        codes = taxonomy.parse_species_codes(codes or [])
+        results = taxonomy.TAXONOMY.lookup_many(EBIRD_API_KEY, codes)
+    except ValueError as e:
+        return 400, {"error": str(e)}, None
+    except (ebird.EBirdError, upstream.RequestException) as e:
+        return _upstream_error(e, "eBird taxonomy API error")
+    return _taxonomy_reply(taxonomy.batch_response(results))
+
+
+def species_search(args):
+    """Ranked species-name search: ?q=hoopoe[&limit=20][&region=ZA&back=7]"""
+    if not EBIRD_API_KEY:
+        return MISSING_KEY
+    import species_search as search  # builds its index on first use only
+
+    try:
+        results = search.search(
+            EBIRD_API_KEY, args.get('q'), args.get('limit', search.DEFAULT_LIMIT),
+            args.get('region'), args.get('back', '7'), args.get('maxResults', '1000'))
+    except ValueError as e:
+        return _invalid(e)
+    except (ebird.EBirdError, upstream.RequestException) as e:
+        return _upstream_error(e, "eBird taxonomy API error")
+    return 200, Payload(results), None
+
+
+def geocode(args):
+    """Geocode an address with Google Maps (cached per normalized address)"""
+    if not GOOGLE_MAPS_API_KEY:
+        return 500, {"error": "Server missing GOOGLE_MAPS_API_KEY"}, None
+    import geocode as geocoder
+
+    address = args.get('address')
+    if not geocoder.normalize_address(address):
+        return 400, {"error": "Address parameter required"}, None
+    try:
+        result, cache_status = geocoder.geocode(GOOGLE_MAPS_API_KEY, address)
+    except (ValueError, KeyError, TypeError) as e:
+        # Google's reply was not JSON or lacked the expected fields
+        return 502, {"error": "Invalid response from Google Maps", "detail": str(e)}, None
+    except upstream.RequestException as e:
+        return 502, {"error": "Network error contacting Google Maps", "detail": str(e)}, None
+    return 200, Payload(result), {'X-Cache': cache_status}
+
+
+def cache_stats():
+    """Hit/miss counts for the server-side caches"""
+    import cache
+    return 200, Payload(cache.all_stats()), None
+
+
+def upstream_stats():
+    """Call counts and timings for eBird and Google Maps"""
+    return 200, Payload(upstream.stats()), None
+
+
+def posted_codes(body):
+    """Codes from a POSTed JSON body {"codes": [...]}; [] if it is not one"""
+    try:
+        data = json.loads(body or '{}')
+    except ValueError:
+        return []
+    return (data.get('codes') if isinstance(data, dict) else None) or []
+
+
+def route(method, path, args, accept=None, body=None):
+    """Reply for an /api/... request, or None if no handler matches"""
+    path = path.rstrip('/')
+    if path == '/api/species':
+        return species_batch(posted_codes(body) if method == 'POST' else args.get('codes'))
+    if method != 'GET':
+        return None
+    if path == '/api/config':
+        return config()
+    if path == '/api/observations':
+        return observations(args, accept)
+    if path == '/api/observations/near':
+        return observations_near(args)
+    if path == '/api/observations/clusters':
+        return observation_clusters(args)
+    if path == '/api/species/search':
+        return species_search(args)
+    if path.startswith('/api/species/'):
+        return species_info(path.rsplit('/', 1)[1])
+    if path == '/api/geocode':
+        return geocode(args)
+    if path == '/api/cache/stats':
+        return cache_stats()
+    if path == '/api/upstream/stats':
+        return upstream_stats()
+    return None
+
+
+def vercel_reply(reply, request):
+    """Translate a reply into a Vercel function response"""
+    status, body, headers = reply
+    if isinstance(body, Payload):
+        return payload.vercel_response(body, request, headers)
+    if isinstance(body, dict):
+        return {
+            'statusCode': status,
+            'headers': {**payload.JSON_HEADERS, **(headers or {})},
+            'body': json.dumps(body),
+        }
+    # Vercel functions return the body in one piece, so NDJSON saves the
+    # client's JSON parsing here rather than server memory
+    return {
+        'statusCode': status,
+        'headers': {'Access-Control-Allow-Origin': '*', **(headers or {})},
+        'body': b"".join(body).decode(),
+    }
+
+
+def vercel_handler(request):
+    """Answer a Vercel function request through route()"""
+    method = (request.get('httpMethod') or 'GET').upper()
+    reply = route(method, request.get('path') or '', request.get('queryStringParameters') or {},
+                  payload.request_header(request, 'Accept'), request.get('body'))
+    if reply is None:
+        reply = (404, {"error": "Endpoint not found"}, None)
+    return vercel_reply(reply, request)
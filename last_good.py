@@ -0,0 +1,111 @@
+# Last-known-good copies of upstream answers
+# Every successful eBird load of an observation query is kept in a small
+# SQLite file, so that when eBird fails or its circuit is open the API can
+# answer at once with the previous data, marked stale, instead of a 502.
+
+import json
+import os
+import threading
+import time
+import zlib
+
+import logs
+import sqlite_files
+
+log = logs.get_logger(__name__)
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.environ.get(
+    'LAST_GOOD_PATH', os.path.join(PROJECT_ROOT, 'data', 'last_good.sqlite'))
+FALLBACK_PATH = sqlite_files.fallback_path('flycatcher-last-good.sqlite')
+# Set LAST_GOOD=0 to answer upstream failures with errors instead
+USE_LAST_GOOD = os.environ.get('LAST_GOOD', '1') != '0'
+# Copies older than this are never served
+MAX_AGE = int(os.environ.get('LAST_GOOD_MAX_AGE', 7 * 24 * 3600))  # 7 days
+
+
+class LastGoodStore:
+    """SQLite table of (kind, key) -> zlib-compressed JSON value
+
+    One row per key, replaced on every put(). Each process opens its own
+    connection, so forked workers can share the file.
+    """
+
+    def __init__(self, path, max_age=MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._conn = sqlite_files.ProcessConnection(path, setup=self._setup)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.errors = 0
+
+    def _setup(self, db):
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS last_good (kind TEXT NOT NULL, key TEXT NOT NULL, "
+            "value BLOB NOT NULL, fetched_at REAL NOT NULL, PRIMARY KEY (kind, key))")
+        db.execute("DELETE FROM last_good WHERE fetched_at < ?", (time.time() - self.max_age,))
+        db.commit()
+
+    def get(self, kind, key):
+        """Return (value, fetched_at) for key, or None if missing or too old"""
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT value, fetched_at FROM last_good WHERE kind = ? AND key = ?",
+                    (kind, _encode_key(key))).fetchone()
+            found = None
+            if row is not None and time.time() - row[1] <= self.max_age:
+                found = json.loads(zlib.decompress(row[0])), row[1]
+        except Exception as e:
+            self._failed("read", e)
+            return None
+        with self._lock:
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return found
+
+    def put(self, kind, key, value, fetched_at=None):
+        """Keep value as the last good answer for key; never raises"""
+        data = zlib.compress(json.dumps(value, separators=(',', ':')).encode(), 1)
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO last_good VALUES (?, ?, ?, ?)",
+                    (kind, _encode_key(key), data, fetched_at or time.time()))
+                self._conn.commit()
+                self.writes += 1
+        except Exception as e:
+            self._failed("write", e)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "errors": self.errors,
+                "max_age": self.max_age,
+            }
+
+    def _failed(self, action, e):
+        # A broken fallback must not turn into a failed request
+        with self._lock:
+            self.errors += 1
+        log.warning("Last-good store %s failed on %s: %s", action, self.path, e)
+
+
+def _encode_key(key):
+    return json.dumps(key, separators=(',', ':'))
+
+
+def open_default():
+    """The store at the first writable default location, or None if disabled"""
+    if not USE_LAST_GOOD:
+        return None
+    path = sqlite_files.first_writable((DEFAULT_PATH, FALLBACK_PATH), "Last-good store")
+    return LastGoodStore(path) if path else None
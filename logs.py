@@ -0,0 +1,38 @@
+# Leveled, sampled logging for the Flycatcher modules
+# LOG_LEVEL sets the threshold (default INFO). DEBUG records are kept with
+# probability LOG_DEBUG_SAMPLE (default 1.0), so debug lines on busy paths
+# can stay switched on without flooding the log.
+
+import logging
+import os
+import random
+
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_DEBUG_SAMPLE = float(os.environ.get('LOG_DEBUG_SAMPLE', 1.0))
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+
+class SampleFilter(logging.Filter):
+    """Pass DEBUG records with probability `rate`; other levels always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate
+
+
+_root = logging.getLogger("flycatcher")
+if not _root.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _handler.addFilter(SampleFilter(LOG_DEBUG_SAMPLE))
+    _root.addHandler(_handler)
+    _root.setLevel(LOG_LEVEL)
+    _root.propagate = False
+
+
+def get_logger(name):
+    """Logger for a module, e.g. get_logger(__name__) -> "flycatcher.ebird" """
+    return _root.getChild(name)
@@ -0,0 +1,204 @@
+# Prometheus-style metrics for the Flycatcher app
+# Counters and histograms live in process memory and are rendered in the
+# Prometheus text exposition format on /api/metrics. Cache statistics are
+# read from the cache registry at scrape time.
+
+import bisect
+import math
+import threading
+
+import cache
+
+# Seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+METRICS = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        for label_values, value in sorted(values.items()):
+            yield f"{self.name}{_labels(self.labels, label_values)} {_number(value)}"
+
+
+class Gauge(Counter):
+    """Value that can go up and down, with optional labels"""
+
+    kind = "gauge"
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+            if position < len(self.buckets):
+                series[position] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        with self._lock:
+            snapshot = {labels: list(series) for labels, series in self._series.items()}
+        for label_values, series in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series[:-2] + [0]):
+                cumulative += count
+                if bound == math.inf:
+                    cumulative = series[-1]
+                yield (f"{self.name}_bucket"
+                       f"{_labels(self.labels, label_values, {'le': _number(bound)})} {cumulative}")
+            yield f"{self.name}_sum{_labels(self.labels, label_values)} {_number(series[-2])}"
+            yield f"{self.name}_count{_labels(self.labels, label_values)} {series[-1]}"
+
+
+def counter(name, help, labels=()):
+    metric = Counter(name, help, labels)
+    METRICS.append(metric)
+    return metric
+
+
+def gauge(name, help, labels=()):
+    metric = Gauge(name, help, labels)
+    METRICS.append(metric)
+    return metric
+
+
+def histogram(name, help, labels=(), buckets=LATENCY_BUCKETS):
+    metric = Histogram(name, help, labels, buckets)
+    METRICS.append(metric)
+    return metric
+
+
+REQUESTS = counter(
+    "flycatcher_http_requests_total", "HTTP requests by route, method and status",
+    ("route", "method", "status"))
+REQUEST_DURATION = histogram(
+    "flycatcher_http_request_duration_seconds", "Time to produce a response, by route",
+    ("route", "method"))
+RESPONSE_SIZE = histogram(
+    "flycatcher_http_response_size_bytes", "Response body size on the wire, by route",
+    ("route",), SIZE_BUCKETS)
+UPSTREAM_REQUESTS = counter(
+    "flycatcher_upstream_requests_total", "Upstream HTTP attempts by host and status",
+    ("host", "status"))
+UPSTREAM_DURATION = histogram(
+    "flycatcher_upstream_request_duration_seconds", "Upstream time to response headers, by host",
+    ("host",))
+UPSTREAM_QUEUE_DEPTH = gauge(
+    "flycatcher_upstream_queue_depth", "Requests waiting for a rate-limit token, by host",
+    ("host",))
+UPSTREAM_QUEUE_WAIT = histogram(
+    "flycatcher_upstream_queue_wait_seconds", "Time spent waiting for a rate-limit token, by host",
+    ("host",))
+UPSTREAM_COALESCED = counter(
+    "flycatcher_upstream_coalesced_total", "Requests answered by an identical in-flight request",
+    ("host",))
+UPSTREAM_REJECTED = counter(
+    "flycatcher_upstream_rejected_total", "Requests failed fast without calling the host",
+    ("host", "reason"))
+UPSTREAM_CIRCUIT_OPEN = gauge(
+    "flycatcher_upstream_circuit_open", "API keys whose circuit is open, by host",
+    ("host",))
+
+
+def observe_request(route, method, status, seconds, size=None):
+    """Record one served request"""
+    REQUESTS.inc(route, method, str(status))
+    REQUEST_DURATION.observe(seconds, route, method)
+    if size is not None:
+        RESPONSE_SIZE.observe(size, route)
+
+
+# Cache stats fields exported as counters and gauges
+_CACHE_COUNTERS = ("hits", "misses", "coalesced", "evictions", "negative_hits",
+                   "refreshes", "refresh_errors", "shared_hits", "shared_misses",
+                   "shared_writes", "shared_errors")
+_CACHE_GAUGES = ("entries", "bytes", "hit_ratio", "negative_entries")
+
+
+def _cache_lines():
+    stats = cache.all_stats()
+    for field in _CACHE_COUNTERS + _CACHE_GAUGES:
+        kind = "counter" if field in _CACHE_COUNTERS else "gauge"
+        name = f"flycatcher_cache_{field}" + ("_total" if kind == "counter" else "")
+        samples = [
+            (cache_name, values[field]) for cache_name, values in sorted(stats.items())
+            if isinstance(values.get(field), (int, float)) and not isinstance(values.get(field), bool)
+        ]
+        if not samples:
+            continue
+        yield f"# HELP {name} Cache {field.replace('_', ' ')} per cache"
+        yield f"# TYPE {name} {kind}"
+        for cache_name, value in samples:
+            yield f'{name}{{cache="{_escape(cache_name)}"}} {_number(value)}'
+
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    lines.extend(_cache_lines())
+    return "\n".join(lines) + "\n"
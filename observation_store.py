@@ -0,0 +1,291 @@
+# Local observation store fed by a background ingestion poller
+# The poller pulls the configured regions from eBird every few minutes and
+# upserts the rows into a SQLite file keyed by each observation's natural
+# key, so /api/observations can be answered locally and keep history beyond
+# eBird's 30-day window.
+
+import os
+import threading
+import time
+from datetime import date, timedelta
+
+import logs
+import sqlite_files
+
+log = logs.get_logger(__name__)
+
+# Set to a file path to enable the store (e.g. data/observations.sqlite)
+OBSERVATION_STORE_PATH = os.environ.get('OBSERVATION_STORE_PATH', '')
+# Regions the poller keeps up to date, e.g. ZA,NA,BW
+INGEST_REGIONS = os.environ.get('INGEST_REGIONS', '')
+INGEST_INTERVAL = int(os.environ.get('INGEST_INTERVAL', 15 * 60))  # seconds
+INGEST_BACK = 30  # eBird's maximum, so nothing is missed between polls
+INGEST_MAX_RESULTS = 10000
+# Observations older than this are pruned; also the largest `back` served
+RETENTION_DAYS = int(os.environ.get('OBSERVATION_RETENTION_DAYS', 365))
+
+COLUMNS = ("species_code", "common_name", "scientific_name", "observation_date",
+           "latitude", "longitude", "count", "location_name")
+
+
+def natural_key(obs):
+    """Identify one sighting regardless of later edits to its count"""
+    return "|".join(str(obs.get(field) or "") for field in (
+        "species_code", "observation_date", "latitude", "longitude", "location_name"))
+
+
+class ObservationStore:
+    """SQLite table of normalized observations per ingested region
+
+    Indexed by region and time (the /api/observations query), by species
+    and by location. Writers and readers share one connection per process
+    in WAL mode, so requests can read while the poller writes.
+    """
+
+    # Seconds between re-reads of which regions another process ingested
+    COVERAGE_CHECK_INTERVAL = 30
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._conn = sqlite_files.ProcessConnection(path)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS observations (
+                    region TEXT NOT NULL,
+                    obs_key TEXT NOT NULL,
+                    species_code TEXT,
+                    common_name TEXT,
+                    scientific_name TEXT,
+                    observation_date TEXT,
+                    latitude REAL,
+                    longitude REAL,
+                    count INTEGER,
+                    location_name TEXT,
+                    first_seen REAL NOT NULL,
+                    last_seen REAL NOT NULL,
+                    PRIMARY KEY (region, obs_key)
+                ) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS observations_time
+                    ON observations (region, observation_date);
+                CREATE INDEX IF NOT EXISTS observations_species
+                    ON observations (species_code, observation_date);
+                CREATE INDEX IF NOT EXISTS observations_location
+                    ON observations (latitude, longitude);
+                CREATE TABLE IF NOT EXISTS ingest_runs (
+                    region TEXT PRIMARY KEY,
+                    last_success REAL,
+                    last_error TEXT,
+                    last_error_at REAL,
+                    added INTEGER,
+                    updated INTEGER
+                );
+            """)
+            self._conn.commit()
+            self._ingested = self._ingested_regions()
+        self._coverage_checked = time.time()
+
+    def covers(self, region):
+        """True once region has been ingested at least once, by any process"""
+        if region in self._ingested:
+            return True
+        if time.time() - self._coverage_checked > self.COVERAGE_CHECK_INTERVAL:
+            self._coverage_checked = time.time()
+            with self._lock:
+                self._ingested = self._ingested_regions()
+        return region in self._ingested
+
+    def upsert(self, region, observations):
+        """Insert new observations and refresh known ones; returns (added, updated)"""
+        now = time.time()
+        rows = {natural_key(obs): obs for obs in observations}
+        with self._lock:
+            before = self._count(region)
+            self._conn.executemany(
+                "INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (region, obs_key) DO UPDATE SET "
+                "count = excluded.count, common_name = excluded.common_name, "
+                "scientific_name = excluded.scientific_name, last_seen = excluded.last_seen",
+                ((region, key, *(obs.get(column) for column in COLUMNS), now, now)
+                 for key, obs in rows.items()))
+            added = self._count(region) - before
+            self._conn.execute(
+                "INSERT INTO ingest_runs (region, last_success, added, updated) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (region) DO UPDATE SET last_success = excluded.last_success, "
+                "added = excluded.added, updated = excluded.updated",
+                (region, now, added, len(rows) - added))
+            self._conn.commit()
+            self._ingested.add(region)
+        return added, len(rows) - added
+
+    def record_error(self, region, error):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO ingest_runs (region, last_error, last_error_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (region) DO UPDATE SET last_error = excluded.last_error, "
+                "last_error_at = excluded.last_error_at",
+                (region, str(error), time.time()))
+            self._conn.commit()
+
+    def prune(self, retention_days=RETENTION_DAYS):
+        """Delete observations older than retention_days; returns the count"""
+        cutoff = (date.today() - timedelta(days=retention_days)).isoformat()
+        with self._lock:
+            deleted = self._conn.execute(
+                "DELETE FROM observations WHERE observation_date < ?", (cutoff,)).rowcount
+            self._conn.commit()
+        return deleted
+
+    def recent(self, region, back, max_results):
+        """Return up to max_results observations of the last `back` days, newest first"""
+        cutoff = (date.today() - timedelta(days=back)).isoformat()
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM observations "
+                "WHERE region = ? AND observation_date >= ? "
+                "ORDER BY observation_date DESC LIMIT ?",
+                (region, cutoff, max_results)).fetchall()
+        return [dict(zip(COLUMNS, row)) for row in rows]
+
+    def iter_recent(self, region, back, max_results, batch_size=500):
+        """Like recent(), but yields rows in batches from its own connection
+
+        The shared connection stays free while a slow client reads.
+        """
+        import sqlite3
+        cutoff = (date.today() - timedelta(days=back)).isoformat()
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            cursor = conn.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM observations "
+                "WHERE region = ? AND observation_date >= ? "
+                "ORDER BY observation_date DESC LIMIT ?",
+                (region, cutoff, max_results))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    return
+                for row in rows:
+                    yield dict(zip(COLUMNS, row))
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Row counts and the latest ingestion run per region"""
+        with self._lock:
+            runs = self._conn.execute(
+                "SELECT region, last_success, last_error, last_error_at, added, updated "
+                "FROM ingest_runs").fetchall()
+            counts = dict(self._conn.execute(
+                "SELECT region, COUNT(*) FROM observations GROUP BY region").fetchall())
+        return {
+            region: {
+                "rows": counts.get(region, 0),
+                "last_success": last_success,
+                "last_error": last_error,
+                "last_error_at": last_error_at,
+                "added": added,
+                "updated": updated,
+            }
+            for region, last_success, last_error, last_error_at, added, updated in runs
+        }
+
+    # Callers of the helpers below must hold self._lock
+
+    def _ingested_regions(self):
+        return {
+            region for (region,) in self._conn.execute(
+                "SELECT region FROM ingest_runs WHERE last_success IS NOT NULL")
+        }
+
+    def _count(self, region):
+        return self._conn.execute(
+            "SELECT COUNT(*) FROM observations WHERE region = ?", (region,)).fetchone()[0]
+
+
+class IngestionPoller:
+    """Daemon thread that ingests each region every `interval` seconds
+
+    fetch(region) returns normalized observation dicts; on_ingested(region)
+    is called after new data for a region was written. A failing region is
+    logged and retried on the next round without affecting the others.
+
+    With lock_path, every worker of a multi-process server may run a poller
+    but only the one holding an exclusive lock on that file ingests; if it
+    exits, another takes over on its next round.
+    """
+
+    def __init__(self, store, regions, fetch, on_ingested=None, interval=INGEST_INTERVAL,
+                 lock_path=None):
+        self.store = store
+        self.regions = regions
+        self.fetch = fetch
+        self.on_ingested = on_ingested or (lambda region: None)
+        self.interval = interval
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="observation-ingest", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        if self._lock_file is not None:
+            self._lock_file.close()  # Hands ingestion to another worker
+            self._lock_file = None
+
+    def leading(self):
+        """True if this process should ingest, taking the lock if it is free"""
+        if self.lock_path is None or self._lock_file is not None:
+            return True
+        try:
+            import fcntl
+        except ImportError:
+            return True  # No flock (Windows): single-process servers only
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        log.info("Process %d took over observation ingestion", os.getpid())
+        return True
+
+    def ingest(self, region):
+        """Pull one region into the store; returns (added, updated)"""
+        try:
+            observations = self.fetch(region)
+        except Exception as e:
+            log.warning("Ingestion of %s failed: %s", region, e)
+            self.store.record_error(region, e)
+            return 0, 0
+        added, updated = self.store.upsert(region, observations)
+        log.info("Ingested %s: %d new, %d updated", region, added, updated)
+        self.on_ingested(region)
+        return added, updated
+
+    def _run(self):
+        while not self._stop.is_set():
+            if not self.leading():
+                self._stop.wait(self.interval)
+                continue
+            for region in self.regions:
+                if self._stop.is_set():
+                    return
+                self.ingest(region)
+            deleted = self.store.prune()
+            if deleted:
+                log.info("Pruned %d observations older than %d days", deleted, RETENTION_DAYS)
+            self._stop.wait(self.interval)
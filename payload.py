@@ -0,0 +1,167 @@
+# Encoded JSON response bodies with ETags and compressed variants
+# A Payload serializes its body and hashes it once, and compresses it at
+# most once per content encoding, so a cached response is served to every
+# client without being re-encoded per request.
+
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this are sent uncompressed
+MIN_COMPRESS_BYTES = int(os.environ.get('MIN_COMPRESS_BYTES', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+JSON_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*',
+}
+
+
+class Payload:
+    """A JSON body encoded once, with its ETag and compressed variants"""
+
+    def __init__(self, body):
+        self.body = json.dumps(body, separators=(',', ':')).encode()
+        # Weak, because the same tag is sent for every content encoding
+        self.etag = 'W/"' + hashlib.sha1(self.body).hexdigest()[:24] + '"'
+        self._encoded = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.body)
+
+    def encoded(self, encoding):
+        """Return the body in encoding ("br", "gzip" or None), compressing once"""
+        if encoding is None:
+            return self.body
+        with self._lock:
+            data = self._encoded.get(encoding)
+            if data is None:
+                if encoding == "br":
+                    data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+                else:
+                    data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+                self._encoded[encoding] = data
+            return data
+
+    def respond(self, if_none_match=None, accept_encoding=None):
+        """Return (status, headers, body) for a request with these headers
+
+        A matching If-None-Match gives an empty 304; otherwise the body is
+        compressed with the best encoding the client accepts.
+        """
+        headers = {
+            'ETag': self.etag,
+            'Vary': 'Accept-Encoding',
+            'Cache-Control': 'no-cache',
+        }
+        if etag_matches(if_none_match, self.etag):
+            return 304, headers, b""
+        encoding = choose_encoding(accept_encoding) if len(self.body) >= MIN_COMPRESS_BYTES else None
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return 200, headers, self.encoded(encoding)
+
+
+def etag_matches(if_none_match, etag):
+    """Weak comparison of an If-None-Match header against etag"""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*':
+            return True
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def choose_encoding(accept_encoding):
+    """Pick "br" or "gzip" from an Accept-Encoding header, or None"""
+    accepted = {}
+    for part in (accept_encoding or "").split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name] = q
+    wildcard = accepted.get('*', 0.0)
+    for encoding in (("br", "gzip") if brotli is not None else ("gzip",)):
+        if accepted.get(encoding, wildcard) > 0:
+            return encoding
+    return None
+
+
+NDJSON_TYPE = 'application/x-ndjson'
+
+
+def wants_ndjson(accept=None, stream=None):
+    """True for ?stream=1 or an Accept header asking for NDJSON"""
+    return stream in ('1', 'true') or NDJSON_TYPE in (accept or '')
+
+
+def ndjson_lines(items, flush_bytes=16 * 1024):
+    """Encode items as NDJSON, yielding bytes in batches of about flush_bytes
+
+    The first line is yielded on its own so the client gets it at once.
+    """
+    batch = []
+    size = 0
+    first = True
+    for item in items:
+        line = json.dumps(item, separators=(',', ':')).encode() + b"\n"
+        if first:
+            yield line
+            first = False
+            continue
+        batch.append(line)
+        size += len(line)
+        if size >= flush_bytes:
+            yield b"".join(batch)
+            batch, size = [], 0
+    if batch:
+        yield b"".join(batch)
+
+
+def request_header(request, name):
+    """Case-insensitive header lookup in a Vercel request dict"""
+    name = name.lower()
+    for key, value in (request.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def vercel_response(payload, request, headers=None):
+    """Answer a Vercel request with payload, honouring its conditional headers"""
+    status, payload_headers, body = payload.respond(
+        request_header(request, 'If-None-Match'), request_header(request, 'Accept-Encoding'))
+    response = {
+        'statusCode': status,
+        'headers': {**JSON_HEADERS, **payload_headers, **(headers or {})},
+    }
+    if 'Content-Encoding' in payload_headers:
+        response['body'] = base64.b64encode(body).decode('ascii')
+        response['isBase64Encoded'] = True
+    else:
+        response['body'] = body.decode()
+    return response
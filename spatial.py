@@ -0,0 +1,193 @@
+# Grid-bucket spatial index over observation coordinates
+# Observations are bucketed into fixed-size lat/lng cells when a dataset is
+# ingested, so radius and bounding-box queries only look at nearby cells.
+# The same bucketing, with cells sized to the map zoom, drives marker
+# clustering.
+
+import math
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE_LAT = 111.32
+# 0.1 degrees is about 11 km of latitude: a 10 km search touches ~9 cells
+DEFAULT_CELL_DEGREES = 0.1
+MAX_RADIUS_KM = 100
+# Google Maps zoom levels; a 256px tile spans 360 / 2**zoom degrees
+MAX_ZOOM = 22
+CLUSTER_CELL_PX = 64
+
+
+def parse_radius_query(lat, lng, radius_km):
+    """Validate lat/lng/radius_km query values and return them as floats
+
+    Raises ValueError for missing, non-numeric or out-of-range values.
+    """
+    if lat in (None, "") or lng in (None, ""):
+        raise ValueError("lat and lng are required")
+    lat, lng, radius_km = float(lat), float(lng), float(radius_km)
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError("lat/lng out of range")
+    if not 0 < radius_km <= MAX_RADIUS_KM:
+        raise ValueError(f"radius_km must be between 0 and {MAX_RADIUS_KM}")
+    return lat, lng, radius_km
+
+
+def parse_bbox(value):
+    """Parse "south,west,north,east" (LatLngBounds.toUrlValue()); None if empty
+
+    west > east means the box crosses the antimeridian. Raises ValueError
+    for malformed or out-of-range values.
+    """
+    if not value:
+        return None
+    parts = value.split(',')
+    if len(parts) != 4:
+        raise ValueError("bbox must be south,west,north,east")
+    south, west, north, east = (float(p) for p in parts)
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("bbox out of range")
+    return south, west, north, east
+
+
+def in_bbox(lat, lng, bbox):
+    """True if the point lies inside bbox (see parse_bbox)"""
+    south, west, north, east = bbox
+    if not south <= lat <= north:
+        return False
+    if west <= east:
+        return west <= lng <= east
+    return lng >= west or lng <= east
+
+
+def parse_zoom(value):
+    """Validate a map zoom level; raises ValueError"""
+    if value in (None, ""):
+        raise ValueError("zoom is required")
+    zoom = int(value)
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"zoom must be between 0 and {MAX_ZOOM}")
+    return zoom
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance between two points in kilometres"""
+    d_lat = math.radians(lat2 - lat1)
+    d_lng = math.radians(lng2 - lng1)
+    a = (math.sin(d_lat / 2) ** 2 +
+         math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+class GridIndex:
+    """Buckets of row positions keyed by (lat cell, lng cell)
+
+    `rows` is a list of observation dicts with latitude/longitude; the index
+    stores positions into it, so the rows themselves are shared, not copied.
+    Rows without coordinates are left out.
+    """
+
+    def __init__(self, rows, cell_degrees=DEFAULT_CELL_DEGREES):
+        self.rows = rows
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        for position, row in enumerate(rows):
+            lat, lng = row.get("latitude"), row.get("longitude")
+            if lat is None or lng is None:
+                continue
+            self.cells.setdefault(self._cell(lat, lng), []).append(position)
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+
+    def _positions_in_box(self, south, west, north, east):
+        (lat_lo, lng_lo), (lat_hi, lng_hi) = self._cell(south, west), self._cell(north, east)
+        # Walk whichever is smaller: the cells in the box, or the occupied cells
+        if (lat_hi - lat_lo + 1) * (lng_hi - lng_lo + 1) > len(self.cells):
+            for (lat_cell, lng_cell), positions in self.cells.items():
+                if lat_lo <= lat_cell <= lat_hi and lng_lo <= lng_cell <= lng_hi:
+                    yield from positions
+            return
+        for lat_cell in range(lat_lo, lat_hi + 1):
+            for lng_cell in range(lng_lo, lng_hi + 1):
+                yield from self.cells.get((lat_cell, lng_cell), ())
+
+    def within_bbox(self, south, west, north, east):
+        """Return the rows inside the box, in dataset order
+
+        west > east means the box crosses the antimeridian.
+        """
+        if west > east:
+            positions = set(self._positions_in_box(south, west, north, 180))
+            positions.update(self._positions_in_box(south, -180, north, east))
+        else:
+            positions = self._positions_in_box(south, west, north, east)
+        bbox = (south, west, north, east)
+        rows = self.rows
+        return [
+            rows[p] for p in sorted(positions)
+            if in_bbox(rows[p]["latitude"], rows[p]["longitude"], bbox)
+        ]
+
+    def within_radius(self, lat, lng, radius_km):
+        """Return [(distance_km, row)] for rows within radius_km, nearest first"""
+        d_lat = radius_km / KM_PER_DEGREE_LAT
+        # Longitude degrees shrink towards the poles
+        d_lng = radius_km / (KM_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01))
+        matches = []
+        for position in self._positions_in_box(lat - d_lat, lng - d_lng, lat + d_lat, lng + d_lng):
+            row = self.rows[position]
+            distance = haversine_km(lat, lng, row["latitude"], row["longitude"])
+            if distance <= radius_km:
+                matches.append((distance, row))
+        matches.sort(key=lambda match: match[0])
+        return matches
+
+
+class GridClusters:
+    """Rows aggregated into grid cells about CLUSTER_CELL_PX wide at a zoom
+
+    Each cluster carries its observation count, distinct species count,
+    centroid and the bounds of its points; a cluster of one observation
+    also carries the row itself, so it can be drawn as a normal marker.
+    """
+
+    def __init__(self, rows, zoom):
+        self.zoom = zoom
+        self.cell_degrees = 360.0 / 2 ** zoom * CLUSTER_CELL_PX / 256
+        cells = {}
+        for row in rows:
+            lat, lng = row.get("latitude"), row.get("longitude")
+            if lat is None or lng is None:
+                continue
+            key = (math.floor(lat / self.cell_degrees), math.floor(lng / self.cell_degrees))
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = {"rows": [], "species": set(), "lat": 0.0, "lng": 0.0,
+                                     "bounds": [lat, lng, lat, lng]}
+            cell["rows"].append(row)
+            cell["species"].add(row.get("species_code"))
+            cell["lat"] += lat
+            cell["lng"] += lng
+            bounds = cell["bounds"]
+            bounds[0], bounds[1] = min(bounds[0], lat), min(bounds[1], lng)
+            bounds[2], bounds[3] = max(bounds[2], lat), max(bounds[3], lng)
+
+        self.clusters = []
+        for cell in cells.values():
+            count = len(cell["rows"])
+            cluster = {
+                "latitude": round(cell["lat"] / count, 6),
+                "longitude": round(cell["lng"] / count, 6),
+                "count": count,
+                "species_count": len(cell["species"]),
+                "bounds": cell["bounds"],  # [south, west, north, east]
+            }
+            if count == 1:
+                cluster["observation"] = cell["rows"][0]
+            self.clusters.append(cluster)
+        self.clusters.sort(key=lambda cluster: -cluster["count"])
+
+    def within_bbox(self, bbox):
+        """Return the clusters whose centroid is inside bbox (all if None)"""
+        if bbox is None:
+            return list(self.clusters)
+        return [c for c in self.clusters if in_bbox(c["latitude"], c["longitude"], bbox)]
@@ -0,0 +1,181 @@
+# Species name search over the eBird taxonomy
+# Common and scientific names are case-folded into a sorted word list (for
+# prefix lookups) and a trigram index (for substring lookups) once per
+# taxonomy version, so a search never scans every species.
+
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from array import array
+
+import ebird
+import logs
+import taxonomy
+
+log = logs.get_logger(__name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+MAX_QUERY_LENGTH = 100
+
+
+def fold(text):
+    """Case-fold text and drop accents and punctuation: "Eurasian Hoopoe" -> "eurasian hoopoe" """
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return " ".join(re.findall(r"[^\W_]+", text))
+
+
+def _trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SpeciesSearchIndex:
+    """Prefix and trigram index over (code, common_name, scientific_name)"""
+
+    def __init__(self, names):
+        self.codes = []
+        self.common_names = []
+        self.scientific_names = []
+        self.folded = []
+        words = []
+        postings = {}
+        for entry, (code, common_name, scientific_name) in enumerate(names):
+            folded = (fold(common_name), fold(scientific_name))
+            self.codes.append(code)
+            self.common_names.append(common_name)
+            self.scientific_names.append(scientific_name)
+            self.folded.append(folded)
+            for name in folded:
+                for word in name.split():
+                    words.append((word, entry))
+            for gram in _trigrams(folded[0]) | _trigrams(folded[1]):
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = postings[gram] = array("I")
+                posting.append(entry)
+        words.sort()
+        self.words = [word for word, _ in words]
+        self.word_entries = array("I", (entry for _, entry in words))
+        self.trigrams = postings
+
+    def __len__(self):
+        return len(self.codes)
+
+    def _candidates(self, query):
+        if len(query) < 3:
+            # Too short for trigrams: every entry with a word starting with query
+            start = bisect.bisect_left(self.words, query)
+            end = bisect.bisect_left(self.words, query + "\U0010ffff")
+            return set(self.word_entries[start:end])
+
+        grams = sorted(_trigrams(query), key=lambda g: len(self.trigrams.get(g, ())))
+        candidates = set(self.trigrams.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(self.trigrams.get(gram, ()))
+        # Trigrams can match out of order; confirm the real substring
+        return {e for e in candidates if query in self.folded[e][0] or query in self.folded[e][1]}
+
+    def _rank(self, entry, query):
+        best = None
+        for field, name in enumerate(self.folded[entry]):
+            if name == query:
+                rank = 0
+            elif name.startswith(query):
+                rank = 1
+            elif (" " + query) in (" " + name):
+                rank = 2
+            elif query in name:
+                rank = 3
+            else:
+                continue
+            # Prefer common-name matches over scientific ones of the same kind
+            if best is None or (rank, field) < best:
+                best = (rank, field)
+        return best
+
+    def search(self, query, limit=DEFAULT_LIMIT, counts=None):
+        """Return the best matches for query, most relevant first
+
+        Exact names rank above name prefixes, then word prefixes, then
+        substrings. Within a rank, species seen more often in `counts`
+        ({code: observations}) come first.
+        """
+        query = fold(query)
+        if not query:
+            return []
+        counts = counts or {}
+        scored = []
+        for entry in self._candidates(query):
+            rank, field = self._rank(entry, query)
+            code = self.codes[entry]
+            scored.append(((rank, field, -counts.get(code, 0), self.common_names[entry]), entry))
+
+        results = []
+        for (rank, field, _, _), entry in heapq.nsmallest(limit, scored):
+            code = self.codes[entry]
+            results.append({
+                "species_code": code,
+                "common_name": self.common_names[entry],
+                "scientific_name": self.scientific_names[entry],
+                "matched": "common_name" if field == 0 else "scientific_name",
+                "observation_count": counts.get(code, 0) if counts else None,
+            })
+        return results
+
+
+_index = None
+_index_table = None
+_index_lock = threading.Lock()
+
+
+def index_for(table):
+    """Return the search index for a taxonomy table, building it on first use
+
+    The index is rebuilt whenever the taxonomy cache swaps in a new table.
+    """
+    global _index, _index_table
+    with _index_lock:
+        if _index is None or _index_table is not table:
+            if hasattr(table, "names"):
+                names = table.names()
+            else:
+                names = [(code, info["common_name"], info.get("scientific_name", ""))
+                         for code, info in table.items()]
+            _index = SpeciesSearchIndex(names)
+            _index_table = table
+            log.info("Built species search index over %d species", len(_index))
+        return _index
+
+
+def parse_search_query(query, limit):
+    """Validate q/limit query values; raises ValueError"""
+    query = (query or "").strip()
+    if not query:
+        raise ValueError("q is required")
+    if len(query) > MAX_QUERY_LENGTH:
+        raise ValueError(f"q must be at most {MAX_QUERY_LENGTH} characters")
+    limit = min(max(int(limit), 1), MAX_LIMIT)
+    return query, limit
+
+
+def search(api_key, query, limit=DEFAULT_LIMIT, region=None, back="7", max_results="1000"):
+    """Build the /api/species/search JSON body
+
+    When region is given, each result carries its observation count from
+    the cached /api/observations data for region/back/maxResults (never
+    fetched here). Raises ValueError for invalid query values, and
+    EBirdError or requests.RequestException if the taxonomy cannot be
+    loaded at all.
+    """
+    query, limit = parse_search_query(query, limit)
+    counts = None
+    if region:
+        counts = ebird.cached_species_counts(ebird.parse_regions(region), back, max_results)
+    table = taxonomy.TAXONOMY.current_table(api_key)
+    results = index_for(table).search(query, limit, counts)
+    return {"query": query, "count": len(results), "results": results}
@@ -0,0 +1,87 @@
+# SQLite files kept by the app
+# The taxonomy snapshot, last-good store, geocode store, observation store
+# and shared cache each keep a SQLite file. This module picks where such a
+# file can live and gives each process its own connection to it.
+
+import os
+import tempfile
+
+import logs
+
+log = logs.get_logger(__name__)
+
+
+def fallback_path(name):
+    """Path for file `name` in the temp directory
+
+    Serverless filesystems are read-only apart from the temp directory.
+    """
+    return os.path.join(tempfile.gettempdir(), name)
+
+
+def writable(path):
+    """True if the directory for path exists (or was created) and is writable"""
+    directory = os.path.dirname(path) or "."
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return False
+    return os.access(directory, os.W_OK)
+
+
+def first_writable(paths, what):
+    """Return the first of paths that can be written, or None
+
+    what: the kind of file, for the warning about each path that cannot
+    """
+    for path in paths:
+        if writable(path):
+            return path
+        log.warning("%s location %s is not writable", what, path)
+    return None
+
+
+class ProcessConnection:
+    """SQLite connection to path, reopened in each process
+
+    A forked worker must not share its parent's SQLite connection, so the
+    first use in a new process opens a fresh one; workers preloaded by a
+    server's master share the object holding it but not the connection.
+    Attributes (execute, commit, ...) are those of the current connection.
+    Like a plain connection it is not thread-safe: callers hold a lock.
+
+    read_only: open with mode=ro, so a missing file is an error
+    setup: called with each new connection (pragmas, CREATE TABLE)
+    """
+
+    def __init__(self, path, read_only=False, timeout=5.0, setup=None):
+        self.path = path
+        self.read_only = read_only
+        self.timeout = timeout
+        self.setup = setup
+        self._db = None
+        self._pid = None
+
+    def connection(self):
+        if self._pid != os.getpid():
+            # Imported here so processes that never open a file never load sqlite3
+            import sqlite3
+            if self.read_only:
+                db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True,
+                                     timeout=self.timeout, check_same_thread=False)
+            else:
+                db = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+            if self.setup is not None:
+                self.setup(db)
+            self._db = db
+            self._pid = os.getpid()
+        return self._db
+
+    def close(self):
+        if self._db is not None and self._pid == os.getpid():
+            self._db.close()
+        self._db = None
+        self._pid = None
+
+    def __getattr__(self, name):
+        return getattr(self.connection(), name)
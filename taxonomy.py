@@ -0,0 +1,425 @@
+# eBird taxonomy cache shared by the species endpoints
+# Serves species lookups from an in-memory table that is refreshed in the
+# background when it goes stale, with negative caching for unknown codes.
+
+import csv
+import io
+import os
+import threading
+import time
+import zlib
+
+import cache_backends
+import logs
+import taxonomy_snapshot
+import upstream
+from cache import register
+from ebird import EBIRD_BASE, UA, EBirdError
+
+log = logs.get_logger(__name__)
+
+# Taxonomy cache settings (override with environment variables)
+CACHE_DURATION = int(os.environ.get('TAXONOMY_CACHE_TTL', 3600))  # Cache for 1 hour
+NEGATIVE_CACHE_DURATION = int(os.environ.get('TAXONOMY_NEGATIVE_TTL', 3600))
+NEGATIVE_CACHE_MAX_ENTRIES = 10000
+# An unknown code only triggers a refresh if the table is at least this old
+MISS_REFRESH_AFTER = int(os.environ.get('TAXONOMY_MISS_REFRESH_AFTER', 600))
+# Set TAXONOMY_SNAPSHOT=0 to keep the table in memory only
+USE_SNAPSHOT = os.environ.get('TAXONOMY_SNAPSHOT', '1') != '0'
+# The copy in the shared cache outlives the ttl, so a cold instance can still
+# start from it while eBird is failing
+SHARED_SNAPSHOT_TTL = 7 * 24 * 3600
+
+
+# CSV header -> position in the row tuples produced by parse_taxonomy_csv
+TAXONOMY_COLUMNS = ("SPECIES_CODE", "COMMON_NAME", "ORDER", "FAMILY_COM_NAME", "SCIENTIFIC_NAME")
+
+
+def parse_taxonomy_csv(stream):
+    """Yield (code, common_name, order, family, scientific_name) rows from a taxonomy CSV
+
+    Columns are located by header name, and quoted fields that contain
+    commas are handled by the csv module. `stream` is any iterable of text
+    lines, so rows can be parsed while the body is still downloading.
+    """
+    reader = csv.reader(stream)
+    header = [name.strip().upper() for name in next(reader, [])]
+    try:
+        positions = [header.index(column) for column in TAXONOMY_COLUMNS]
+    except ValueError:
+        raise ValueError(f"Unexpected taxonomy CSV header: {header}")
+    width = max(positions) + 1
+    code_at, name_at, order_at, family_at, sci_name_at = positions
+
+    for parts in reader:
+        if len(parts) >= width and parts[code_at]:
+            yield (parts[code_at], parts[name_at], parts[order_at], parts[family_at],
+                   parts[sci_name_at])
+
+
+def stream_taxonomy(api_key):
+    """Download the eBird taxonomy CSV and yield its rows as they arrive
+
+    Raises EBirdError on a non-200 response and requests.RequestException
+    on network errors; both surface on the first iteration.
+    """
+    url = f"{EBIRD_BASE}/ref/taxonomy/ebird"
+    headers = {
+        "X-eBirdApiToken": api_key,
+        "Accept": "text/csv",
+        "User-Agent": UA,
+    }
+    with upstream.get(url, headers=headers, timeout=20, stream=True) as r:
+        if r.status_code != 200:
+            raise EBirdError(r.status_code, r.text)
+        r.raw.decode_content = True  # Let urllib3 undo any gzip encoding
+        # Otherwise urllib3 closes the stream once Content-Length bytes are
+        # read, and TextIOWrapper's final read fails on the closed file
+        r.raw.auto_close = False
+        text = io.TextIOWrapper(r.raw, encoding=r.encoding or "utf-8", newline="")
+        yield from parse_taxonomy_csv(text)
+
+
+def build_table(rows):
+    """Collect taxonomy rows into the in-memory {code: info} table"""
+    return {
+        code: {"common_name": common_name, "order": order, "family": family,
+               "scientific_name": scientific_name}
+        for code, common_name, order, family, scientific_name in rows
+    }
+
+
+def fetch_taxonomy(api_key):
+    """Download the eBird taxonomy and return {code: info}"""
+    return build_table(stream_taxonomy(api_key))
+
+
+class TaxonomyCache:
+    """Species table with stale-while-revalidate refresh
+
+    - The first lookup loads the table synchronously; concurrent callers wait
+      for that single download.
+    - Once the table is older than `ttl`, lookups keep answering from the
+      stale table while one background thread refreshes it.
+    - Codes that are not in the table are remembered for `negative_ttl`, so
+      repeated lookups of a mistyped code never re-download the CSV.
+    - With snapshots enabled the table lives in an on-disk SQLite snapshot
+      (see taxonomy_snapshot). A cold instance opens the newest snapshot
+      instead of downloading, and each refresh writes a new version.
+    - `shared` is an optional cache_backends.SharedTier holding the newest
+      snapshot file, for instances on other hosts: a cold instance copies
+      it to disk instead of downloading, and only one process at a time
+      downloads while the others wait for its snapshot.
+    """
+
+    def __init__(self, ttl=CACHE_DURATION, negative_ttl=NEGATIVE_CACHE_DURATION,
+                 loader=stream_taxonomy, snapshot_paths=None, shared=None):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.loader = loader
+        if snapshot_paths is None and USE_SNAPSHOT:
+            snapshot_paths = (taxonomy_snapshot.DEFAULT_PATH, taxonomy_snapshot.FALLBACK_PATH)
+        self.snapshot_paths = snapshot_paths or ()
+        # Only snapshot files are shared
+        self.shared = shared if self.snapshot_paths else None
+        self.table = {}
+        self.loaded_at = 0
+        self._negative = {}  # code -> time the miss was recorded
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._refreshing = False
+        self._refresh_failed = False
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    def lookup(self, api_key, species_code):
+        """Return the info dict for species_code, or None if it is unknown
+
+        Raises EBirdError or requests.RequestException only when there is no
+        table at all yet and the initial download fails.
+        """
+        return self.lookup_many(api_key, [species_code])[species_code]
+
+    def lookup_many(self, api_key, species_codes):
+        """Return {code: info or None} for several codes in one pass"""
+        now = time.time()
+        table = self.current_table(api_key)
+        if hasattr(table, "get_many"):
+            found = table.get_many(species_codes)
+        else:
+            found = {code: table[code] for code in species_codes if code in table}
+
+        results = {}
+        new_misses = False
+        with self._lock:
+            for species_code in species_codes:
+                info = found.get(species_code)
+                results[species_code] = info
+                if info is not None:
+                    self.hits += 1
+                    continue
+
+                missed_at = self._negative.get(species_code)
+                if missed_at is not None and now - missed_at < self.negative_ttl:
+                    self.negative_hits += 1
+                    continue
+
+                self.misses += 1
+                new_misses = True
+                if len(self._negative) >= NEGATIVE_CACHE_MAX_ENTRIES:
+                    self._negative.clear()
+                self._negative[species_code] = now
+            table_age = now - self.loaded_at
+
+        # A code we have never seen might be a newly added species; pick it
+        # up with a background refresh, but not more often than allowed
+        if new_misses and table_age > MISS_REFRESH_AFTER:
+            self._refresh_in_background(api_key)
+        return results
+
+    def current_table(self, api_key):
+        """Return the table to answer from, loading it on first use
+
+        A stale table is returned as-is while a background refresh runs.
+        """
+        if not self.loaded_at:
+            self._load_initial(api_key)
+        if time.time() - self.loaded_at > self.ttl:
+            self._refresh_in_background(api_key)
+        return self.table
+
+    def preload(self, api_key):
+        """Load a fresh table now, without starting background threads
+
+        For a server's master process before it forks workers, which then
+        start with the table (and anything built from it) in shared memory.
+        Falls back to a stale snapshot if the download fails.
+        """
+        with self._load_lock:
+            if time.time() - self.loaded_at <= self.ttl or self._adopt_snapshot(fresh_only=True):
+                return self.table
+            try:
+                self._download(api_key, wait=True)
+            except Exception:
+                if not self._adopt_snapshot(fresh_only=False):
+                    raise
+        return self.table
+
+    def refresh(self, api_key):
+        """Reload the table now, replacing it only if the download succeeds"""
+        rows = self.loader(api_key)
+        table = None
+        if self.snapshot_paths:
+            # Rows go straight from the response into the snapshot file
+            table = taxonomy_snapshot.save(rows, self.snapshot_paths)
+        if table is None:
+            table = build_table(rows)
+        else:
+            self._publish(table)
+        self._swap(table, time.time())
+        with self._lock:
+            self.refreshes += 1
+        log.info("Cached %d species", len(table))
+
+    def stale_age(self):
+        """Age in seconds of a table that is past its ttl and could not be
+        refreshed (eBird failing), or None while the table is usable as is"""
+        with self._lock:
+            age = time.time() - self.loaded_at
+            if self.loaded_at and self._refresh_failed and age > self.ttl:
+                return int(age)
+        return None
+
+    def stats(self):
+        """Return hit/miss counters and refresh state"""
+        shared = self.shared.stats() if self.shared is not None else {}
+        with self._lock:
+            return {
+                **{f"shared_{name}": value for name, value in shared.items()},
+                "entries": len(self.table),
+                "age": round(time.time() - self.loaded_at, 1) if self.loaded_at else None,
+                "hits": self.hits,
+                "misses": self.misses,
+                "negative_entries": len(self._negative),
+                "negative_hits": self.negative_hits,
+                "refreshes": self.refreshes,
+                "refresh_errors": self.refresh_errors,
+                "refreshing": self._refreshing,
+                "stale": self._refresh_failed and time.time() - self.loaded_at > self.ttl,
+                "snapshot": getattr(self.table, "version", None),
+                "ttl": self.ttl,
+            }
+
+    def _swap(self, table, loaded_at):
+        with self._lock:
+            self.table = table
+            self.loaded_at = loaded_at
+            self._refresh_failed = False
+            self._negative.clear()
+
+    def _adopt_snapshot(self, fresh_only):
+        """Switch to the newest snapshot on disk if it beats the current table
+
+        Lets a cold instance, or one worker after another worker refreshed,
+        skip the download. Returns True if a snapshot was adopted.
+        """
+        if not self.snapshot_paths:
+            return False
+        snapshot = taxonomy_snapshot.open_latest(self.snapshot_paths)
+        if snapshot is None or time.time() - snapshot.created_at > self.ttl:
+            newer = self._from_shared(max(self.loaded_at, snapshot.created_at if snapshot else 0))
+            snapshot = newer or snapshot
+        if snapshot is None or snapshot.created_at <= self.loaded_at:
+            return False
+        if fresh_only and time.time() - snapshot.created_at > self.ttl:
+            return False
+        self._swap(snapshot, snapshot.created_at)
+        log.info("Loaded taxonomy snapshot %s (%d species)", snapshot.version, len(snapshot))
+        return True
+
+    def _from_shared(self, newer_than):
+        """Copy the shared snapshot to disk and open it if it was created
+        after newer_than; otherwise None"""
+        if self.shared is None:
+            return None
+        # The version is checked first, so the file is only fetched when new
+        if self._shared_version() <= newer_than:
+            return None
+        try:
+            found = self.shared.get("snapshot")
+            return taxonomy_snapshot.unpack(found[0], self.snapshot_paths) if found else None
+        except (zlib.error, OSError) as e:
+            log.warning("Ignoring shared taxonomy snapshot: %s", e)
+            return None
+
+    def _shared_version(self):
+        """created_at of the shared snapshot, or 0 if there is none"""
+        found = self.shared.get("version")
+        return _version_of(found[0]) if found else 0.0
+
+    def _publish(self, snapshot):
+        if self.shared is None:
+            return
+        try:
+            data = taxonomy_snapshot.pack(snapshot)
+        except OSError as e:
+            log.warning("Could not share taxonomy snapshot %s: %s", snapshot.version, e)
+            return
+        # The file before its version, so a reader of the version finds it
+        self.shared.set("snapshot", data, SHARED_SNAPSHOT_TTL)
+        self.shared.set("version", repr(snapshot.created_at).encode(), SHARED_SNAPSHOT_TTL)
+
+    def _download(self, api_key, wait):
+        """refresh(), unless another process holds the shared download lease
+
+        Then, with wait (nothing to serve meanwhile), wait for that process
+        to share a newer snapshot than the one shared now and adopt it,
+        downloading only if none arrives; without wait, keep the current
+        table until the next refresh finds it.
+        """
+        if self.shared is None:
+            self.refresh(api_key)
+            return
+        seen = self._shared_version()
+        lease = self.shared.claim("version")
+        try:
+            if lease is False:
+                if not wait:
+                    return
+                _, lease = self.shared.wait(
+                    "version", accept=lambda version: _version_of(version) > seen)
+                if self._adopt_snapshot(fresh_only=False):
+                    return
+            self.refresh(api_key)
+        finally:
+            if lease:
+                self.shared.release("version", lease)
+
+    def _load_initial(self, api_key):
+        # Only one caller downloads; the rest find the table filled in
+        with self._load_lock:
+            if not self.loaded_at and not self._adopt_snapshot(fresh_only=False):
+                self._download(api_key, wait=True)
+
+    def _refresh_in_background(self, api_key):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, args=(api_key,),
+                         daemon=True).start()
+
+    def _background_refresh(self, api_key):
+        try:
+            with self._load_lock:
+                if not self._adopt_snapshot(fresh_only=True):
+                    self._download(api_key, wait=False)
+        except Exception as e:
+            # Keep serving the stale table
+            with self._lock:
+                self.refresh_errors += 1
+                self._refresh_failed = True
+            log.warning("Taxonomy refresh failed: %s", e)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+def _version_of(data):
+    try:
+        return float(data)
+    except ValueError:
+        return 0.0
+
+
+TAXONOMY = register("taxonomy", TaxonomyCache(shared=cache_backends.shared(
+    "taxonomy", dumps=bytes, loads=bytes)))
+
+
+# Upper bound on codes resolved by one /api/species batch request
+MAX_BATCH_CODES = 500
+
+
+def parse_species_codes(codes):
+    """Turn "a,b,c" or a list of codes into a de-duplicated list
+
+    Raises ValueError if there are no codes or more than MAX_BATCH_CODES.
+    """
+    if isinstance(codes, str):
+        codes = codes.split(',')
+    if not isinstance(codes, (list, tuple)):
+        raise ValueError("codes must be a comma-separated string or a list")
+    cleaned = list(dict.fromkeys(str(code).strip() for code in codes if str(code).strip()))
+    if not cleaned:
+        raise ValueError("at least one species code is required")
+    if len(cleaned) > MAX_BATCH_CODES:
+        raise ValueError(f"at most {MAX_BATCH_CODES} species codes per request")
+    return cleaned
+
+
+def batch_response(results):
+    """Build the batch /api/species JSON body from lookup_many() results"""
+    return {
+        "species": {code: species_response(code, info) for code, info in results.items()}
+    }
+
+
+def species_response(species_code, info):
+    """Build the /api/species JSON body for a lookup result"""
+    if info is not None:
+        return {
+            "species_code": species_code,
+            "common_name": info["common_name"],
+            "family": info["family"],
+            "order": info["order"]
+        }
+    return {
+        "species_code": species_code,
+        "common_name": "Species not found",
+        "family": "Family information not available",
+        "order": "Order information not available",
+        "note": f"Species code '{species_code}' was not found in eBird's taxonomy database."
+    }
@@ -0,0 +1,218 @@
+# On-disk taxonomy snapshot
+# A compact SQLite file indexed by species code. It can be built at deploy
+# time (python taxonomy_snapshot.py) or is written after the first download,
+# so cold instances answer species lookups without fetching the CSV.
+
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+
+import logs
+import sqlite_files
+
+log = logs.get_logger(__name__)
+
+SCHEMA_VERSION = 2  # 2: added sci_name
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PATH = os.environ.get(
+    'TAXONOMY_SNAPSHOT_PATH', os.path.join(PROJECT_ROOT, 'data', 'taxonomy.sqlite'))
+FALLBACK_PATH = sqlite_files.fallback_path('flycatcher-taxonomy.sqlite')
+
+
+class TaxonomySnapshot:
+    """Read-only view of a snapshot file, queried one code at a time
+
+    Behaves like the in-memory taxonomy dict for get() and len(), but rows
+    stay on disk until they are asked for.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # Workers preloaded by a server's master share this object, and so
+        # the parsed snapshot, but each opens its own connection
+        self._conn = sqlite_files.ProcessConnection(path, read_only=True)
+        self._lock = threading.Lock()
+        meta = dict(self._conn.execute("SELECT key, value FROM meta"))
+        if int(meta.get("schema_version", 0)) != SCHEMA_VERSION:
+            self._conn.close()
+            raise sqlite3.DatabaseError(f"Unsupported taxonomy snapshot schema in {path}")
+        self.version = meta["version"]
+        self.created_at = float(meta["created_at"])
+        self.row_count = int(meta["row_count"])
+
+    def get(self, species_code, default=None):
+        """Return the info dict for species_code, or default if it is unknown"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT common_name, order_name, family, sci_name FROM species WHERE code = ?",
+                (species_code,)).fetchone()
+        if row is None:
+            return default
+        return {"common_name": row[0], "order": row[1], "family": row[2], "scientific_name": row[3]}
+
+    def get_many(self, species_codes):
+        """Return {code: info} for the codes that are in the snapshot"""
+        found = {}
+        codes = list(species_codes)
+        # Stay well under SQLite's bound-parameter limit
+        for start in range(0, len(codes), 500):
+            chunk = codes[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT code, common_name, order_name, family, sci_name FROM species "
+                    f"WHERE code IN ({placeholders})", chunk).fetchall()
+            for code, common_name, order, family, scientific_name in rows:
+                found[code] = {"common_name": common_name, "order": order, "family": family,
+                               "scientific_name": scientific_name}
+        return found
+
+    def names(self):
+        """Return [(code, common_name, scientific_name)] for every species"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT code, common_name, sci_name FROM species").fetchall()
+
+    def __contains__(self, species_code):
+        return self.get(species_code) is not None
+
+    def __len__(self):
+        return self.row_count
+
+
+def write_snapshot(path, rows):
+    """Write (code, common_name, order, family, scientific_name) rows to a new snapshot
+
+    Rows are inserted as they are consumed, so a streaming download never
+    has to be held in memory. The file is built next to the target and moved
+    into place atomically, so readers never see a half-written snapshot.
+    Returns the new snapshot's version string.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".taxonomy-", suffix=".sqlite", dir=directory)
+    os.close(fd)
+    try:
+        conn = sqlite3.connect(tmp_path)
+        try:
+            conn.execute("PRAGMA journal_mode = OFF")
+            conn.execute("PRAGMA synchronous = OFF")
+            conn.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            conn.execute(
+                "CREATE TABLE species (code TEXT PRIMARY KEY, common_name TEXT, "
+                "order_name TEXT, family TEXT, sci_name TEXT) WITHOUT ROWID")
+
+            digest = hashlib.sha1()
+            row_count = 0
+
+            def hashed(rows):
+                nonlocal row_count
+                for row in rows:
+                    digest.update("\x1f".join(row).encode("utf-8"))
+                    row_count += 1
+                    yield row
+
+            # A code listed twice keeps its last row, as the dict table did
+            conn.executemany("INSERT OR REPLACE INTO species VALUES (?, ?, ?, ?, ?)",
+                             hashed(rows))
+
+            created_at = time.time()
+            version = f"{int(created_at)}-{digest.hexdigest()[:12]}"
+            conn.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ("schema_version", str(SCHEMA_VERSION)),
+                ("version", version),
+                ("created_at", repr(created_at)),
+                ("row_count", str(row_count)),
+            ])
+            conn.commit()
+        finally:
+            conn.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return version
+
+
+def open_snapshot(path):
+    """Open the snapshot at path, or return None if it is missing or unusable"""
+    if not os.path.exists(path):
+        return None
+    try:
+        return TaxonomySnapshot(path)
+    except (sqlite3.Error, KeyError, ValueError) as e:
+        log.warning("Ignoring taxonomy snapshot %s: %s", path, e)
+        return None
+
+
+def open_latest(paths=(DEFAULT_PATH, FALLBACK_PATH)):
+    """Return the newest usable snapshot among paths, or None"""
+    snapshots = [s for s in (open_snapshot(p) for p in paths) if s is not None]
+    if not snapshots:
+        return None
+    return max(snapshots, key=lambda s: s.created_at)
+
+
+def pack(snapshot):
+    """The snapshot's file, compressed, for a cache shared between hosts"""
+    with open(snapshot.path, "rb") as f:
+        return zlib.compress(f.read(), 6)
+
+
+def unpack(data, paths=(DEFAULT_PATH, FALLBACK_PATH)):
+    """Write pack() output to the first writable path and open it
+
+    Returns None if no location is writable or the data is not a usable
+    snapshot. Like write_snapshot, the file is moved into place atomically.
+    """
+    path = sqlite_files.first_writable(paths, "Taxonomy snapshot")
+    if path is None:
+        return None
+    fd, tmp_path = tempfile.mkstemp(prefix=".taxonomy-", suffix=".sqlite",
+                                    dir=os.path.dirname(path) or ".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(zlib.decompress(data))
+        snapshot = open_snapshot(tmp_path)
+        if snapshot is None:
+            os.unlink(tmp_path)
+            return None
+        snapshot._conn.close()
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return open_snapshot(path)
+
+
+def save(rows, paths=(DEFAULT_PATH, FALLBACK_PATH)):
+    """Stream rows into a snapshot at the first writable path and open it
+
+    Returns None, without consuming rows, if no location is writable;
+    callers then keep the table in memory.
+    """
+    path = sqlite_files.first_writable(paths, "Taxonomy snapshot")
+    if path is None:
+        return None
+    write_snapshot(path, rows)
+    return TaxonomySnapshot(path)
+
+
+if __name__ == "__main__":
+    # Build a snapshot at deploy time: python taxonomy_snapshot.py [path]
+    import sys
+    from taxonomy import stream_taxonomy
+
+    api_key = os.environ.get('EBIRD_API_KEY')
+    if not api_key:
+        sys.exit("EBIRD_API_KEY must be set to build the taxonomy snapshot")
+    target = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+    version = write_snapshot(target, stream_taxonomy(api_key))
+    print(f"Wrote taxonomy snapshot {version} to {target}")
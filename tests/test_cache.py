@@ -0,0 +1,122 @@
+"""
+TTLCache single-flight loading, alone and on a shared tier
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cache_backends  # noqa: E402
+from cache import TTLCache  # noqa: E402
+
+
+def run_together(count, target):
+    """Call target() from count threads at once; returns results in order"""
+    results = [None] * count
+    barrier = threading.Barrier(count)
+
+    def run(i):
+        barrier.wait()
+        try:
+            results[i] = target()
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+class SlowLoader:
+    """Loader that counts its calls and takes `delay` seconds"""
+
+    def __init__(self, value="v", delay=0.1, error=None):
+        self.value = value
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class GetOrLoadTest(unittest.TestCase):
+
+    def test_concurrent_misses_share_one_load(self):
+        cache = TTLCache(ttl=60)
+        loader = SlowLoader()
+
+        results = run_together(8, lambda: cache.get_or_load("k", loader))
+
+        self.assertEqual(loader.calls, 1)
+        self.assertEqual({value for value, _ in results}, {"v"})
+        statuses = sorted(status for _, status in results)
+        self.assertEqual(statuses, ["COALESCED"] * 7 + ["MISS"])
+        self.assertEqual(cache.get_or_load("k", loader), ("v", "HIT"))
+
+    def test_loader_errors_reach_every_waiter_and_are_not_cached(self):
+        cache = TTLCache(ttl=60)
+        error = RuntimeError("upstream down")
+        loader = SlowLoader(error=error)
+
+        results = run_together(5, lambda: cache.get_or_load("k", loader))
+
+        self.assertEqual(loader.calls, 1)
+        self.assertTrue(all(result is error for result in results))
+        self.assertEqual(cache.get_or_load("k", SlowLoader("again", delay=0)), ("again", "MISS"))
+
+    def test_zero_ttl_values_are_not_cached(self):
+        cache = TTLCache(ttl=60, ttl_for=lambda value: 0 if value == "skip" else 60)
+
+        cache.get_or_load("k", lambda: "skip")
+
+        self.assertIsNone(cache.peek("k"))
+
+    def test_lru_eviction(self):
+        cache = TTLCache(ttl=60, max_entries=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+
+        self.assertEqual((cache.peek("a"), cache.peek("b"), cache.peek("c")), (1, None, 3))
+
+    def test_processes_on_a_shared_tier_load_once(self):
+        backend = cache_backends.MemoryBackend()
+        # One cache per simulated process, all behind the same backend
+        caches = [TTLCache(ttl=60, shared=cache_backends.SharedTier(backend, "test"))
+                  for _ in range(4)]
+        loader = SlowLoader(value={"rows": [1, 2]}, delay=0.2)
+        pending = iter(caches)
+        lock = threading.Lock()
+
+        def load():
+            with lock:
+                cache = next(pending)
+            return cache.get_or_load("k", loader)
+
+        results = run_together(4, load)
+
+        self.assertEqual(loader.calls, 1)
+        self.assertEqual(sorted(status for _, status in results), ["MISS"] + ["SHARED"] * 3)
+        self.assertTrue(all(value == {"rows": [1, 2]} for value, _ in results))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,156 @@
+"""
+Shared cache tier: values, and the claim/wait/release cycle, on each backend
+
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import cache_backends  # noqa: E402
+from fake_redis import FakeRedis  # noqa: E402
+
+
+def later(delay, action):
+    """Run action() on a thread after delay seconds"""
+    timer = threading.Timer(delay, action)
+    timer.start()
+    return timer
+
+
+class LeaseTests:
+    """Run against the backend make_backend() returns"""
+
+    def setUp(self):
+        self.saved_lease = cache_backends.CACHE_LEASE
+        cache_backends.CACHE_LEASE = 5
+        self.backend = self.make_backend()
+
+    def tearDown(self):
+        cache_backends.CACHE_LEASE = self.saved_lease
+
+    def tier(self):
+        # One tier per simulated process, all on the same backend
+        return cache_backends.SharedTier(self.backend, "test")
+
+    def test_values_round_trip_with_their_expiry(self):
+        a, b = self.tier(), self.tier()
+
+        a.set("k", {"rows": [1, 2]}, 60)
+        value, expires_at = b.get("k")
+
+        self.assertEqual(value, {"rows": [1, 2]})
+        self.assertAlmostEqual(expires_at, time.time() + 60, delta=1)
+        self.assertIsNone(b.get("missing"))
+
+    def test_unreadable_entries_are_misses_and_dropped(self):
+        # Entries written in an older format than loads() expects
+        def pair(first, second):
+            return first, second
+
+        tier = cache_backends.SharedTier(self.backend, "test",
+                                         loads=lambda body: pair(*json.loads(body)))
+        self.backend.set(tier.key("k"), b"9999999999.000\n[1,2,3]", 60)
+        self.backend.set(tier.key("j"), b"9999999999.000\nnot json", 60)
+
+        self.assertIsNone(tier.get("k"))
+        self.assertIsNone(self.backend.get(tier.key("k")))
+        self.assertIsNone(tier.get("j"))
+        self.assertIsNone(self.backend.get(tier.key("j")))
+
+    def test_waiter_gets_the_holders_value(self):
+        a, b = self.tier(), self.tier()
+        token = a.claim("k")
+
+        def finish():
+            a.set("k", "loaded", 60)
+            a.release("k", token)
+
+        later(0.1, finish)
+        found, lease = b.wait("k", timeout=2)
+
+        self.assertEqual(found[0], "loaded")
+        self.assertIsNone(lease)
+
+    def test_waiter_takes_over_when_the_holder_gives_up(self):
+        a, b = self.tier(), self.tier()
+        token = a.claim("k")
+
+        later(0.1, lambda: a.release("k", token))
+        found, lease = b.wait("k", timeout=2)
+
+        self.assertIsNone(found)
+        self.assertTrue(lease)
+        self.assertIs(a.claim("k"), False)
+
+    def test_waiter_ignores_values_accept_rejects(self):
+        a, b = self.tier(), self.tier()
+        a.set("version", 1, 60)
+        token = a.claim("version")
+
+        def finish():
+            a.set("version", 2, 60)
+            a.release("version", token)
+
+        later(0.2, finish)
+        found, lease = b.wait("version", timeout=2, accept=lambda version: version > 1)
+
+        self.assertEqual(found[0], 2)
+
+    def test_one_claim_at_a_time(self):
+        a, b = self.tier(), self.tier()
+
+        token = a.claim("k")
+        self.assertTrue(token)
+        self.assertIs(b.claim("k"), False)
+        a.release("k", token)
+        self.assertTrue(b.claim("k"))
+
+    def test_expired_lease_is_not_released_by_its_old_holder(self):
+        cache_backends.CACHE_LEASE = 0.2
+        a, b, c = self.tier(), self.tier(), self.tier()
+
+        stale = a.claim("k")
+        time.sleep(0.3)
+        fresh = b.claim("k")
+        self.assertTrue(fresh)
+        a.release("k", stale)
+
+        self.assertIs(c.claim("k"), False)
+        b.release("k", fresh)
+        self.assertTrue(c.claim("k"))
+
+
+class MemoryLeaseTest(LeaseTests, unittest.TestCase):
+
+    def make_backend(self):
+        return cache_backends.MemoryBackend()
+
+
+class SQLiteLeaseTest(LeaseTests, unittest.TestCase):
+
+    def make_backend(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return cache_backends.SQLiteBackend(os.path.join(directory, "cache.sqlite"))
+
+
+class RedisLeaseTest(LeaseTests, unittest.TestCase):
+
+    def make_backend(self):
+        fake = FakeRedis().start()
+        self.addCleanup(fake.stop)
+        return cache_backends.from_url(fake.url)
+
+
+if __name__ == "__main__":
+    unittest.main()
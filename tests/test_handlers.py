@@ -0,0 +1,76 @@
+"""
+Handler replies while eBird cannot be reached
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import time
+import unittest
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import ebird  # noqa: E402
+import handlers  # noqa: E402
+import upstream  # noqa: E402
+
+# Nothing listens on the discard port, so any call that gets through fails
+EBIRD_BASE = "http://127.0.0.1:9/v2"
+BBOX = "-35,16,-22,33"
+
+
+class UpstreamDownTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = handlers.EBIRD_API_KEY, ebird.EBIRD_BASE, ebird.LAST_GOOD
+        # A fresh key gets a fresh lane, so tests do not share breakers
+        handlers.EBIRD_API_KEY = uuid.uuid4().hex
+        ebird.EBIRD_BASE = EBIRD_BASE
+        ebird.LAST_GOOD = None
+        ebird.OBSERVATION_CACHE.clear()
+
+    def tearDown(self):
+        handlers.EBIRD_API_KEY, ebird.EBIRD_BASE, ebird.LAST_GOOD = self.saved
+        ebird.OBSERVATION_CACHE.clear()
+
+    def open_circuit(self, retry_after=30):
+        breaker = upstream._lane("127.0.0.1:9", handlers.EBIRD_API_KEY).breaker
+        breaker.record(429, retry_after)
+        self.assertEqual(breaker.state, "open")
+
+    def assert_unavailable(self, reply, regions):
+        status, body, headers = reply
+        self.assertEqual(status, 503)
+        self.assertEqual(headers["Retry-After"], "30")
+        for region in regions:
+            self.assertEqual(body["regions"][region]["status"], 503)
+            self.assertLessEqual(body["regions"][region]["retry_after"], 30)
+
+    def test_bbox_page_is_503_while_the_circuit_is_open(self):
+        self.open_circuit()
+        reply = handlers.observations({"region": "ZA", "bbox": BBOX, "limit": "50"})
+        self.assert_unavailable(reply, ["ZA"])
+
+    def test_clusters_are_503_while_the_circuit_is_open(self):
+        self.open_circuit()
+        reply = handlers.observation_clusters({"region": "ZA,NA", "bbox": BBOX, "zoom": "6"})
+        self.assert_unavailable(reply, ["ZA", "NA"])
+
+    def test_network_errors_stay_502(self):
+        saved = upstream.BACKOFF_BASE
+        upstream.BACKOFF_BASE = 0.01
+        try:
+            status, body, headers = handlers.observation_clusters(
+                {"region": "ZA", "bbox": BBOX, "zoom": "6"})
+        finally:
+            upstream.BACKOFF_BASE = saved
+        self.assertEqual(status, 502)
+        self.assertIsNone(headers)
+        self.assertNotIn("retry_after", body["regions"]["ZA"])
+
+
+if __name__ == "__main__":
+    unittest.main()
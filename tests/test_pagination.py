@@ -0,0 +1,109 @@
+"""
+Observation page cursors, alone and paged through handlers.observations
+
+    python -m unittest discover tests
+"""
+
+import json
+import os
+import sys
+import unittest
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import ebird  # noqa: E402
+import handlers  # noqa: E402
+from fake_upstream import FakeUpstream  # noqa: E402
+
+
+class CursorTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for scope in ["abc123", "ZA=f00d|-35,16,-22,33", ""]:
+            for offset in [0, 1, 50, 10 ** 9]:
+                with self.subTest(scope=scope, offset=offset):
+                    cursor = ebird.encode_cursor(scope, offset)
+                    self.assertNotIn("=", cursor)
+                    self.assertEqual(ebird.decode_cursor(cursor, scope), offset)
+
+    def test_no_cursor_is_the_first_page(self):
+        self.assertEqual(ebird.decode_cursor(None, "abc"), 0)
+        self.assertEqual(ebird.decode_cursor("", "abc"), 0)
+
+    def test_malformed_cursors(self):
+        for cursor in ["!!!", "bm90LWEtY3Vyc29y", ebird.encode_cursor("abc", "x"), "/w"]:
+            with self.subTest(cursor=cursor):
+                with self.assertRaisesRegex(ValueError, "malformed"):
+                    ebird.decode_cursor(cursor, "abc")
+
+    def test_cursor_for_other_data_has_expired(self):
+        for cursor in [ebird.encode_cursor("abc", 50), ebird.encode_cursor("xyz", -1)]:
+            with self.subTest(cursor=cursor):
+                with self.assertRaisesRegex(ValueError, "expired"):
+                    ebird.decode_cursor(cursor, "xyz")
+
+
+def json_body(reply):
+    status, body, _ = reply
+    return status, json.loads(body.body) if status == 200 else body
+
+
+class PagingTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.fake = FakeUpstream(observations=500).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fake.stop()
+
+    def setUp(self):
+        self.saved = handlers.EBIRD_API_KEY, ebird.EBIRD_BASE, ebird.LAST_GOOD
+        handlers.EBIRD_API_KEY = uuid.uuid4().hex
+        ebird.EBIRD_BASE = self.fake.url + "/v2"
+        ebird.LAST_GOOD = None
+        ebird.OBSERVATION_CACHE.clear()
+
+    def tearDown(self):
+        handlers.EBIRD_API_KEY, ebird.EBIRD_BASE, ebird.LAST_GOOD = self.saved
+        ebird.OBSERVATION_CACHE.clear()
+
+    def page_through(self, args):
+        rows, cursor, pages = [], None, 0
+        while True:
+            status, page = json_body(handlers.observations(dict(args, cursor=cursor or "")))
+            self.assertEqual(status, 200)
+            rows.extend(page["observations"])
+            pages += 1
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return rows, page["total"], pages
+
+    def test_pages_cover_the_bbox_once(self):
+        for region in ["ZA", "ZA,NA"]:
+            with self.subTest(region=region):
+                query = {"region": region, "bbox": "-90,-180,90,180", "limit": "37"}
+                rows, total, pages = self.page_through(query)
+
+                _, everything = json_body(handlers.observations(dict(query, limit="5000")))
+                self.assertGreater(total, 37)
+                self.assertEqual(len(rows), total)
+                self.assertEqual(pages, -(-total // 37))
+                self.assertEqual(rows, everything["observations"])
+
+    def test_cursor_from_another_bbox_is_rejected(self):
+        query = {"region": "ZA", "bbox": "-90,-180,90,180", "limit": "10"}
+        cursor = json_body(handlers.observations(query))[1]["next_cursor"]
+
+        status, body = json_body(handlers.observations(dict(query, bbox="-80,-180,90,180",
+                                                            cursor=cursor)))
+
+        self.assertEqual(status, 400)
+        self.assertIn("expired", body["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
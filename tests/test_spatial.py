@@ -0,0 +1,88 @@
+"""
+GridIndex queries against a brute-force scan of the same rows
+
+    python -m unittest discover tests
+"""
+
+import os
+import random
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import spatial  # noqa: E402
+from spatial import GridIndex  # noqa: E402
+
+
+def random_rows(count, seed=7):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(count):
+        if i % 50 == 0:
+            rows.append({"id": i, "latitude": None, "longitude": None})
+            continue
+        # Clustered around a few points, plus some spread over the globe
+        if i % 3:
+            lat, lng = rng.choice([(-33.9, 18.4), (64.1, -21.9), (0.5, 179.95)])
+            lat, lng = lat + rng.uniform(-0.5, 0.5), lng + rng.uniform(-0.5, 0.5)
+            lng = (lng + 180) % 360 - 180
+        else:
+            lat, lng = rng.uniform(-89, 89), rng.uniform(-180, 180)
+        rows.append({"id": i, "latitude": lat, "longitude": lng})
+    return rows
+
+
+class GridIndexTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.rows = random_rows(3000)
+        cls.located = [row for row in cls.rows if row["latitude"] is not None]
+
+    def assert_bbox_matches(self, bbox, cell_degrees=spatial.DEFAULT_CELL_DEGREES):
+        index = GridIndex(self.rows, cell_degrees)
+        expected = [row for row in self.located
+                    if spatial.in_bbox(row["latitude"], row["longitude"], bbox)]
+        self.assertEqual(index.within_bbox(*bbox), expected)
+        return expected
+
+    def test_bbox_matches_brute_force(self):
+        for bbox in [(-34.2, 18.1, -33.6, 18.9), (-90, -180, 90, 180), (60, -30, 70, -10),
+                     (10, 10, 10.05, 10.05)]:
+            with self.subTest(bbox=bbox):
+                self.assert_bbox_matches(bbox)
+
+    def test_bbox_across_the_antimeridian(self):
+        found = self.assert_bbox_matches((-1, 179.5, 2, -179.5))
+        self.assertTrue(found)
+        self.assertTrue(any(row["longitude"] < 0 for row in found))
+        self.assertTrue(any(row["longitude"] > 0 for row in found))
+
+    def test_bbox_with_coarse_cells(self):
+        # Few occupied cells, so the index walks its cells instead of the box
+        self.assert_bbox_matches((-40, 10, -30, 30), cell_degrees=5)
+
+    def test_radius_matches_brute_force(self):
+        index = GridIndex(self.rows)
+        for lat, lng, radius_km in [(-33.9, 18.4, 10), (64.1, -21.9, 50), (0, 0, 100),
+                                    (88.5, 40, 100)]:
+            with self.subTest(lat=lat, lng=lng, radius_km=radius_km):
+                expected = sorted(
+                    (spatial.haversine_km(lat, lng, row["latitude"], row["longitude"]), row["id"])
+                    for row in self.located
+                    if spatial.haversine_km(lat, lng, row["latitude"], row["longitude"]) <= radius_km)
+                found = [(distance, row["id"]) for distance, row in
+                         index.within_radius(lat, lng, radius_km)]
+                self.assertEqual(found, expected)
+
+    def test_rows_without_coordinates_are_left_out(self):
+        index = GridIndex(self.rows)
+        ids = {row["id"] for row in index.within_bbox(-90, -180, 90, 180)}
+        self.assertNotIn(0, ids)
+        self.assertEqual(len(ids), len(self.located))
+
+
+if __name__ == "__main__":
+    unittest.main()
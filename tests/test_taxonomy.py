@@ -0,0 +1,68 @@
+"""
+Taxonomy CSV parsing and the species table built from it
+
+    python -m unittest discover tests
+"""
+
+import io
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import taxonomy  # noqa: E402
+from fake_upstream import taxonomy_csv  # noqa: E402
+
+
+class ParseTaxonomyCsvTest(unittest.TestCase):
+
+    def parse(self, text):
+        return list(taxonomy.parse_taxonomy_csv(io.StringIO(text, newline="")))
+
+    def test_quoted_commas_stay_in_their_field(self):
+        rows = self.parse(
+            "SCIENTIFIC_NAME,COMMON_NAME,SPECIES_CODE,ORDER,FAMILY_COM_NAME\r\n"
+            'Genus one,"Warbler, Eastern",war1,Passeriformes,"Wood-Warblers, New World"\r\n'
+            'Genus two,"He said ""hi""",war2,Passeriformes,Warblers\r\n')
+
+        self.assertEqual(rows, [
+            ("war1", "Warbler, Eastern", "Passeriformes", "Wood-Warblers, New World", "Genus one"),
+            ("war2", 'He said "hi"', "Passeriformes", "Warblers", "Genus two"),
+        ])
+
+    def test_columns_are_found_by_header_name(self):
+        rows = self.parse(
+            " species_code ,ORDER,EXTRA,COMMON_NAME,FAMILY_COM_NAME,SCIENTIFIC_NAME\n"
+            "abc,Ord,x,Name,Fam,Sci\n")
+
+        self.assertEqual(rows, [("abc", "Name", "Ord", "Fam", "Sci")])
+
+    def test_short_rows_and_rows_without_a_code_are_skipped(self):
+        rows = self.parse(
+            "SPECIES_CODE,COMMON_NAME,ORDER,FAMILY_COM_NAME,SCIENTIFIC_NAME\n"
+            "abc,Name\n"
+            ",Name,Ord,Fam,Sci\n"
+            "def,Name,Ord,Fam,Sci\n")
+
+        self.assertEqual([row[0] for row in rows], ["def"])
+
+    def test_unexpected_header_is_an_error(self):
+        with self.assertRaises(ValueError):
+            self.parse("CODE,NAME\nabc,Name\n")
+
+    def test_full_download_parses_every_row(self):
+        text = taxonomy_csv(500).decode()
+
+        table = taxonomy.build_table(taxonomy.parse_taxonomy_csv(io.StringIO(text, newline="")))
+
+        self.assertEqual(len(table), 500)
+        # Every 10th common name in the stand-in's CSV contains a comma
+        self.assertEqual(table["spec10"]["common_name"], "Warbler 10, Eastern")
+        self.assertEqual(table["spec10"]["scientific_name"], "Genus species10")
+        self.assertEqual(table["spec11"]["family"], "Family 11")
+
+
+if __name__ == "__main__":
+    unittest.main()
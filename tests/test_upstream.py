@@ -0,0 +1,85 @@
+"""
+Circuit breaker behaviour of upstream.get against the local eBird stand-in
+
+    python -m unittest discover tests
+"""
+
+import os
+import sys
+import threading
+import time
+import unittest
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import upstream  # noqa: E402
+from fake_upstream import FakeUpstream  # noqa: E402
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.fake = FakeUpstream(latency=0.05, status=503).start()
+        self.saved = upstream.BACKOFF_BASE, upstream.BREAKER_THRESHOLD, upstream.BREAKER_COOLDOWN
+        upstream.BACKOFF_BASE = 0.01
+        upstream.BREAKER_THRESHOLD = 2
+        upstream.BREAKER_COOLDOWN = 5
+        # A fresh key gets a fresh lane, so tests do not share breakers
+        self.headers = {"X-eBirdApiToken": uuid.uuid4().hex}
+
+    def tearDown(self):
+        upstream.BACKOFF_BASE, upstream.BREAKER_THRESHOLD, upstream.BREAKER_COOLDOWN = self.saved
+        self.fake.stop()
+
+    def fetch(self, region, retries=upstream.MAX_RETRIES):
+        try:
+            return upstream.get(f"{self.fake.url}/v2/data/obs/{region}/recent",
+                                retries=retries, headers=self.headers, timeout=5)
+        except upstream.RequestException as e:
+            return e
+
+    def breaker(self):
+        return upstream._lane(f"127.0.0.1:{self.fake.server.server_port}",
+                              self.headers["X-eBirdApiToken"]).breaker
+
+    def test_concurrent_failures_open_the_circuit_once(self):
+        threads = [threading.Thread(target=self.fetch, args=(f"US-{i}",)) for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        breaker = self.breaker()
+        self.assertEqual(breaker.state, "open")
+        # One step: opened for the base cooldown, the next one doubled
+        self.assertLessEqual(breaker.opened_until - time.monotonic(), 5)
+        self.assertEqual(breaker.cooldown, 10)
+        # Retries stop once it opens; unchecked, each call is tried 3 times
+        self.assertLess(self.fake.call_counts().get("observations"), 12 + 12)
+
+    def test_retries_stop_once_the_circuit_opens(self):
+        result = self.fetch("US-NY", retries=5)
+
+        self.assertIsInstance(result, upstream.UpstreamUnavailable)
+        self.assertEqual(self.fake.call_counts().get("observations"), 2)
+
+    def test_failed_probe_doubles_the_cooldown_without_retrying(self):
+        self.fetch("US-NY", retries=1)
+        breaker = self.breaker()
+        self.assertEqual(breaker.cooldown, 10)
+        # Skip to the end of the cooldown instead of sleeping through it
+        breaker.opened_until = time.monotonic()
+
+        self.fetch("US-NY", retries=5)
+
+        self.assertEqual(self.fake.call_counts().get("observations"), 3)
+        self.assertEqual(breaker.state, "open")
+        self.assertGreater(breaker.opened_until - time.monotonic(), 5)
+        self.assertEqual(breaker.cooldown, 20)
+        self.assertFalse(breaker.probing)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,432 @@
+# Shared HTTP client for upstream APIs (eBird, Google Maps)
+# Keeps one pooled keep-alive session per host so requests reuse TCP/TLS
+# connections, retries idempotent GETs with jittered backoff, and records
+# per-host call timings. Calls are governed per API key: a token bucket
+# paces them, identical in-flight requests are coalesced, and a circuit
+# breaker stops calls after 403, 429 or repeated 5xx responses.
+#
+# requests costs ~90 ms to import, so it is loaded on the first upstream
+# call; a cold serverless function answering from cache never pays for it.
+# upstream.RequestException and upstream.UpstreamUnavailable import it on
+# first access, which only except clauses do once something has failed.
+
+import math
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import logs
+import metrics
+
+log = logs.get_logger(__name__)
+
+# Connections kept open per host; should cover the number of server threads
+POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 20))
+MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', 2))
+BACKOFF_BASE = float(os.environ.get('UPSTREAM_BACKOFF', 0.25))  # seconds
+BACKOFF_MAX = 2.0
+# Gateway errors are usually transient; anything else is returned as-is
+RETRY_STATUSES = {502, 503, 504}
+
+# Token bucket per API key and host (requests per second; 0 disables);
+# callers wait up to UPSTREAM_MAX_WAIT seconds for a token
+RATE_LIMIT = float(os.environ.get('UPSTREAM_RATE', 10))
+RATE_BURST = int(os.environ.get('UPSTREAM_BURST', 20))
+MAX_QUEUE_WAIT = float(os.environ.get('UPSTREAM_MAX_WAIT', 10))
+# Circuit breaker per API key and host
+BREAKER_THRESHOLD = int(os.environ.get('UPSTREAM_BREAKER_THRESHOLD', 5))
+BREAKER_COOLDOWN = float(os.environ.get('UPSTREAM_BREAKER_COOLDOWN', 5))  # seconds
+BREAKER_MAX_COOLDOWN = 300.0
+
+_sessions = {}
+_timings = {}
+_lanes = {}
+_in_flight = {}
+_governor_stats = {}
+_lock = threading.Lock()
+_unavailable_class = None
+
+
+def __getattr__(name):
+    if name == 'RequestException':
+        import requests
+        return requests.RequestException
+    if name == 'UpstreamUnavailable':
+        return _unavailable()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _unavailable():
+    """The UpstreamUnavailable class, defined on first use"""
+    global _unavailable_class
+    with _lock:
+        if _unavailable_class is None:
+            import requests
+
+            class UpstreamUnavailable(requests.RequestException):
+                """Raised without calling the host: its circuit is open or the rate-limit queue is full"""
+
+                def __init__(self, host, retry_after, reason):
+                    # Whole seconds, rounded up once, so the message and a
+                    # Retry-After header built from it agree
+                    retry_after = math.ceil(retry_after)
+                    super().__init__(f"{host} unavailable ({reason}), retry in {retry_after}s")
+                    self.host = host
+                    self.retry_after = retry_after
+                    self.reason = reason
+
+            _unavailable_class = UpstreamUnavailable
+        return _unavailable_class
+
+
+def _after_fork():
+    # A forked worker opens its own connections instead of sharing the
+    # parent's sockets, and must not wait on the parent's locks or loads
+    global _lock
+    _lock = threading.Lock()
+    _sessions.clear()
+    _in_flight.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork)
+
+
+def session_for(host):
+    """Return the pooled keep-alive session for host, creating it once"""
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=0)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _sessions[host] = session
+        return session
+
+
+class TokenBucket:
+    """`rate` requests per second with bursts of up to `burst`"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, max_wait):
+        """Take a token; returns the seconds to wait before using it, or None
+        if that would be longer than max_wait (nothing is taken then)
+
+        Tokens may go negative, so waiters are served in reservation order.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if wait > max_wait:
+                return None
+            self._tokens -= 1
+            return wait
+
+
+class CircuitBreaker:
+    """Stops calls to a host/key pair that keeps failing
+
+    403 and 429 open the circuit at once (the key is banned or throttled);
+    connection errors and 5xx open it after `threshold` failures in a row.
+    After the cooldown a single probe is let through: success closes the
+    circuit, failure opens it again with the cooldown doubled, up to
+    BREAKER_MAX_COOLDOWN. Failures of calls that were already in flight
+    when it opened are counted but do not reopen it.
+    """
+
+    def __init__(self, host, threshold=None, cooldown=None):
+        self.host = host
+        self.threshold = threshold or BREAKER_THRESHOLD
+        self.base_cooldown = cooldown or BREAKER_COOLDOWN
+        self.cooldown = self.base_cooldown
+        self.failures = 0
+        self.opened_until = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_until is None:
+            return "closed"
+        return "half_open" if time.monotonic() >= self.opened_until else "open"
+
+    def acquire(self):
+        """Allow a call or raise UpstreamUnavailable; returns True for the probe call"""
+        with self._lock:
+            if self.opened_until is None:
+                return False
+            remaining = self.opened_until - time.monotonic()
+            if remaining <= 0 and not self.probing:
+                self.probing = True
+                return True
+        self._refuse(remaining)
+
+    def check(self):
+        """Raise UpstreamUnavailable if the circuit has opened; for retries"""
+        with self._lock:
+            if self.opened_until is None:
+                return
+            remaining = self.opened_until - time.monotonic()
+        self._refuse(remaining)
+
+    def _refuse(self, remaining):
+        _reject(self.host, "circuit_open")
+        raise _unavailable()(self.host, max(remaining, 1), "circuit open")
+
+    def release(self):
+        with self._lock:
+            self.probing = False
+
+    def record(self, status, retry_after=None, probe=False):
+        """Feed one response status (None for a network error) into the breaker
+
+        probe: the call was the one let through by acquire() after the cooldown
+        """
+        failed = status is None or status in (403, 429) or status >= 500
+        with self._lock:
+            if probe:
+                self.probing = False
+            if not failed:
+                if self.opened_until is not None:
+                    metrics.UPSTREAM_CIRCUIT_OPEN.dec(self.host)
+                    log.info("Circuit for %s closed", self.host)
+                self.failures = 0
+                self.opened_until = None
+                self.cooldown = self.base_cooldown
+                return
+            self.failures += 1
+            if self.opened_until is None:
+                if status not in (403, 429) and self.failures < self.threshold:
+                    return
+                metrics.UPSTREAM_CIRCUIT_OPEN.inc(self.host)
+            elif not probe:
+                # Calls in flight when it opened do not reopen it; only the probe does
+                return
+            duration = max(self.cooldown, retry_after or 0)
+            self.opened_until = time.monotonic() + duration
+            self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+        log.warning("Circuit for %s opened for %.0fs after status %s", self.host, duration, status)
+
+
+class _Lane:
+    """Rate limit and circuit state for one API key on one host"""
+
+    def __init__(self, host):
+        self.host = host
+        self.bucket = TokenBucket(RATE_LIMIT, RATE_BURST) if RATE_LIMIT > 0 else None
+        self.breaker = CircuitBreaker(host)
+        self.queued = 0
+
+    def wait_for_token(self):
+        if self.bucket is None:
+            return
+        wait = self.bucket.reserve(MAX_QUEUE_WAIT)
+        if wait is None:
+            _reject(self.host, "queue_full")
+            raise _unavailable()(self.host, MAX_QUEUE_WAIT, "rate limit queue full")
+        metrics.UPSTREAM_QUEUE_WAIT.observe(wait, self.host)
+        if wait <= 0:
+            return
+        with _lock:
+            self.queued += 1
+        metrics.UPSTREAM_QUEUE_DEPTH.inc(self.host)
+        try:
+            time.sleep(wait)
+        finally:
+            with _lock:
+                self.queued -= 1
+            metrics.UPSTREAM_QUEUE_DEPTH.dec(self.host)
+
+
+class _Flight:
+    """One in-flight request that identical requests wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+def _api_key(kwargs):
+    headers = kwargs.get('headers') or {}
+    params = kwargs.get('params') or {}
+    return headers.get('X-eBirdApiToken') or (params.get('key') if isinstance(params, dict) else None)
+
+
+def _freeze(mapping):
+    if isinstance(mapping, dict):
+        return tuple(sorted((str(key), str(value)) for key, value in mapping.items()))
+    return mapping
+
+
+def _lane(host, api_key):
+    with _lock:
+        lane = _lanes.get((host, api_key))
+        if lane is None:
+            lane = _lanes[(host, api_key)] = _Lane(host)
+        return lane
+
+
+def _reject(host, reason):
+    metrics.UPSTREAM_REJECTED.inc(host, reason)
+    with _lock:
+        _governor(host)["rejected"] += 1
+
+
+# Callers must hold _lock
+def _governor(host):
+    g = _governor_stats.get(host)
+    if g is None:
+        g = _governor_stats[host] = {"coalesced": 0, "rejected": 0}
+    return g
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After', ''))
+    except ValueError:
+        return None
+
+
+def get(url, retries=MAX_RETRIES, **kwargs):
+    """GET url through the host's pooled session
+
+    Calls are paced by a token bucket per API key and host, waiting for a
+    token rather than failing. Identical non-streaming requests already in
+    flight share one upstream call and its response. While a key's circuit
+    is open, UpstreamUnavailable (a requests.RequestException) is raised
+    without calling the host.
+
+    Connection failures and 502/503/504 responses are retried up to
+    `retries` times with full-jitter exponential backoff. Read timeouts are
+    not retried, since the request may already have been slow for the
+    whole timeout. Other keyword arguments go to requests.Session.get.
+    """
+    host = urlsplit(url).netloc
+    lane = _lane(host, _api_key(kwargs))
+    if kwargs.get('stream'):
+        # A streamed body can only be read once, so it is never shared
+        return _send(lane, url, retries, kwargs)
+
+    flight_key = (url, _freeze(kwargs.get('params')), _freeze(kwargs.get('headers')))
+    with _lock:
+        flight = _in_flight.get(flight_key)
+        leader = flight is None
+        if leader:
+            flight = _in_flight[flight_key] = _Flight()
+        else:
+            _governor(host)["coalesced"] += 1
+    if not leader:
+        metrics.UPSTREAM_COALESCED.inc(host)
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.response
+
+    try:
+        flight.response = _send(lane, url, retries, kwargs)
+        return flight.response
+    except Exception as e:
+        flight.error = e
+        raise
+    finally:
+        with _lock:
+            del _in_flight[flight_key]
+        if flight.response is None and flight.error is None:
+            flight.error = _unavailable()(host, 0, "request aborted")
+        flight.done.set()
+
+
+def _send(lane, url, retries, kwargs):
+    import requests
+
+    probe = lane.breaker.acquire()
+    if probe:
+        # The probe only tests whether the host has recovered
+        retries = 0
+    try:
+        session = session_for(lane.host)
+        attempt = 0
+        while True:
+            lane.wait_for_token()
+            start = time.perf_counter()
+            try:
+                r = session.get(url, **kwargs)
+            except requests.RequestException as e:
+                _record(lane.host, start, None, attempt)
+                lane.breaker.record(None, probe=probe)
+                if not isinstance(e, requests.ConnectionError) or attempt >= retries:
+                    raise
+            else:
+                _record(lane.host, start, r.status_code, attempt)
+                lane.breaker.record(r.status_code, _retry_after(r), probe=probe)
+                if r.status_code not in RETRY_STATUSES or attempt >= retries:
+                    return r
+                r.close()
+            attempt += 1
+            time.sleep(random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1))))
+            # Stop retrying once this or another call has opened the circuit
+            lane.breaker.check()
+    finally:
+        if probe:
+            lane.breaker.release()
+
+
+def _record(host, start, status, attempt):
+    elapsed = time.perf_counter() - start
+    elapsed_ms = elapsed * 1000
+    metrics.UPSTREAM_DURATION.observe(elapsed, host)
+    metrics.UPSTREAM_REQUESTS.inc(host, "error" if status is None else str(status))
+    with _lock:
+        t = _timings.get(host)
+        if t is None:
+            t = _timings[host] = {"calls": 0, "errors": 0, "retries": 0,
+                                  "total_ms": 0.0, "max_ms": 0.0, "statuses": {}}
+        t["calls"] += 1
+        t["retries"] += 1 if attempt else 0
+        t["total_ms"] += elapsed_ms
+        t["max_ms"] = max(t["max_ms"], elapsed_ms)
+        if status is None:
+            t["errors"] += 1
+        else:
+            t["statuses"][str(status)] = t["statuses"].get(str(status), 0) + 1
+
+
+def stats():
+    """Return per-host call counts and timings (time to response headers),
+    rate-limit queue depth, coalesced and rejected calls and circuit states
+    """
+    with _lock:
+        result = {
+            host: {
+                "calls": t["calls"],
+                "errors": t["errors"],
+                "retries": t["retries"],
+                "avg_ms": round(t["total_ms"] / t["calls"], 1),
+                "max_ms": round(t["max_ms"], 1),
+                "statuses": dict(t["statuses"]),
+            }
+            for host, t in _timings.items()
+        }
+        for host, g in _governor_stats.items():
+            result.setdefault(host, {}).update(g)
+        for (host, _), lane in _lanes.items():
+            entry = result.setdefault(host, {})
+            entry["queued"] = entry.get("queued", 0) + lane.queued
+            circuits = entry.setdefault("circuits", {"closed": 0, "open": 0, "half_open": 0})
+            circuits[lane.breaker.state] += 1
+        return result